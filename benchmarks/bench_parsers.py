@@ -0,0 +1,377 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Throughput and peak memory of each bot parser on saved HTML pages """
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               "fixtures")
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                              "baselines.json")
+BOT_MODULES = ["utils", "parsers", "models"]  # same names in many bots
+sys.path.insert(0, ROOT_FOLDER)
+
+
+def get_statistik_runner_parser():
+    from parsers import get_runner_details_as_dict
+
+    return lambda html: get_runner_details_as_dict(
+        html, url="http://statistik.d-u-v.org/getresultperson.php?runner=1"
+    )
+
+
+def get_statistik_race_parser():
+    from parsers import get_details_of_race_in_page
+
+    return lambda html: get_details_of_race_in_page(
+        html, url="http://statistik.d-u-v.org/getresultevent.php?event=1"
+    )[1]
+
+
+def get_london_parser():
+    from bots.london_marathon.models import AthletePerformance
+
+    def parse(html):
+        performance = AthletePerformance(
+            url="http://results-2017.virginmoneylondonmarathon.com/2017/"
+                "?content=detail&idp=1&search_event=MAS",
+            raw_html=html
+        )
+        performance.parse_details()
+        return performance.to_dict()
+
+    return parse
+
+
+def get_nyc_parser():
+    from bots.nyc_marathon.models import NYCMarathonParser
+
+    return lambda html: NYCMarathonParser(html).get_results()
+
+
+def get_letour_year_parser():
+    from bots.letour.parsers import get_list_of_stages
+
+    return get_list_of_stages
+
+
+def get_letour_stage_parser():
+    from bots.letour.parsers import get_standings_of_stage
+
+    return get_standings_of_stage
+
+
+def get_imdb_parser():
+    from bots.core.markup import parse_html
+    from bots.imdb.list_scrape import parse_list
+
+    return lambda html: parse_list(parse_html(html))
+
+
+def get_rottentomatoes_parser():
+    from bs4 import BeautifulSoup
+    from bots.rottentomatoes.engines import RottenTomatoes
+
+    engine = RottenTomatoes()
+    return lambda html: engine._get_results(
+        BeautifulSoup(html, "lxml"), "All"
+    )  # as RottenTomatoes.search does
+
+
+def get_paginegialle_parser():
+    from bots.ita_industries.pagine_mail_scraper import get_urls_in_page, \
+        get_next_pages
+
+    return lambda html: get_urls_in_page(html) + get_next_pages(html)
+
+
+BENCHMARKS = [
+    ("statistik-runner", "statistik-runner.html", get_statistik_runner_parser,
+     "statistik_ultramarathon"),
+    ("statistik-race", "statistik-race.html", get_statistik_race_parser,
+     "statistik_ultramarathon"),
+    ("london-performance", "london-performance.html", get_london_parser,
+     "london_marathon"),
+    ("nyc-results", "nyc-results.html", get_nyc_parser, "nyc_marathon"),
+    ("letour-year", "letour-year.html", get_letour_year_parser, "letour"),
+    ("letour-stage", "letour-stage.html", get_letour_stage_parser, "letour"),
+    ("imdb-list", "imdb-list.html", get_imdb_parser, "imdb"),
+    ("rottentomatoes-search", "rottentomatoes-search.html",
+     get_rottentomatoes_parser, "rottentomatoes"),
+    ("paginegialle-results", "paginegialle-results.html",
+     get_paginegialle_parser, "ita_industries")
+]  # name, fixture, function that returns parser of fixture, bot folder
+
+
+def load_parser(get_parser, bot_folder):
+    """
+    :param get_parser: callable
+        Function that returns parser
+    :param bot_folder: str
+        Folder (in bots/) of bot, put first in path as when bot runs
+    :return: callable
+        Parser, with its bot modules (utils, parsers ...) imported from
+        its own folder and not from the one of the previous bot
+    """
+
+    for module in BOT_MODULES:
+        sys.modules.pop(module, None)  # or next bot gets previous ones
+
+    bot_path = os.path.join(ROOT_FOLDER, "bots", bot_folder)
+    sys.path.insert(0, bot_path)
+    try:
+        return get_parser()
+    finally:
+        sys.path.remove(bot_path)
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="[-k <name>] [--backend bs4|lxml] [--seconds <s>] "
+              "[--tolerance <ratio>] [--save] [--record <name> <url>]"
+    )
+    parser.add_argument("-k", dest="names", action="append",
+                        help="run only benchmarks with this name")
+    parser.add_argument("--backend", dest="backend", default=None,
+                        help="markup backend of parsers (bs4 or lxml)")
+    parser.add_argument("--seconds", dest="seconds", type=float, default=1.0,
+                        help="min seconds each parser runs for")
+    parser.add_argument("--tolerance", dest="tolerance", type=float,
+                        default=0.25,
+                        help="slowdown (or memory growth) allowed w.r.t. "
+                             "baseline before failing")
+    parser.add_argument("--save", dest="save", action="store_true",
+                        help="store results as new baselines")
+    parser.add_argument("--record", dest="record", nargs=2,
+                        metavar=("NAME", "URL"),
+                        help="download page at url as fixture of benchmark")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return args.names, args.backend, float(args.seconds), \
+           float(args.tolerance), bool(args.save), args.record
+
+
+def get_fixture(file_name):
+    """
+    :param file_name: str
+        Name of fixture file
+    :return: str
+        Raw HTML page in fixture
+    """
+
+    with open(os.path.join(FIXTURES_FOLDER, file_name), "r",
+              encoding="utf-8") as i:
+        return i.read()
+
+
+def record_fixture(name, url):
+    """
+    :param name: str
+        Name of benchmark
+    :param url: str
+        Url of page to save as fixture of benchmark
+    :return: void
+        Downloads page and saves it over fixture of benchmark (the only time
+        this script goes online)
+    """
+
+    from bots.core.cache import get_html_source
+
+    file_name = [b[1] for b in BENCHMARKS if b[0] == name][0]
+    body = get_html_source(url)
+    with open(os.path.join(FIXTURES_FOLDER, file_name), "w",
+              encoding="utf-8") as o:
+        o.write(str(body))
+    print("Recorded", url, "in", file_name)
+
+
+def time_parser(parse, html, min_seconds, min_runs=5):
+    """
+    :param parse: function(str)
+        Parser
+    :param html: str
+        Page to parse
+    :param min_seconds: float
+        Min seconds to keep parsing for
+    :param min_runs: int
+        Min number of times to parse page
+    :return: {}
+        Pages/sec, MB/sec and peak KB allocated by Python objects while
+        parsing page once (memory of C parsers is not seen)
+    """
+
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    runs = 0
+    start_time = time.perf_counter()
+    while runs < min_runs or time.perf_counter() - start_time < min_seconds:
+        parse(html)
+        runs += 1
+    elapsed = time.perf_counter() - start_time
+
+    pages_per_sec = runs / elapsed
+    return {
+        "pages_per_sec": round(pages_per_sec, 2),
+        "mb_per_sec": round(
+            pages_per_sec * len(html.encode("utf-8")) / 1024 ** 2, 3
+        ),
+        "peak_kb": round(peak / 1024, 1)
+    }
+
+
+def get_regressions(result, baseline, tolerance):
+    """
+    :param result: {}
+        Measures of benchmark
+    :param baseline: {}
+        Measures of benchmark stored as baseline
+    :param tolerance: float
+        Relative slowdown (or memory growth) allowed
+    :return: [] of str
+        Descriptions of measures worse than baseline
+    """
+
+    regressions = []
+    if result["pages_per_sec"] < baseline["pages_per_sec"] * (1 - tolerance):
+        regressions.append(
+            "pages/sec " + str(result["pages_per_sec"]) + " < baseline " +
+            str(baseline["pages_per_sec"])
+        )
+    if result["peak_kb"] > baseline["peak_kb"] * (1 + tolerance):
+        regressions.append(
+            "peak KB " + str(result["peak_kb"]) + " > baseline " +
+            str(baseline["peak_kb"])
+        )
+    return regressions
+
+
+def run_benchmarks(names, backend, seconds, tolerance, save):
+    """
+    :param names: [] of str
+        Benchmarks to run (None for all)
+    :param backend: str
+        Markup backend of parsers (None for default)
+    :param seconds: float
+        Min seconds each parser runs for
+    :param tolerance: float
+        Relative slowdown (or memory growth) allowed
+    :param save: bool
+        True iff results should be stored as new baselines
+    :return: bool
+        True iff no parser got worse than its baseline (a parser with no
+        baseline, or with a baseline but that cannot be imported, fails,
+        unless baselines are being saved)
+    """
+
+    from bots.core import markup
+
+    if backend is not None:
+        markup.set_backend(backend)
+    baselines = {}
+    if os.path.exists(BASELINES_FILE):
+        with open(BASELINES_FILE, "r") as i:
+            baselines = json.load(i)
+
+    print("{:<24}{:>12}{:>10}{:>12}  {}".format(
+        "benchmark", "pages/sec", "MB/sec", "peak KB", "backend " +
+        markup.BACKEND
+    ))
+    failures = 0
+    for name, file_name, get_parser, bot_folder in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        key = name + "@" + markup.BACKEND
+        try:
+            parse = load_parser(get_parser, bot_folder)
+        except ImportError as e:
+            if key in baselines and not save:
+                print("{:<24}FAILED: cannot import parser: {}".format(
+                    name, str(e)))
+                failures += 1
+            else:
+                print("{:<24}skipped: {}".format(name, str(e)))
+            continue
+
+        html = get_fixture(file_name)
+        if not parse(html):
+            print("{:<24}FAILED: parser found nothing in {}".format(
+                name, file_name))
+            failures += 1
+            continue
+
+        result = time_parser(parse, html, seconds)
+        regressions = []
+        if key in baselines:
+            regressions = get_regressions(result, baselines[key], tolerance)
+        elif not save:
+            regressions = ["no baseline in " + BASELINES_FILE +
+                           " (run with --save)"]
+        if save:
+            baselines[key] = result
+
+        print("{:<24}{:>12}{:>10}{:>12}  {}".format(
+            name, result["pages_per_sec"], result["mb_per_sec"],
+            result["peak_kb"], "; ".join(regressions)
+        ))
+        if regressions and not save:
+            failures += 1
+
+    if save:
+        with open(BASELINES_FILE, "w") as o:
+            json.dump(baselines, o, indent=4, sort_keys=True)
+        print("Baselines saved to", BASELINES_FILE)
+
+    if failures > 0:
+        print("\t!!!\t" + str(failures) +
+              " parsers got worse (or have no baseline, or cannot be imported)")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    names, backend, seconds, tolerance, save, record = parse_args(
+        create_args())
+    if record is not None:
+        record_fixture(*record)
+    elif not run_benchmarks(names, backend, seconds, tolerance, save):
+        sys.exit(1)
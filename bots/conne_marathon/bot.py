@@ -22,7 +22,9 @@ import argparse
 import os
 
 from bs4 import BeautifulSoup
-from hal.internet.web import Webpage, download_pdf_to_file
+from hal.internet.web import download_pdf_to_file
+
+from bots.core.cache import get_html_source
 
 RESULTS_PAGE_URL = "http://www.connemarathon.com/results/"
 MIN_YEAR = 2002
@@ -102,8 +104,7 @@ def download_year_results(year, out_path):
         Saves data to file
     """
 
-    web_page = Webpage(RESULTS_PAGE_URL)
-    soup = BeautifulSoup(web_page.get_html_source(), "lxml")
+    soup = BeautifulSoup(get_html_source(RESULTS_PAGE_URL), "lxml")
     table = soup.find_all("table")[0]
     rows = table.find_all("tr")[1:]  # discard header
     rows.reverse()  # start from min year to present
@@ -0,0 +1,316 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Splits, paces and percentiles of marathon results, a column at a time """
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bots.core.durations import parse_durations
+
+MARATHON_KM = 42.195
+SPLITS_KM = {
+    "split_5K": 5.0,
+    "split_10K": 10.0,
+    "split_15K": 15.0,
+    "split_20K": 20.0,
+    "split_HALF": MARATHON_KM / 2,
+    "split_25K": 25.0,
+    "split_30K": 30.0,
+    "split_35K": 35.0,
+    "split_40K": 40.0,
+    "split_MARATHON": MARATHON_KM
+}  # column -> km of split (London and NYC results)
+FINISH_COLUMNS = ["net_time", "finish_time", "split_MARATHON"]  # preferred
+DURATION_COLUMNS = list(SPLITS_KM.keys()) + [
+    "gun_time", "net_time", "finish_time", "age_graded_time"
+]
+EVEN_SPLIT_TOLERANCE = 0.01  # halves within 1% of each other are even
+NEGATIVE = "negative"
+EVEN = "even"
+POSITIVE = "positive"
+PERCENTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def to_seconds(values):
+    """
+    :param values: pandas.Series
+        Durations as [h:]mm:ss strings (or timedeltas)
+    :return: pandas.Series
+        Seconds of durations as floats (NaN for DNF and other values)
+    """
+
+    values = pd.Series(values)
+    if pd.api.types.is_timedelta64_dtype(values):  # e.g from Parquet
+        return values.dt.total_seconds()
+    if pd.api.types.is_numeric_dtype(values):  # already seconds
+        return values.astype(np.float64)
+
+    codes, uniques = pd.factorize(values.astype(str))  # times repeat a lot
+    seconds = np.array(
+        [np.nan if s is None else s for s in parse_durations(uniques)],
+        dtype=np.float64
+    )  # each distinct time parsed once
+    return pd.Series(seconds[codes], index=values.index)
+
+
+def load_results(path):
+    """
+    :param path: str
+        Path to .csv, .parquet or .arrow file of results of a year
+    :return: pandas.DataFrame
+        Results, with durations as seconds (NaN when not found)
+    """
+
+    extension = os.path.splitext(path)[-1].lower()
+    if extension == ".parquet":
+        df = pd.read_parquet(path)
+    elif extension == ".arrow":
+        df = pd.read_feather(path)
+    else:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+
+    for column in DURATION_COLUMNS:
+        if column in df.columns:
+            df[column] = to_seconds(df[column])
+    return df
+
+
+def get_finish_column(df):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :return: str
+        Column with finish times
+    """
+
+    for column in FINISH_COLUMNS:
+        if column in df.columns:
+            return column
+    raise ValueError("No finish time in results")
+
+
+def get_split_columns(df):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :return: [] of str
+        Columns of splits in results, by distance, finish time last
+    """
+
+    finish = get_finish_column(df)
+    columns = [
+        c for c in sorted(SPLITS_KM, key=SPLITS_KM.get)
+        if c in df.columns and c != finish and SPLITS_KM[c] < MARATHON_KM
+    ]
+    return columns + [finish]
+
+
+def get_segment_paces(df):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :return: pandas.DataFrame
+        Seconds per km in each segment between splits (e.g "0-5K",
+        "5K-10K" ...), NaN when a split is missing
+    """
+
+    columns = get_split_columns(df)
+    km = np.array([SPLITS_KM.get(c, MARATHON_KM) for c in columns])
+    seconds = df[columns].to_numpy(dtype=np.float64)
+    starts = np.concatenate(([0.0], km[:-1]))
+    elapsed = np.diff(seconds, axis=1, prepend=0.0)
+    names = [
+        format_km(a) + "-" + format_km(b) for a, b in zip(starts, km)
+    ]
+    return pd.DataFrame(elapsed / (km - starts), columns=names,
+                        index=df.index)
+
+
+def format_km(km):
+    if km == 0:
+        return "0"
+    if km == MARATHON_KM:
+        return "MARATHON"
+    if km == MARATHON_KM / 2:
+        return "HALF"
+    return str(int(km)) + "K"
+
+
+def get_split_ratios(df):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :return: pandas.Series
+        Time of second half over time of first half (> 1 when runner
+        slowed down, NaN when half split or finish time is missing)
+    """
+
+    finish = df[get_finish_column(df)].to_numpy(dtype=np.float64)
+    half = df["split_HALF"].to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = (finish - half) / half
+    ratios[~np.isfinite(ratios)] = np.nan
+    return pd.Series(ratios, index=df.index)
+
+
+def get_split_types(df, tolerance=EVEN_SPLIT_TOLERANCE):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :param tolerance: float
+        Max relative difference between halves of even splits
+    :return: pandas.Series
+        NEGATIVE, EVEN or POSITIVE split of each result (None if unknown)
+    """
+
+    ratios = get_split_ratios(df).to_numpy()
+    types = np.select(
+        [ratios < 1 - tolerance, ratios > 1 + tolerance, np.isfinite(ratios)],
+        [NEGATIVE, POSITIVE, EVEN],
+        default=None
+    )
+    return pd.Series(types, index=df.index)
+
+
+def get_percentiles(df, column=None, by=None, percentiles=None):
+    """
+    :param df: pandas.DataFrame
+        Results
+    :param column: str
+        Column to get percentiles of (None for finish time)
+    :param by: str or [] of str
+        Columns to group results by, e.g "category" (None for all results)
+    :param percentiles: [] of float
+        Percentiles to get, in [0, 1]
+    :return: pandas.DataFrame
+        Number of results with a value and percentiles of each group
+    """
+
+    column = column or get_finish_column(df)
+    percentiles = percentiles or PERCENTILES
+    values = df[column]
+    if by is None:
+        table = values.quantile(percentiles).to_frame().T
+        table.insert(0, "count", values.count())
+        table.index = ["all"]
+    else:
+        groups = values.groupby([df[b] for b in np.atleast_1d(by)])
+        table = groups.quantile(percentiles).unstack()
+        table.insert(0, "count", groups.count())
+    table.columns = [
+        c if c == "count" else "p" + str(int(round(c * 100)))
+        for c in table.columns
+    ]
+    return table
+
+
+def add_age_groups(df, width=5, column="age"):
+    """
+    :param df: pandas.DataFrame
+        Results with ages (e.g NYC results)
+    :param width: int
+        Years in each age group
+    :param column: str
+        Column with ages
+    :return: pandas.DataFrame
+        Results with "age_group" column, e.g "35-39" (None if age unknown)
+    """
+
+    ages = pd.to_numeric(df[column], errors="coerce").to_numpy()
+    starts = np.floor(ages / width) * width
+    df["age_group"] = [
+        None if np.isnan(s) else str(int(s)) + "-" + str(int(s) + width - 1)
+        for s in starts
+    ]
+    return df
+
+
+def compare_years(years, column=None, by=None, percentiles=None):
+    """
+    :param years: {} of int -> pandas.DataFrame
+        Results of each year
+    :param column: str
+        Column to compare (None for finish time)
+    :param by: str
+        Column to group results by (None for all results)
+    :param percentiles: [] of float
+        Percentiles to compare
+    :return: pandas.DataFrame
+        Percentiles of each year (and group), with change of median w.r.t.
+        previous year
+    """
+
+    tables = []
+    for year in sorted(years):
+        table = get_percentiles(years[year], column=column, by=by,
+                                percentiles=percentiles)
+        table.insert(0, "year", year)
+        tables.append(table)
+    table = pd.concat(tables)
+    table.index.name = "group"
+    table = table.reset_index().set_index(["group", "year"]).sort_index()
+    if "p50" in table.columns:
+        table["p50_change"] = table.groupby(level="group")["p50"].diff()
+    return table
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="-f <path to results> [-f <path to results> ...] [-b <column>]"
+    )
+    parser.add_argument("-f", dest="paths", action="append", required=True,
+                        help="exported results of a year (more than one to "
+                             "compare years, e.g 2016.csv)")
+    parser.add_argument("-b", dest="by", default=None,
+                        help="column to group results by, e.g category")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return args.paths, args.by
+
+
+if __name__ == "__main__":
+    paths, by = parse_args(create_args())
+    results = {}
+    for i, p in enumerate(paths):
+        name = os.path.basename(p).split("_")[0].split(".")[0]
+        results[int(name) if name.isdigit() else i] = load_results(p)
+
+    for year, df in sorted(results.items()):
+        if by == "age_group" and "age" in df.columns:
+            add_age_groups(df)
+        print(year, "splits:", get_split_types(df).value_counts().to_dict())
+    print(compare_years(results, by=by).to_string())
@@ -0,0 +1,228 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Compressed on-disk cache of page bodies, keyed by normalized url """
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from hal.internet.web import Webpage
+
+CACHE_FOLDER = os.environ.get("SCRAPEBOTS_CACHE")  # None = no cache
+CACHE_TTL_SECONDS = None  # None = pages never expire
+CACHE_MAX_BYTES = 10 * 1024 ** 3  # 10 GB
+DEFAULT_CACHE = None  # shared by all callers (built on first use)
+DEFAULT_PORTS = {
+    "http": 80,
+    "https": 443
+}
+
+
+def normalize_url(url):
+    """
+    :param url: str
+        Url
+    :return: str
+        Same url, written in a single way (lowercase scheme and host, no
+        default port, sorted query, no fragment)
+    """
+
+    parts = urlsplit(str(url).strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host += ":" + str(parts.port)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class ResponseCache(object):
+    """ Gzipped page bodies on disk, with TTL and size-based eviction """
+
+    def __init__(self, folder, ttl=CACHE_TTL_SECONDS,
+                 max_bytes=CACHE_MAX_BYTES):
+        """
+        :param folder: str
+            Path to folder with cached pages
+        :param ttl: float
+            Seconds after which a cached page is stale (None = never)
+        :param max_bytes: int
+            Max size of cache: least recently used pages are evicted above
+        """
+
+        object.__init__(self)
+
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = None  # bytes on disk (computed on first write)
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def get_path(self, url):
+        """
+        :param url: str
+            Url of page
+        :return: str
+            Path to cached page
+        """
+
+        key = hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, key[:2], key[2:] + ".gz")
+
+    def get(self, url):
+        """
+        :param url: str
+            Url of page
+        :return: str
+            Cached body of page (None if missing or stale)
+        """
+
+        path = self.get_path(url)
+        try:
+            if self.ttl is not None and \
+                    time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+
+            with gzip.open(path, "rb") as i:
+                body = i.read().decode("utf-8")
+            os.utime(path, (time.time(), os.path.getmtime(path)))  # used now
+            return body
+        except (OSError, EOFError, UnicodeDecodeError):
+            return None
+
+    def put(self, url, body):
+        """
+        :param url: str
+            Url of page
+        :param body: str
+            Body of page
+        :return: void
+            Saves body of page (evicting old pages if cache is full)
+        """
+
+        path = self.get_path(url)
+        folder = os.path.dirname(path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = path + "." + str(os.getpid()) + "-" + str(
+            threading.get_ident()) + ".tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as o:
+            o.write(str(body).encode("utf-8"))
+        os.replace(tmp_path, path)  # readers never see half-written pages
+
+        if self.size is None:
+            self.size = self.get_size()
+        else:
+            self.size += os.path.getsize(path) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def get_files(self):
+        """
+        :return: [] of (str, os.stat_result)
+            Path and stats of each cached page
+        """
+
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith(".gz"):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((path, os.stat(path)))
+                    except OSError:
+                        pass  # evicted meanwhile
+        return files
+
+    def get_size(self):
+        """
+        :return: int
+            Bytes used by cached pages
+        """
+
+        return sum(s.st_size for _, s in self.get_files())
+
+    def evict(self, target_ratio=0.9):
+        """
+        :param target_ratio: float
+            Fraction of max size to shrink cache to
+        :return: void
+            Removes stale pages, then least recently used ones until cache
+            is small enough
+        """
+
+        now = time.time()
+        files = sorted(self.get_files(), key=lambda f: f[1].st_atime)
+        size = sum(s.st_size for _, s in files)
+        for path, stats in files:
+            is_stale = self.ttl is not None and now - stats.st_mtime > self.ttl
+            if not is_stale and size <= self.max_bytes * target_ratio:
+                continue
+
+            try:
+                os.remove(path)
+                size -= stats.st_size
+            except OSError:
+                pass
+        self.size = size
+
+
+def get_default_cache():
+    """
+    :return: ResponseCache
+        Cache in folder set by SCRAPEBOTS_CACHE env var (None if not set)
+    """
+
+    global DEFAULT_CACHE
+
+    if DEFAULT_CACHE is None and CACHE_FOLDER:
+        DEFAULT_CACHE = ResponseCache(CACHE_FOLDER)
+    return DEFAULT_CACHE
+
+
+def get_html_source(url, tor=False, cache=None):
+    """
+    :param url: str
+        Url of page
+    :param tor: bool
+        True iff page should be fetched through Tor
+    :param cache: ResponseCache
+        Cache to look page up in (None for the default one)
+    :return: str
+        Body of page: from cache if there, otherwise from the web
+    """
+
+    if cache is None:
+        cache = get_default_cache()
+    if cache is not None:
+        body = cache.get(url)
+        if body is not None:
+            return body
+
+    body = Webpage(url).get_html_source(tor=tor)
+    if cache is not None and body:
+        cache.put(url, body)
+    return body
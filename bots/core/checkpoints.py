@@ -0,0 +1,239 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Compact on-disk record of which ids of a crawl are done """
+
+import json
+import os
+import time
+import zlib
+
+COMPLETED = "completed"  # page parsed and saved
+EMPTY = "empty"  # page fetched, but nothing to save in it
+FAILED = "failed"  # page could not be fetched or saved (retried on resume)
+STATES = [COMPLETED, EMPTY, FAILED]
+
+
+class Checkpoint(object):
+    """ One bitmap of ids for each state, flushed to disk now and then """
+
+    def __init__(self, path, min_id, max_id, flush_every=1000,
+                 flush_seconds=30.0):
+        """
+        :param path: str
+            Path to checkpoint file
+        :param min_id: int
+            Min id of crawl
+        :param max_id: int
+            Max id of crawl (included)
+        :param flush_every: int
+            Max number of marks between 2 flushes to disk
+        :param flush_seconds: float
+            Max seconds between 2 flushes to disk
+        """
+
+        object.__init__(self)
+
+        assert max_id >= min_id
+
+        self.path = path
+        self.min_id = min_id
+        self.max_id = max_id
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+
+        size = (max_id - min_id) // 8 + 1  # bytes of each bitmap
+        self.bitmaps = {state: bytearray(size) for state in STATES}
+        self.marks_since_flush = 0
+        self.last_flush = time.time()
+
+    def get_position(self, i):
+        """
+        :param i: int
+            Id
+        :return: int, int
+            Byte of bitmap with id and mask of id in that byte
+        """
+
+        offset = int(i) - self.min_id
+        if offset < 0 or int(i) > self.max_id:
+            raise ValueError("Id " + str(i) + " is not in [" +
+                             str(self.min_id) + ", " + str(self.max_id) + "]")
+        return offset >> 3, 1 << (offset & 7)
+
+    def get_state(self, i):
+        """
+        :param i: int
+            Id
+        :return: str
+            State of id (None if not seen yet)
+        """
+
+        byte, mask = self.get_position(i)
+        for state in STATES:
+            if self.bitmaps[state][byte] & mask:
+                return state
+        return None
+
+    def is_done(self, i):
+        """
+        :param i: int
+            Id
+        :return: bool
+            True iff id does not need to be crawled again
+        """
+
+        return self.get_state(i) in (COMPLETED, EMPTY)
+
+    def mark(self, i, state):
+        """
+        :param i: int
+            Id
+        :param state: str
+            New state of id (one of STATES)
+        :return: void
+            Records state of id (flushing to disk if it is time to)
+        """
+
+        byte, mask = self.get_position(i)
+        for s in STATES:
+            if s == state:
+                self.bitmaps[s][byte] |= mask
+            else:
+                self.bitmaps[s][byte] &= ~mask & 0xFF
+
+        self.marks_since_flush += 1
+        if self.marks_since_flush >= self.flush_every or \
+                time.time() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def get_pending_ids(self):
+        """
+        :return: generator of int
+            Ids not done yet (never seen or failed), in order
+        """
+
+        done = bytes(
+            a | b for a, b in zip(self.bitmaps[COMPLETED], self.bitmaps[EMPTY])
+        )
+        for i in range(self.min_id, self.max_id + 1):
+            offset = i - self.min_id
+            if not done[offset >> 3] & (1 << (offset & 7)):
+                yield i
+
+    def count(self, state):
+        """
+        :param state: str
+            One of STATES
+        :return: int
+            Number of ids in state
+        """
+
+        return sum(bin(b).count("1") for b in self.bitmaps[state])
+
+    def flush(self):
+        """
+        :return: void
+            Saves checkpoint to disk (atomically)
+        """
+
+        header = {
+            "min_id": self.min_id,
+            "max_id": self.max_id,
+            "states": STATES
+        }
+        data = zlib.compress(
+            b"".join(bytes(self.bitmaps[state]) for state in STATES)
+        )  # runs of equal bits compress very well
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as o:
+            o.write(json.dumps(header).encode("utf-8") + b"\n")
+            o.write(data)
+        os.replace(tmp_path, self.path)  # never leave half-written file
+
+        self.marks_since_flush = 0
+        self.last_flush = time.time()
+
+    def set_range(self, min_id, max_id):
+        """
+        :param min_id: int
+            New min id of crawl
+        :param max_id: int
+            New max id of crawl (included)
+        :return: void
+            Moves bitmaps to new range, keeping state of ids in both ranges
+        """
+
+        assert max_id >= min_id
+
+        size = (max_id - min_id) // 8 + 1
+        bitmaps = {state: bytearray(size) for state in STATES}
+        for state, bitmap in self.bitmaps.items():
+            for byte, bits in enumerate(bitmap):
+                if not bits:  # most bytes are empty (or full) runs
+                    continue
+
+                for bit in range(8):
+                    i = self.min_id + (byte << 3) + bit
+                    if bits & (1 << bit) and min_id <= i <= max_id:
+                        offset = i - min_id
+                        bitmaps[state][offset >> 3] |= 1 << (offset & 7)
+
+        self.min_id = min_id
+        self.max_id = max_id
+        self.bitmaps = bitmaps
+
+    def load(self):
+        """
+        :return: bool
+            True iff a checkpoint was found on disk and loaded. Ids are
+            absolute: if it is of another range of ids, range becomes the
+            union of both, so ids done in either one stay done
+        """
+
+        if not os.path.exists(self.path):
+            return False
+
+        with open(self.path, "rb") as i:
+            header = json.loads(i.readline().decode("utf-8"))
+            data = zlib.decompress(i.read())
+
+        requested = (self.min_id, self.max_id)
+        self.min_id = header["min_id"]
+        self.max_id = header["max_id"]
+        size = (self.max_id - self.min_id) // 8 + 1
+        self.bitmaps = {state: bytearray(size) for state in STATES}
+        for k, state in enumerate(header["states"]):
+            self.bitmaps[state] = bytearray(data[k * size: (k + 1) * size])
+
+        min_id = min(self.min_id, requested[0])
+        max_id = max(self.max_id, requested[1])
+        if (min_id, max_id) != (self.min_id, self.max_id):
+            print("Checkpoint", self.path, "is of ids in [" +
+                  str(self.min_id) + ", " + str(self.max_id) +
+                  "]: now of ids in [" + str(min_id) + ", " + str(max_id) +
+                  "]")
+            self.set_range(min_id, max_id)
+        return True
+
+    def print_summary(self):
+        print(
+            "Checkpoint", self.path + ":",
+            ", ".join(str(self.count(s)) + " " + s for s in STATES)
+        )  # debug info
@@ -0,0 +1,155 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Per-host concurrency limits that adapt to how each host responds """
+
+import asyncio
+import collections
+import time
+from urllib.parse import urlparse
+
+OVERLOAD_STATUSES = (429, 503)  # host asks us to slow down
+
+
+class AdaptiveLimit(object):
+    """ Concurrency limit with additive increase, multiplicative decrease """
+
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=1000,
+                 backoff_ratio=0.5, max_latency=10.0):
+        """
+        :param initial_limit: int
+            Max number of requests in flight at start
+        :param min_limit: int
+            Limit never goes below this
+        :param max_limit: int
+            Limit never goes above this
+        :param backoff_ratio: float
+            Limit is multiplied by this when host is overloaded
+        :param max_latency: float
+            Seconds above which a response is too slow to raise the limit
+        """
+
+        object.__init__(self)
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.max_latency = max_latency
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0  # requests in flight
+        self.waiters = collections.deque()  # requests waiting for a slot
+        self.last_decrease = 0.0  # time of last cut of the limit
+
+    def get_limit(self):
+        """
+        :return: int
+            Current max number of requests in flight
+        """
+
+        return int(self.limit)
+
+    def wake_up_waiters(self):
+        free_slots = self.get_limit() - self.in_flight
+        while free_slots > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    async def acquire(self):
+        """
+        :return: float
+            Waits for a free slot, takes it and returns when it was taken
+        """
+
+        while self.in_flight >= self.get_limit():
+            waiter = asyncio.get_event_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self.wake_up_waiters()  # woken up: pass slot on
+                raise
+
+        self.in_flight += 1
+        return time.time()
+
+    def release(self, started_at, overloaded, healthy):
+        """
+        :param started_at: float
+            Time the slot was taken (as returned by acquire)
+        :param overloaded: bool
+            True iff the host timed out or asked us to slow down
+        :param healthy: bool
+            True iff the host answered correctly
+        :return: void
+            Frees slot and updates limit
+        """
+
+        self.in_flight -= 1
+        now = time.time()
+        if overloaded:
+            if started_at >= self.last_decrease:  # cut once per round
+                self.limit = max(self.min_limit,
+                                 self.limit * self.backoff_ratio)
+                self.last_decrease = now
+        elif healthy and now - started_at <= self.max_latency:
+            self.limit = min(self.max_limit,
+                             self.limit + 1.0 / self.limit)  # +1 per round
+        self.wake_up_waiters()
+
+
+class AdaptiveConcurrency(object):
+    """ One adaptive limit for each host """
+
+    def __init__(self, **limit_kwargs):
+        """
+        :param limit_kwargs: {}
+            Arguments of the AdaptiveLimit of each host
+        """
+
+        object.__init__(self)
+
+        self.limit_kwargs = limit_kwargs
+        self.limits = {}  # host -> AdaptiveLimit
+
+    def get_limit_of(self, url):
+        """
+        :param url: str
+            Url to fetch
+        :return: AdaptiveLimit
+            Limit of host of url
+        """
+
+        host = urlparse(url).netloc
+        if host not in self.limits:
+            self.limits[host] = AdaptiveLimit(**self.limit_kwargs)
+        return self.limits[host]
+
+    def get_limits(self):
+        """
+        :return: {} of str -> int
+            Current limit of each host
+        """
+
+        return {
+            host: limit.get_limit() for host, limit in self.limits.items()
+        }
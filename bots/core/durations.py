@@ -0,0 +1,94 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Durations written as in race results, parsed with precompiled regexes """
+
+import re
+
+COLON_PATTERN = re.compile(
+    r"^(?:(\d+):)?(\d{1,2}):(\d{2})(?:\.(\d+))?(?:\s*h)?$"
+)  # [h:]mm:ss[.ms][ h], e.g 2:03:05, 59:59, 05:12:33 h
+UNITS_PATTERN = re.compile(
+    r"^(?:(\d+)\s*h)?\s*(?:(\d+)\s*')?\s*(?:(\d+)\s*\")?$"
+)  # [h]h [m]' [s]", e.g 83h 02' 15", 00' 35"
+
+
+def parse_duration(text):
+    """
+    :param text: str
+        Duration, e.g 2:03:05, 05:12:33 h, 83h 02' 15", + 00' 35" (gaps are
+        parsed as durations)
+    :return: int or float
+        Seconds of duration (None if text is not a duration)
+    """
+
+    text = str(text).strip().lstrip("+").strip()
+    if not text:
+        return None
+
+    if ":" in text:
+        match = COLON_PATTERN.match(text)
+        if match is None:
+            return None
+
+        hours, minutes, seconds, fraction = match.groups()
+        total = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+        if fraction:
+            return total + int(fraction) / 10 ** len(fraction)
+        return total
+
+    match = UNITS_PATTERN.match(text)
+    if match is None or not any(match.groups()):
+        return None
+
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + int(seconds or 0)
+
+
+def parse_durations(texts):
+    """
+    :param texts: [] of str
+        Durations of a column (any iterable)
+    :return: [] of int or float
+        Seconds of each duration (None where text is not a duration): each
+        distinct text is parsed once
+    """
+
+    parsed = {}
+    seconds = []
+    for text in texts:
+        if text not in parsed:
+            parsed[text] = parse_duration(text)
+        seconds.append(parsed[text])
+    return seconds
+
+
+def format_duration(seconds, hour_digits=2):
+    """
+    :param seconds: int or float
+        Seconds of duration
+    :param hour_digits: int
+        Min number of digits of hours (e.g 1 for H:MM:SS, as timedelta)
+    :return: str
+        Duration as HH:MM:SS (hours may be more than 24, e.g 83:02:15)
+    """
+
+    seconds = int(seconds)
+    return "{:0{}d}:{:02d}:{:02d}".format(
+        seconds // 3600, hour_digits, seconds % 3600 // 60, seconds % 60
+    )
@@ -0,0 +1,290 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Shared async HTTP client with pooled keep-alive connections """
+
+import asyncio
+import time
+
+import aiohttp
+from aiosocks.connector import ProxyConnector, ProxyClientRequest
+
+from bots.core.cache import get_default_cache
+from bots.core.concurrency import AdaptiveConcurrency, OVERLOAD_STATUSES
+from bots.core.proxies import ProxyPool
+from bots.core.retry import RetryPolicy
+from bots.core.scheduler import run_workers
+
+NOT_FOUND_STATUS = 404  # body is given back: callers find nothing in it
+
+
+def append_to_file(f, s):
+    """
+    :param f: str
+        Path to file to append stuff to
+    :param s: str
+        Stuff to append
+    :return: void
+        Appends stuff to file
+    """
+
+    try:
+        with open(f, "a") as o:
+            o.write(str(s))
+            o.write("\n")
+    except Exception as e:
+        print("Cannot append", str(s), "to", str(f))
+        print(str(e))
+
+
+class FetchEngine(object):
+    """ Fetches pages through long-lived pooled sessions (one per proxy) """
+
+    def __init__(self, proxies=None, cookies=None, encoding=None,
+                 max_connections=1000, max_connections_per_host=0,
+                 keepalive_timeout=60, timeout=60, retry=None,
+                 concurrency=None, cache=None, log_file=None):
+        """
+        :param proxies: ProxyPool or [] of str
+            SOCKS proxies to spread requests across (None for the ones in
+            TOR_PROXIES)
+        :param cookies: {}
+            Cookies to send with every request
+        :param encoding: str
+            Encoding of page bodies (None to let aiohttp guess)
+        :param max_connections: int
+            Max number of open connections in each pool
+        :param max_connections_per_host: int
+            Max number of open connections to the same host (0 = no limit)
+        :param keepalive_timeout: float
+            Seconds an idle connection is kept open for reuse
+        :param timeout: float
+            Seconds to wait for a single response
+        :param retry: RetryPolicy
+            When and how long to wait before trying a page again (None
+            for the default policy)
+        :param concurrency: AdaptiveConcurrency
+            Adapts max number of requests in flight to each host (None for
+            the default limits)
+        :param cache: ResponseCache
+            Cache of fetched pages (None for the one set by SCRAPEBOTS_CACHE
+            env var, if any)
+        :param log_file: str
+            Path to log file (None to disable logging)
+        """
+
+        object.__init__(self)
+
+        if not isinstance(proxies, ProxyPool):
+            proxies = ProxyPool(proxies)
+        self.proxies = proxies
+        self.cookies = cookies
+        self.encoding = encoding
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.retry = RetryPolicy() if retry is None else retry
+        if concurrency is None:
+            concurrency = AdaptiveConcurrency(max_limit=max_connections)
+        self.concurrency = concurrency
+        self.cache = get_default_cache() if cache is None else cache
+        self.log_file = log_file
+        self.sessions = {}  # proxy -> open session
+
+    def log(self, message):
+        """
+        :param message: str
+            Message to log
+        :return: void
+            Appends message to log file (if any)
+        """
+
+        if self.log_file is not None:
+            append_to_file(self.log_file, message)
+
+    def get_session(self, proxy):
+        """
+        :param proxy: str
+            Url of proxy the session routes requests through
+        :return: aiohttp.ClientSession
+            Open session bound to proxy (created on first use)
+        """
+
+        session = self.sessions.get(proxy)
+        if session is None or session.closed:
+            conn = ProxyConnector(
+                remote_resolve=True,
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout
+            )  # connections are reused across requests
+            session = aiohttp.ClientSession(
+                connector=conn,
+                request_class=ProxyClientRequest,
+                cookies=self.cookies
+            )
+            self.sessions[proxy] = session
+        return session
+
+    async def get(self, url, proxy):
+        """
+        :param url: str
+            Url to fetch
+        :param proxy: str
+            Url of proxy to route request through
+        :return: int, str
+            Status code and body of page
+        """
+
+        session = self.get_session(proxy)
+        async with session.get(url, proxy=proxy,
+                               timeout=self.timeout) as response:
+            body = await response.text(encoding=self.encoding)
+            return response.status, body
+
+    async def fetch(self, url):
+        """
+        :param url: str
+            Url to fetch
+        :return: str
+            Body of page with url (of error page if not found) or None if
+            it could not be fetched (e.g errors, 403)
+        """
+
+        loop = asyncio.get_event_loop()
+        if self.cache is not None:
+            body = await loop.run_in_executor(None, self.cache.get, url)
+            if body is not None:
+                return body
+
+        self.retry.budget.on_request()
+        attempt = 0
+        while True:
+            attempt += 1
+            limit = self.concurrency.get_limit_of(url)
+            started_at = await limit.acquire()
+            proxy = self.proxies.choose()
+            self.proxies.on_start(proxy)
+            overloaded, healthy, cancelled = False, False, False
+            try:
+                status, body = await self.get(url, proxy.url)
+                overloaded = status in OVERLOAD_STATUSES
+                healthy = status < 500 and not overloaded
+                if status == 200:
+                    if self.cache is not None:
+                        await loop.run_in_executor(None, self.cache.put, url,
+                                                   body)
+                    return body
+
+                if not self.retry.is_retryable_status(status):
+                    self.log(str(status) + " " + str(url))
+                    if status == NOT_FOUND_STATUS:
+                        return body  # page does not exist: nothing in it
+                    print("\t!!!\tGot", status, "fetching url", str(url))
+                    return None  # e.g 401, 403, 410: not a page of data
+
+                self.log(str(status) + " " + str(url) + " (attempt " +
+                         str(attempt) + ")")
+            except asyncio.CancelledError:
+                cancelled = True  # e.g speculative page not needed anymore
+                raise
+            except asyncio.TimeoutError:
+                overloaded = True
+                self.log("Timeout getting url " + str(url) + " (attempt " +
+                         str(attempt) + ")")
+            except Exception as e:
+                self.log("Cannot get url " + str(url) + " (attempt " +
+                         str(attempt) + ": " + str(e) + ")")
+            finally:
+                limit.release(started_at, overloaded, healthy)
+                if cancelled:
+                    self.proxies.on_cancel(proxy)
+                elif healthy:
+                    self.proxies.on_success(proxy, time.time() - started_at)
+                else:
+                    self.proxies.on_failure(proxy)
+
+            if not self.retry.can_retry(attempt):
+                break
+            await self.retry.wait(attempt)
+
+        print("\t!!!\tErrors fetching url", str(url))
+        return None
+
+    async def fetch_and_handle(self, url, callback):
+        """
+        :param url: str
+            Url to fetch
+        :param callback: function(str, str)
+            Called with url and body (None on failure) of page
+        :return: str, str
+            Url and body of page
+        """
+
+        body = await self.fetch(url)
+        if callback is not None:
+            result = callback(url, body)
+            if asyncio.iscoroutine(result):
+                await result  # e.g waiting for room in a queue
+        return url, body
+
+    async def fetch_many(self, urls, max_concurrent=1000, callback=None):
+        """
+        :param urls: iterable of str
+            Urls to fetch (e.g a generator): consumed lazily
+        :param max_concurrent: int
+            Max number of requests in flight
+        :param callback: function(str, str)
+            Called with url and body (None on failure) of each page; may
+            be a coroutine function
+        :return: [] of (str, str)
+            Url and body of each page (empty if a callback is given)
+        """
+
+        results = []
+
+        async def worker(url):
+            result = await self.fetch_and_handle(url, callback)
+            if callback is None:
+                results.append(result)
+
+        await run_workers(urls, worker, max_concurrent=max_concurrent)
+        return results
+
+    async def close(self):
+        """
+        :return: void
+            Closes all open sessions (and their pooled connections)
+        """
+
+        for session in self.sessions.values():
+            if not session.closed:
+                await session.close()
+        self.sessions = {}
+
+        for host, limit in self.concurrency.get_limits().items():
+            print("Concurrency limit of", host, "settled at", limit)
+            self.log("Concurrency limit of " + host + " settled at " +
+                     str(limit))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,194 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" HTML trees built by BeautifulSoup or (faster) by lxml, same lookups """
+
+import os
+
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+
+BACKENDS = ["bs4", "lxml"]
+BACKEND = os.environ.get("SCRAPEBOTS_PARSER", "bs4")  # backend in use
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")  # ignores meta charset
+XPATHS = {}  # (tag, attrs, first only) -> compiled XPath
+
+
+def set_backend(name):
+    """
+    :param name: str
+        One of BACKENDS
+    :return: void
+        Builds all next HTML trees with backend
+    """
+
+    global BACKEND
+
+    if name not in BACKENDS:
+        raise ValueError("Unknown parser backend " + str(name) +
+                         ": use one of " + ", ".join(BACKENDS))
+    BACKEND = name
+
+
+def get_literal(value):
+    """
+    :param value: str
+        Value to look for
+    :return: str
+        Value as XPath string literal (a concat() of literals if value has
+        both kinds of quotes: XPath 1.0 strings cannot escape them)
+    """
+
+    value = str(value)
+    if "'" not in value:
+        return "'" + value + "'"
+    if "\"" not in value:
+        return "\"" + value + "\""
+
+    parts = value.split("'")
+    literals = []
+    for i, part in enumerate(parts):
+        if i > 0:
+            literals.append("\"'\"")
+        if part:
+            literals.append("'" + part + "'")
+    return "concat(" + ", ".join(literals) + ")"
+
+
+def get_xpath(tag=None, attrs=None, first=False):
+    """
+    :param tag: str
+        Name of tags to find (None for any)
+    :param attrs: {}
+        Attributes that tags must have (class is matched as BeautifulSoup
+        does: any of its words, or the whole value if it has many words)
+    :param first: bool
+        True iff only the first tag is needed
+    :return: etree.XPath
+        Compiled lookup of descendants (compiled once, then reused)
+    """
+
+    attrs = attrs or {}
+    key = (tag, tuple(sorted(attrs.items())), first)
+    if key not in XPATHS:
+        conditions = ""
+        for name, value in sorted(attrs.items()):
+            if name == "class" and " " not in str(value):
+                conditions += "[contains(concat(' ', normalize-space(@class)," \
+                              " ' '), " + get_literal(" " + value + " ") + ")]"
+            else:
+                conditions += "[@" + name + "=" + get_literal(value) + "]"
+
+        path = "descendant::" + (tag or "*") + conditions
+        if first:
+            path = "(" + path + ")[1]"
+        XPATHS[key] = etree.XPath(path)
+    return XPATHS[key]
+
+
+class LxmlNode(object):
+    """ lxml element with the lookups of a BeautifulSoup tag """
+
+    def __init__(self, element):
+        object.__init__(self)
+
+        self.element = element
+
+    def find_all(self, tag=None, attrs=None):
+        """
+        :param tag: str
+            Name of tags to find (None for any)
+        :param attrs: {}
+            Attributes that tags must have
+        :return: [] of LxmlNode
+            Descendants matching, in document order
+        """
+
+        return [
+            LxmlNode(e) for e in get_xpath(tag, attrs)(self.element)
+        ]
+
+    def find(self, tag=None, attrs=None):
+        """
+        :param tag: str
+            Name of tag to find (None for any)
+        :param attrs: {}
+            Attributes that tag must have
+        :return: LxmlNode
+            First descendant matching (None if there is none)
+        """
+
+        elements = get_xpath(tag, attrs, first=True)(self.element)
+        if elements:
+            return LxmlNode(elements[0])
+        return None
+
+    @property
+    def text(self):
+        return self.element.text_content()
+
+    @property
+    def a(self):
+        return self.find("a")
+
+    def __getitem__(self, key):
+        return self.element.attrib[key]
+
+    def __str__(self):
+        return lxml.html.tostring(self.element, encoding="unicode",
+                                  with_tail=False)
+
+    def __eq__(self, other):
+        return isinstance(other, LxmlNode) and self.element is other.element
+
+    def __hash__(self):
+        return hash(self.element)
+
+
+def parse_html(raw_html, tables_only=False):
+    """
+    :param raw_html: str
+        Raw HTML page
+    :param tables_only: bool
+        True iff only tables of page will be read: all tables are kept, so
+        lookups of tables (and their indexes) give the same results, but
+        nothing else of page is built. Only BeautifulSoup trees are built
+        in part: lxml builds whole pages faster than it can read them a
+        piece at a time
+    :return: BeautifulSoup or LxmlNode
+        Tree of page, built by backend in use
+    """
+
+    if tables_only and BACKEND != "lxml":
+        return BeautifulSoup(
+            str(raw_html), "lxml", parse_only=SoupStrainer("table")
+        )  # all tables (classes are not split yet while parsing)
+
+    if BACKEND == "lxml":
+        try:
+            root = lxml.html.document_fromstring(
+                str(raw_html).encode("utf-8"), parser=HTML_PARSER
+            )
+        except etree.ParserError:  # empty page
+            root = None
+        if root is None:
+            root = lxml.html.Element("html")
+        return LxmlNode(root)
+
+    return BeautifulSoup(str(raw_html), "lxml")
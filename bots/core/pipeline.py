@@ -0,0 +1,230 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Streaming fetch -> parse -> sink pipeline over bounded queues """
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+END_OF_STREAM = None  # marks the end of the items in a queue
+
+
+def parse_batch(parse, pages):
+    """
+    :param parse: function(str, str)
+        Turns url and body of page into an item (None to discard it)
+    :param pages: [] of (str, str)
+        Url and body of each page
+    :return: [] of (str, item)
+        Url and item of each page (runs in a worker process)
+    """
+
+    items = []
+    for url, body in pages:
+        try:
+            item = parse(url, body)
+        except Exception as e:
+            print("\t!!!\tErrors parsing url", str(url), str(e))
+            item = None
+        items.append((url, item))
+    return items
+
+
+class Pipeline(object):
+    """ Fetches, parses and stores pages as they arrive """
+
+    def __init__(self, engine, parse, sink, max_concurrent=1000,
+                 queue_size=1000, on_failure=None, on_discard=None,
+                 parse_workers=0, chunk_size=64):
+        """
+        :param engine: FetchEngine
+            Engine to fetch pages with
+        :param parse: function(str, str)
+            Turns url and body of page into an item (None to discard it)
+        :param sink: function(item)
+            Stores item (may be a coroutine: it is awaited, so a slow sink
+            slows down the stages before it)
+        :param max_concurrent: int
+            Max number of requests in flight
+        :param queue_size: int
+            Max number of items waiting between 2 stages
+        :param on_failure: function(str)
+            Called with url of each page that cannot be fetched
+        :param on_discard: function(str)
+            Called with url of each page that cannot be parsed
+        :param parse_workers: int
+            Number of processes to parse pages in (0 = parse in event loop).
+            Parse function must then be picklable (defined at module level)
+            and should not change global state: it runs in another process
+        :param chunk_size: int
+            Max number of pages sent to a parse process at once
+        """
+
+        object.__init__(self)
+
+        self.engine = engine
+        self.parse = parse
+        self.sink = sink
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.on_failure = on_failure
+        self.on_discard = on_discard
+        self.parse_workers = parse_workers
+        self.chunk_size = max(1, int(chunk_size))
+
+        self.pages = None  # (url, body) waiting to be parsed
+        self.items = None  # items waiting to be stored
+        self.stats = {
+            "fetched": 0,
+            "failed": 0,
+            "parsed": 0,
+            "discarded": 0,
+            "stored": 0
+        }
+
+    async def put_page(self, url, body):
+        """
+        :param url: str
+            Url of page
+        :param body: str
+            Body of page with url or null
+        :return: void
+            Hands page to parse stage (waits while the stage is busy)
+        """
+
+        if body is None:
+            self.stats["failed"] += 1
+            if self.on_failure is not None:
+                self.on_failure(url)
+            return
+
+        self.stats["fetched"] += 1
+        await self.pages.put((url, body))
+
+    async def fetch_stage(self, urls):
+        await self.engine.fetch_many(urls, max_concurrent=self.max_concurrent,
+                                     callback=self.put_page)
+        await self.pages.put(END_OF_STREAM)
+
+    async def put_item(self, url, item):
+        """
+        :param url: str
+            Url of page
+        :param item: item
+            Item parsed from page (None if discarded)
+        :return: void
+            Hands item to sink stage (waits while the stage is busy)
+        """
+
+        if item is None:
+            self.stats["discarded"] += 1
+            if self.on_discard is not None:
+                self.on_discard(url)
+            return
+
+        self.stats["parsed"] += 1
+        await self.items.put(item)
+
+    async def parse_stage(self):
+        while True:
+            page = await self.pages.get()
+            if page is END_OF_STREAM:
+                break
+
+            for url, item in parse_batch(self.parse, [page]):
+                await self.put_item(url, item)
+
+        await self.items.put(END_OF_STREAM)
+
+    async def get_batch(self):
+        """
+        :return: [] of (str, str), bool
+            Pages ready to be parsed (at least one, at most chunk_size) and
+            True iff no more pages will come
+        """
+
+        batch = []
+        page = await self.pages.get()
+        while page is not END_OF_STREAM:
+            batch.append(page)
+            if len(batch) >= self.chunk_size or self.pages.empty():
+                return batch, False  # do not wait for a full chunk
+            page = self.pages.get_nowait()
+        return batch, True
+
+    async def submit_batches(self, executor, batches):
+        loop = asyncio.get_event_loop()
+        is_last = False
+        while not is_last:
+            batch, is_last = await self.get_batch()
+            if batch:
+                await batches.put(
+                    loop.run_in_executor(executor, parse_batch, self.parse,
+                                         batch)
+                )  # waits while all processes are busy
+        await batches.put(END_OF_STREAM)
+
+    async def collect_batches(self, batches):
+        while True:
+            future = await batches.get()
+            if future is END_OF_STREAM:
+                break
+
+            for url, item in await future:
+                await self.put_item(url, item)
+
+        await self.items.put(END_OF_STREAM)
+
+    async def parse_stage_in_processes(self):
+        batches = asyncio.Queue(
+            maxsize=self.parse_workers * 2
+        )  # batches being parsed (keeps every process busy)
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            await asyncio.gather(
+                self.submit_batches(executor, batches),
+                self.collect_batches(batches)
+            )
+
+    async def sink_stage(self):
+        while True:
+            item = await self.items.get()
+            if item is END_OF_STREAM:
+                break
+
+            result = self.sink(item)
+            if asyncio.iscoroutine(result):  # async sink
+                await result
+            self.stats["stored"] += 1
+
+    async def run(self, urls):
+        """
+        :param urls: iterable of str
+            Urls to fetch (e.g a generator): consumed lazily
+        :return: {}
+            Counters of fetched, failed, parsed, discarded and stored items
+        """
+
+        self.pages = asyncio.Queue(maxsize=self.queue_size)
+        self.items = asyncio.Queue(maxsize=self.queue_size)
+        await asyncio.gather(
+            self.fetch_stage(urls),
+            self.parse_stage_in_processes() if self.parse_workers > 0
+            else self.parse_stage(),
+            self.sink_stage()
+        )
+        return self.stats
@@ -0,0 +1,227 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Pool of SOCKS proxies (e.g Tor circuits) with health checks """
+
+import asyncio
+import os
+import random
+import time
+
+TOR_PROXY = "socks5://127.0.0.1:9150"  # local Tor SOCKS endpoint
+TOR_PROXIES = [
+    p.strip() for p in os.environ.get("TOR_PROXIES", TOR_PROXY).split(",")
+    if p.strip()
+]  # e.g "socks5://127.0.0.1:9050#9051,socks5://127.0.0.1:9052#9053"
+TOR_CONTROL_PASSWORD = os.environ.get("TOR_CONTROL_PASSWORD", "")
+
+
+class Proxy(object):
+    """ SOCKS endpoint and how well it has been doing lately """
+
+    def __init__(self, url, control_port=None, control_password=""):
+        """
+        :param url: str
+            Url of SOCKS endpoint, e.g socks5://127.0.0.1:9150
+        :param control_port: int
+            Port of Tor controller of endpoint (None if there is none)
+        :param control_password: str
+            Password of Tor controller
+        """
+
+        object.__init__(self)
+
+        self.url = url
+        self.control_port = control_port
+        self.control_password = control_password
+
+        self.in_flight = 0  # requests in flight
+        self.latency = None  # moving average of seconds per response
+        self.failures = 0  # consecutive failures
+        self.benched_until = 0.0  # out of rotation until this time
+
+    def is_available(self, now):
+        return now >= self.benched_until
+
+    def get_score(self):
+        """
+        :return: float
+            Expected wait of a new request (lower is better)
+        """
+
+        latency = 1.0 if self.latency is None else self.latency
+        return latency * (self.in_flight + 1)
+
+
+def get_proxy(spec, control_password=None):
+    """
+    :param spec: str
+        Url of SOCKS endpoint, optionally followed by "#" and port of its
+        Tor controller, e.g socks5://127.0.0.1:9050#9051
+    :param control_password: str
+        Password of Tor controller (None for TOR_CONTROL_PASSWORD)
+    :return: Proxy
+        Endpoint (with controller, if given)
+    """
+
+    if control_password is None:
+        control_password = TOR_CONTROL_PASSWORD
+
+    url, _, control_port = str(spec).strip().partition("#")
+    control_port = int(control_port) if control_port.strip() else None
+    return Proxy(url, control_port=control_port,
+                 control_password=control_password)
+
+
+class ProxyPool(object):
+    """ Spreads requests across SOCKS endpoints, benching bad ones """
+
+    def __init__(self, proxies=None, max_failures=3, max_latency=30.0,
+                 bench_seconds=60.0, smoothing=0.2):
+        """
+        :param proxies: [] of str or Proxy
+            SOCKS endpoints, e.g socks5://127.0.0.1:9050#9051 (with port of
+            Tor controller after "#"); None for the ones in TOR_PROXIES
+        :param max_failures: int
+            Consecutive failures after which an endpoint is benched
+        :param max_latency: float
+            Average seconds per response above which an endpoint is benched
+        :param bench_seconds: float
+            Seconds a benched endpoint stays out of rotation
+        :param smoothing: float
+            Weight of last response in the moving average of latency
+        """
+
+        object.__init__(self)
+
+        if proxies is None:
+            proxies = TOR_PROXIES
+        elif isinstance(proxies, str):
+            proxies = [proxies]
+        self.proxies = [
+            p if isinstance(p, Proxy) else get_proxy(p) for p in proxies
+        ]
+        assert len(self.proxies) > 0
+
+        self.max_failures = max_failures
+        self.max_latency = max_latency
+        self.bench_seconds = bench_seconds
+        self.smoothing = smoothing
+
+    def choose(self):
+        """
+        :return: Proxy
+            Endpoint to send next request through (the better of 2 random
+            available ones)
+        """
+
+        now = time.time()
+        available = [p for p in self.proxies if p.is_available(now)]
+        if not available:  # all benched: use the one coming back first
+            return min(self.proxies, key=lambda p: p.benched_until)
+
+        if len(available) == 1:
+            return available[0]
+
+        a, b = random.sample(available, 2)
+        return a if a.get_score() <= b.get_score() else b
+
+    def on_start(self, proxy):
+        proxy.in_flight += 1
+
+    def on_success(self, proxy, latency):
+        """
+        :param proxy: Proxy
+            Endpoint that got the response
+        :param latency: float
+            Seconds taken by the response
+        :return: void
+            Updates health of endpoint
+        """
+
+        proxy.in_flight -= 1
+        proxy.failures = 0
+        if proxy.latency is None:
+            proxy.latency = latency
+        else:
+            proxy.latency += self.smoothing * (latency - proxy.latency)
+
+        if proxy.latency > self.max_latency:
+            self.bench(proxy)
+
+    def on_failure(self, proxy):
+        """
+        :param proxy: Proxy
+            Endpoint that failed to get a response
+        :return: void
+            Updates health of endpoint
+        """
+
+        proxy.in_flight -= 1
+        proxy.failures += 1
+        if proxy.failures >= self.max_failures:
+            self.bench(proxy)
+
+    def on_cancel(self, proxy):
+        proxy.in_flight -= 1  # request no longer needed: not a failure
+
+    def bench(self, proxy):
+        """
+        :param proxy: Proxy
+            Slow or failing endpoint
+        :return: void
+            Takes endpoint out of rotation for a while and asks for a new
+            circuit (if endpoint has a controller)
+        """
+
+        if not proxy.is_available(time.time()):
+            return  # already benched
+
+        print("\t!!!\tProxy", proxy.url, "out of rotation for",
+              self.bench_seconds, "seconds")
+        proxy.benched_until = time.time() + self.bench_seconds
+        proxy.failures = 0
+        proxy.latency = None  # start afresh when back
+        if proxy.control_port is not None:
+            asyncio.ensure_future(self.renew_circuit(proxy))
+
+    @staticmethod
+    async def renew_circuit(proxy):
+        """
+        :param proxy: Proxy
+            Endpoint with Tor controller
+        :return: bool
+            True iff Tor accepted to switch to new circuits
+        """
+
+        host = proxy.url.split("://")[-1].split(":")[0]
+        try:
+            reader, writer = await asyncio.open_connection(
+                host, proxy.control_port
+            )
+            writer.write(
+                ("AUTHENTICATE \"" + proxy.control_password + "\"\r\n"
+                 "SIGNAL NEWNYM\r\n"
+                 "QUIT\r\n").encode()
+            )
+            replies = await reader.read()
+            writer.close()
+            return replies.count(b"250") >= 2  # authenticated and renewed
+        except Exception as e:
+            print("\t!!!\tCannot renew circuit of", proxy.url, str(e))
+            return False
@@ -0,0 +1,117 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Input files of urls read lazily, one line at a time """
+
+import csv
+import os
+
+URL_PREFIXES = ("http://", "https://")
+
+
+def is_url(value):
+    """
+    :param value: str
+        Value of a cell or line
+    :return: bool
+        True iff value is an url
+    """
+
+    return str(value).strip().lower().startswith(URL_PREFIXES)
+
+
+def iter_urls_in_csv(path, column=None):
+    """
+    :param path: str
+        Path to .csv file
+    :param column: str or int
+        Header (or index) of column with urls (None for all cells that are
+        urls, row by row: e.g a column for each year)
+    :return: generator of str
+        Urls in file
+    """
+
+    with open(path, "r", newline="") as i:
+        reader = csv.reader(i, delimiter=",", quotechar="\"")
+        index = column
+        if column is not None and not isinstance(column, int):
+            index = next(reader).index(str(column))
+
+        for row in reader:
+            cells = row if index is None else row[index:index + 1]
+            for cell in cells:
+                if is_url(cell):
+                    yield cell.strip()
+
+
+def iter_urls_in_text(path):
+    """
+    :param path: str
+        Path to plain-text file
+    :return: generator of str
+        Urls in file (one per line)
+    """
+
+    with open(path, "r") as i:
+        for line in i:
+            if is_url(line):
+                yield line.strip()
+
+
+def iter_urls(path, column=None, dedupe=False):
+    """
+    :param path: str
+        Path to .csv file or plain-text file with one url per line
+    :param column: str or int
+        Header (or index) of column with urls in .csv files (None for all
+        cells that are urls)
+    :param dedupe: bool
+        True iff urls already seen are skipped (they are kept in memory)
+    :return: generator of str
+        Urls in file, as they are read
+    """
+
+    if os.path.splitext(path)[-1].lower() == ".csv":
+        urls = iter_urls_in_csv(path, column=column)
+    else:
+        urls = iter_urls_in_text(path)
+
+    seen = set()
+    for url in urls:
+        if dedupe:
+            if url in seen:
+                continue
+            seen.add(url)
+        yield url
+
+
+def count_urls(path, column=None, dedupe=False):
+    """
+    :param path: str
+        Path to input file
+    :param column: str or int
+        Header (or index) of column with urls in .csv files
+    :param dedupe: bool
+        True iff urls already seen are not counted (they are kept in memory
+        while counting, as iter_urls does)
+    :return: int
+        Number of urls in file (read once more: urls are kept only to
+        dedupe them)
+    """
+
+    return sum(1 for _ in iter_urls(path, column=column, dedupe=dedupe))
@@ -0,0 +1,108 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Results of a race kept column by column instead of as many dicts """
+
+MAX_SHARED_VALUES = 4096  # columns with more distinct values are not shared
+
+
+class ResultsTable(object):
+    """ One list per column; equal values of a column (e.g nationality,
+    category, DNF) are stored once and shared by all rows """
+
+    def __init__(self, columns=None):
+        """
+        :param columns: [] of str
+            Names of columns (None to take them from first row)
+        """
+
+        object.__init__(self)
+
+        self.columns = {}  # name -> values of rows
+        self.values = {}  # name -> {value: value}, to share equal values
+        # (None once column has too many distinct values, e.g urls)
+        self.size = 0
+        for name in columns or []:
+            self.add_column(name)
+
+    def add_column(self, name):
+        self.columns[name] = [None] * self.size  # missing in previous rows
+        self.values[name] = {}
+
+    def append(self, row):
+        """
+        :param row: {} or obj with to_dict()
+            Result
+        :return: void
+            Adds result to table (its values, not the object)
+        """
+
+        if not isinstance(row, dict):
+            row = row.to_dict()
+
+        for name in row:
+            if name not in self.columns:
+                self.add_column(name)
+        for name, column in self.columns.items():
+            value = row.get(name)
+            shared = self.values[name]
+            if shared is not None:
+                value = shared.setdefault(value, value)
+                if len(shared) > MAX_SHARED_VALUES:
+                    self.values[name] = None  # sharing costs more than saves
+            column.append(value)
+        self.size += 1
+
+    def extend(self, rows):
+        """
+        :param rows: [] of {} or of obj with to_dict()
+            Results (any iterable)
+        :return: void
+            Adds results to table
+        """
+
+        for row in rows:
+            self.append(row)
+
+    def get_column(self, name):
+        """
+        :param name: str
+            Name of column
+        :return: [] of obj
+            Values of column, one per row
+        """
+
+        return self.columns[name]
+
+    def get_row(self, i):
+        """
+        :param i: int
+            Index of row
+        :return: {}
+            Result in row
+        """
+
+        return {name: column[i] for name, column in self.columns.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        names = list(self.columns.keys())
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
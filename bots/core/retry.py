@@ -0,0 +1,147 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Non-blocking retries with exponential backoff and a global budget """
+
+import asyncio
+import random
+
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)  # worth another attempt
+
+
+class RetryBudget(object):
+    """ Caps retries to a fraction of the requests made so far """
+
+    def __init__(self, ratio=0.1, min_retries=10, max_saved_retries=100,
+                 max_retries=None):
+        """
+        :param ratio: float
+            Retries allowed for each request made
+        :param min_retries: int
+            Retries allowed before any request is made
+        :param max_saved_retries: int
+            Max number of retries that can be saved up for later
+        :param max_retries: int
+            Max number of retries overall (None = no limit)
+        """
+
+        object.__init__(self)
+
+        self.ratio = ratio
+        self.max_saved_retries = max(max_saved_retries, min_retries)
+        self.max_retries = max_retries
+        self.tokens = float(min_retries)  # retries that can be made now
+        self.retries = 0  # retries made so far
+
+    def on_request(self):
+        """
+        :return: void
+            Earns part of a retry
+        """
+
+        self.tokens = min(self.tokens + self.ratio, self.max_saved_retries)
+
+    def withdraw(self):
+        """
+        :return: bool
+            True iff a retry can be made (and spends it)
+        """
+
+        if self.max_retries is not None and self.retries >= self.max_retries:
+            return False
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        self.retries += 1
+        return True
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before trying a request again """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30,
+                 jitter=True, retry_statuses=RETRY_STATUSES, budget=None):
+        """
+        :param max_attempts: int
+            Max number of attempts to get page
+        :param base_delay: float
+            Seconds to wait before the first retry (doubles at each retry)
+        :param max_delay: float
+            Max seconds to wait between 2 consecutive attempts
+        :param jitter: bool
+            True iff delays are randomized (so failed requests do not all
+            come back at the same time)
+        :param retry_statuses: tuple of int
+            Status codes worth another attempt
+        :param budget: RetryBudget
+            Budget shared by all requests (None = a new default budget)
+        """
+
+        object.__init__(self)
+
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+        self.budget = RetryBudget() if budget is None else budget
+
+    def is_retryable_status(self, status):
+        """
+        :param status: int
+            Status code of response
+        :return: bool
+            True iff request should be tried again
+        """
+
+        return status in self.retry_statuses
+
+    def get_delay(self, attempt):
+        """
+        :param attempt: int
+            Number of attempts made so far (>= 1)
+        :return: float
+            Seconds to wait before next attempt
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            return random.uniform(0, delay)  # "full jitter"
+        return delay
+
+    def can_retry(self, attempt):
+        """
+        :param attempt: int
+            Number of attempts made so far
+        :return: bool
+            True iff another attempt is allowed (and spends budget for it)
+        """
+
+        return attempt < self.max_attempts and self.budget.withdraw()
+
+    async def wait(self, attempt):
+        """
+        :param attempt: int
+            Number of attempts made so far
+        :return: void
+            Waits before next attempt without blocking the event loop
+        """
+
+        await asyncio.sleep(self.get_delay(attempt))
@@ -0,0 +1,60 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Fixed-size pool of worker coroutines over a lazy stream of jobs """
+
+import asyncio
+
+
+async def work_on(jobs, worker):
+    """
+    :param jobs: iterator
+        Jobs shared among all workers
+    :param worker: coroutine function(job)
+        Does a single job
+    :return: void
+        Does jobs until there are no more left
+    """
+
+    for job in jobs:  # next() never yields to the event loop, so it is safe
+        await worker(job)
+
+
+async def run_workers(jobs, worker, max_concurrent=1000):
+    """
+    :param jobs: iterable
+        Jobs to do (e.g a generator of urls): consumed lazily
+    :param worker: coroutine function(job)
+        Does a single job
+    :param max_concurrent: int
+        Number of workers (i.e max number of jobs in progress)
+    :return: void
+        Does all jobs with a fixed number of tasks, whatever the number of
+        jobs
+    """
+
+    jobs = iter(jobs)
+    workers = [
+        asyncio.ensure_future(work_on(jobs, worker))
+        for _ in range(max(1, int(max_concurrent)))
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()  # no-op for finished workers
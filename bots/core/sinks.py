@@ -0,0 +1,384 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Sinks that write documents to MongoDB in batches """
+
+import asyncio
+import time
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000  # code of MongoDB error
+INSERTED = "inserted"  # document written
+REPLACED = "replaced"  # document written over one with same upsert key
+DUPLICATE = "duplicate"  # document already in collection
+REJECTED = "rejected"  # document could not be written
+
+
+def get_requests(docs, upsert_key):
+    """
+    :param docs: [] of {}
+        Documents to write
+    :param upsert_key: str
+        Key of documents to replace documents with
+    :return: [] of ReplaceOne
+        Upserts of documents
+    """
+
+    return [
+        ReplaceOne({upsert_key: d[upsert_key]}, d, upsert=True) for d in docs
+    ]
+
+
+def get_written_outcomes(size, upserted=None):
+    """
+    :param size: int
+        Number of documents in batch
+    :param upserted: [] of int
+        Indexes of documents inserted by upserts, the other ones replaced a
+        document (None if documents were only inserted)
+    :return: [] of str
+        Outcome of each document
+    """
+
+    if upserted is None:
+        return [INSERTED] * size
+
+    outcomes = [REPLACED] * size
+    for i in upserted:
+        outcomes[i] = INSERTED
+    return outcomes
+
+
+def get_outcomes(error, size, collection, upsert=False):
+    """
+    :param error: BulkWriteError
+        Errors of unordered write of batch
+    :param size: int
+        Number of documents in batch
+    :param collection: str
+        Name of collection
+    :param upsert: bool
+        True iff batch was written by upserts
+    :return: [] of str
+        Outcome of each document
+    """
+
+    upserted = None
+    if upsert:
+        upserted = [u["index"] for u in error.details.get("upserted", [])]
+    outcomes = get_written_outcomes(size, upserted)
+    for e in error.details["writeErrors"]:
+        if e["code"] == DUPLICATE_KEY_ERROR:
+            outcomes[e["index"]] = DUPLICATE
+        else:
+            outcomes[e["index"]] = REJECTED
+            print("\t!!!\tCannot write to", collection, e["errmsg"])
+    return outcomes
+
+
+class MongoSink(object):
+    """ Buffers documents of each collection, then writes them in bulk """
+
+    def __init__(self, db, batch_size=1000, flush_seconds=5.0,
+                 upsert_key=None, on_written=None, indexes=None):
+        """
+        :param db: pymongo.database.Database
+            Database to write to
+        :param batch_size: int
+            Max number of documents of a collection waiting to be written
+        :param flush_seconds: float
+            Max seconds between 2 writes of all waiting documents
+        :param upsert_key: str
+            Key of documents to replace documents with (None = documents are
+            only inserted, and the ones already in collection are duplicates)
+        :param on_written: function({}, str)
+            Called with each document and its outcome (INSERTED, REPLACED,
+            DUPLICATE or REJECTED) once it has been written
+        :param indexes: [] of pymongo.IndexModel
+            Indexes to create in each collection before first write to it
+            (also in collections that do not exist yet)
+        """
+
+        object.__init__(self)
+
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.upsert_key = upsert_key
+        self.on_written = on_written
+        self.indexes = indexes
+
+        self.buffers = {}  # collection -> documents waiting to be written
+        self.last_flush = time.time()
+        self.indexed = set()  # collections whose indexes are created
+        self.stats = {
+            INSERTED: 0,
+            REPLACED: 0,
+            DUPLICATE: 0,
+            REJECTED: 0,
+            "batches": 0
+        }
+
+    def put(self, doc, collection):
+        """
+        :param doc: {}
+            Document to write
+        :param collection: str
+            Name of collection to write document to
+        :return: void
+            Adds document to batch of collection (writing batches when full
+            or when it is time to)
+        """
+
+        buffer = self.buffers.setdefault(str(collection), [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.write(str(collection))
+        if time.time() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def create_indexes(self, collection):
+        """
+        :param collection: str
+            Name of collection
+        :return: void
+            Creates indexes in collection (once)
+        """
+
+        if self.indexes and collection not in self.indexed:
+            self.indexed.add(collection)
+            try:
+                self.db[collection].create_indexes(self.indexes)
+            except Exception as e:  # e.g duplicates of unique key
+                print("\t!!!\tCannot create indexes of", collection, str(e))
+
+    def write_batch(self, collection, docs):
+        """
+        :param collection: str
+            Name of collection
+        :param docs: [] of {}
+            Documents to write
+        :return: [] of str
+            Outcome of each document
+        """
+
+        try:
+            if self.upsert_key is None:
+                self.db[collection].insert_many(docs, ordered=False)
+                return get_written_outcomes(len(docs))
+
+            result = self.db[collection].bulk_write(
+                get_requests(docs, self.upsert_key), ordered=False
+            )
+            return get_written_outcomes(len(docs), result.upserted_ids)
+        except BulkWriteError as e:
+            return get_outcomes(e, len(docs), collection,
+                                upsert=self.upsert_key is not None)
+        except Exception as e:  # e.g connection lost: nothing is known
+            print("\t!!!\tCannot write batch to", collection, str(e))
+            return [REJECTED] * len(docs)
+
+    def on_batch_written(self, docs, outcomes):
+        """
+        :param docs: [] of {}
+            Documents written
+        :param outcomes: [] of str
+            Outcome of each document
+        :return: void
+            Counts outcomes and reports them
+        """
+
+        self.stats["batches"] += 1
+        for doc, outcome in zip(docs, outcomes):
+            self.stats[outcome] += 1
+            if self.on_written is not None:
+                self.on_written(doc, outcome)
+
+    def write(self, collection):
+        """
+        :param collection: str
+            Name of collection
+        :return: void
+            Writes documents waiting for collection
+        """
+
+        docs = self.buffers.pop(collection, [])
+        if not docs:
+            return
+
+        self.create_indexes(collection)
+        self.on_batch_written(docs, self.write_batch(collection, docs))
+
+    def flush(self):
+        """
+        :return: void
+            Writes all documents waiting
+        """
+
+        for collection in list(self.buffers.keys()):
+            self.write(collection)
+        self.last_flush = time.time()
+
+    def print_summary(self):
+        print(
+            "Written", self.stats[INSERTED] + self.stats[REPLACED],
+            "documents (" + str(self.stats[REPLACED]), "replaced) in",
+            self.stats["batches"], "batches,", self.stats[DUPLICATE],
+            "duplicates,", self.stats[REJECTED], "rejected"
+        )  # debug info
+
+
+class AsyncMongoSink(MongoSink):
+    """ MongoSink that writes from inside the event loop (through motor) """
+
+    def __init__(self, db, batch_size=1000, flush_seconds=5.0,
+                 upsert_key=None, on_written=None, indexes=None,
+                 max_pending=4):
+        """
+        :param db: motor.motor_asyncio.AsyncIOMotorDatabase
+            Database to write to
+        :param batch_size: int
+            Max number of documents of a collection waiting to be written
+        :param flush_seconds: float
+            Max seconds between 2 writes of all waiting documents
+        :param upsert_key: str
+            Key of documents to replace documents with (None = documents are
+            only inserted, and the ones already in collection are duplicates)
+        :param on_written: function({}, str)
+            Called with each document and its outcome (INSERTED, REPLACED,
+            DUPLICATE or REJECTED) once it has been written
+        :param indexes: [] of pymongo.IndexModel
+            Indexes to create in each collection before first write to it
+            (also in collections that do not exist yet)
+        :param max_pending: int
+            Max number of batches being written at once: put waits when
+            database falls behind (and so do the stages before the sink)
+        """
+
+        MongoSink.__init__(self, db, batch_size=batch_size,
+                           flush_seconds=flush_seconds, upsert_key=upsert_key,
+                           on_written=on_written, indexes=indexes)
+
+        self.max_pending = max_pending
+        self.indexing = {}  # collection -> task creating its indexes
+        self.slots = None  # semaphore of batches being written
+        self.pending = set()  # tasks writing batches
+
+    async def put(self, doc, collection):
+        """
+        :param doc: {}
+            Document to write
+        :param collection: str
+            Name of collection to write document to
+        :return: void
+            Adds document to batch of collection (starting to write batches
+            when full or when it is time to)
+        """
+
+        buffer = self.buffers.setdefault(str(collection), [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            await self.write(str(collection))
+        if time.time() - self.last_flush >= self.flush_seconds:
+            await self.write_all()
+
+    async def write_batch(self, collection, docs):
+        """
+        :param collection: str
+            Name of collection
+        :param docs: [] of {}
+            Documents to write
+        :return: [] of str
+            Outcome of each document (other coroutines run meanwhile)
+        """
+
+        try:
+            if self.upsert_key is None:
+                await self.db[collection].insert_many(docs, ordered=False)
+                return get_written_outcomes(len(docs))
+
+            result = await self.db[collection].bulk_write(
+                get_requests(docs, self.upsert_key), ordered=False
+            )
+            return get_written_outcomes(len(docs), result.upserted_ids)
+        except BulkWriteError as e:
+            return get_outcomes(e, len(docs), collection,
+                                upsert=self.upsert_key is not None)
+        except Exception as e:  # e.g connection lost: nothing is known
+            print("\t!!!\tCannot write batch to", collection, str(e))
+            return [REJECTED] * len(docs)
+
+    async def create_indexes(self, collection):
+        if not self.indexes:
+            return
+
+        if collection not in self.indexing:
+            self.indexing[collection] = asyncio.ensure_future(
+                self.db[collection].create_indexes(self.indexes)
+            )  # next batches of collection wait for same indexes
+        try:
+            await self.indexing[collection]
+        except Exception as e:  # e.g duplicates of unique key
+            if collection not in self.indexed:
+                self.indexed.add(collection)  # report once
+                print("\t!!!\tCannot create indexes of", collection, str(e))
+
+    async def write_and_release(self, collection, docs):
+        try:
+            await self.create_indexes(collection)
+            self.on_batch_written(docs,
+                                  await self.write_batch(collection, docs))
+        finally:
+            self.slots.release()
+
+    async def write(self, collection):
+        """
+        :param collection: str
+            Name of collection
+        :return: void
+            Starts writing documents waiting for collection (waits while
+            max_pending batches are being written)
+        """
+
+        docs = self.buffers.pop(collection, [])
+        if not docs:
+            return
+
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_pending)
+        await self.slots.acquire()
+        task = asyncio.ensure_future(self.write_and_release(collection, docs))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def write_all(self):
+        for collection in list(self.buffers.keys()):
+            await self.write(collection)
+        self.last_flush = time.time()
+
+    async def flush(self):
+        """
+        :return: void
+            Writes all documents waiting and waits until they are written
+        """
+
+        await self.write_all()
+        if self.pending:
+            await asyncio.gather(*self.pending)
@@ -0,0 +1,568 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Output files of lists of dicts: plain CSV or typed Parquet/Arrow """
+
+import csv
+import os
+import re
+import time
+
+from bots.core.durations import parse_duration
+
+FORMATS = ["csv", "parquet", "arrow"]
+EXTENSIONS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow"
+}
+NULL_VALUES = {"", "DNF", "-", "--", "None", "nan"}  # written as null
+INT_PATTERN = re.compile(r"^-?(0|[1-9]\d*)$")  # no leading zeros, e.g 0012
+FLOAT_PATTERN = re.compile(
+    r"^-?((0|[1-9]\d*)(\.\d*)?|\.\d+)([eE][+-]?\d+)?$"
+)
+MAX_INT = 2 ** 63 - 1
+ID_COLUMN_TOKENS = {
+    "id", "bib", "zip", "cap", "postcode", "phone", "tel", "fax", "mobile",
+    "vat", "iva", "piva", "fiscal", "code", "url"
+}  # columns with these words in name are kept as strings, e.g bib, zip
+ROWS_BETWEEN_SIZE_CHECKS = 100  # size of .csv files is checked this often
+INT = "int"
+FLOAT = "float"
+DURATION = "duration"
+STRING = "string"
+
+
+def get_extension(fmt):
+    """
+    :param fmt: str
+        One of FORMATS
+    :return: str
+        Extension of output files of format
+    """
+
+    return EXTENSIONS[fmt]
+
+
+def get_duration_ms(value):
+    """
+    :param value: str
+        Duration, e.g [h:]mm:ss[.ms]
+    :return: int
+        Milliseconds of duration (None if value is not a duration)
+    """
+
+    seconds = parse_duration(value)
+    if seconds is None:
+        return None
+    return int(round(seconds * 1000))
+
+
+def get_kind(value):
+    """
+    :param value: obj
+        Value of a column
+    :return: str
+        Narrowest type of value (None if value is null)
+    """
+
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return STRING
+    if isinstance(value, int):
+        return INT
+    if isinstance(value, float):
+        return FLOAT
+
+    value = str(value).strip()
+    if value in NULL_VALUES:
+        return None
+    if INT_PATTERN.match(value):
+        return INT if abs(int(value)) <= MAX_INT else STRING
+    if FLOAT_PATTERN.match(value):
+        return FLOAT
+    if parse_duration(value) is not None:
+        return DURATION
+    return STRING
+
+
+def is_id_column(name):
+    """
+    :param name: str
+        Name of column
+    :return: bool
+        True iff column holds codes rather than numbers (e.g bib, zip,
+        phone, VAT), whatever its values look like
+    """
+
+    tokens = re.split(r"[^a-z]+", str(name).lower())
+    return any(t in ID_COLUMN_TOKENS for t in tokens)
+
+
+def get_type_of_kinds(kinds):
+    """
+    :param kinds: set of str
+        Kinds of all values of a column
+    :return: str
+        Type all values of column fit in (STRING if they are all null)
+    """
+
+    kinds = set(kinds) - {None}
+    if kinds and kinds <= {INT}:
+        return INT
+    if kinds and kinds <= {INT, FLOAT}:
+        return FLOAT
+    if kinds == {DURATION}:
+        return DURATION
+    return STRING
+
+
+def get_column_type(values):
+    """
+    :param values: [] of obj
+        Values of a column
+    :return: str
+        Type all values of column fit in (STRING if they are all null)
+    """
+
+    return get_type_of_kinds(get_kind(v) for v in values)
+
+
+def fits_type(kinds, column_type):
+    """
+    :param kinds: set of str
+        Kinds of values of a column
+    :param column_type: str
+        Type of column
+    :return: bool
+        True iff all values can be converted to type of column
+    """
+
+    return column_type == STRING or \
+        get_type_of_kinds(set(kinds) | {column_type}) == column_type
+
+
+def convert(value, column_type):
+    """
+    :param value: obj
+        Value of a column
+    :param column_type: str
+        Type of column
+    :return: obj
+        Value as type of column (None if null). Raises ValueError if value
+        does not fit type (ArrowWriter makes such columns strings first)
+    """
+
+    if column_type == STRING:
+        return None if value is None else str(value)  # kept as it is
+
+    kind = get_kind(value)
+    if kind is None:
+        return None
+    if column_type == INT and kind == INT:
+        return int(str(value).strip())
+    if column_type == FLOAT and kind in (INT, FLOAT):
+        return float(str(value).strip())
+    if column_type == DURATION and kind == DURATION:
+        return get_duration_ms(value)
+    raise ValueError(str(value) + " is not a value of " + column_type)
+
+
+def get_part_path(path, part):
+    """
+    :param path: str
+        Path to output file
+    :param part: int
+        Number of part of output (0 for first one)
+    :return: str
+        Path to part of output file, e.g out.csv, out.1.csv, out.2.csv ...
+    """
+
+    if part == 0:
+        return path
+
+    root, extension = os.path.splitext(path)
+    return root + "." + str(part) + extension
+
+
+def get_part_paths(path):
+    """
+    :param path: str
+        Path to output file
+    :return: [] of str
+        Paths to existing parts of output file, e.g out.csv, out.1.csv ...
+    """
+
+    paths = []
+    part_path = get_part_path(path, 0)
+    while os.path.exists(part_path):
+        paths.append(part_path)
+        part_path = get_part_path(path, len(paths))
+    return paths
+
+
+def trim_partial_row(path):
+    """
+    :param path: str
+        Path to .csv file
+    :return: void
+        Drops last row of file if it was not completely written (e.g
+        process killed while writing it)
+    """
+
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+
+        end = 0
+        block = 4096
+        position = size
+        while position > 0 and end == 0:  # find last new line
+            position = max(0, position - block)
+            f.seek(position)
+            chunk = f.read(min(block, size - position))
+            if b"\n" in chunk:
+                end = position + chunk.rindex(b"\n") + 1
+        f.truncate(end)
+
+
+class CsvWriter(object):
+    """ Appends rows to a .csv file as they come, header taken from first
+    row; starts a new file when the current one is too big """
+
+    def __init__(self, path, append=False, flush_seconds=5.0,
+                 max_bytes=None, part=0):
+        """
+        :param path: str
+            Path to output file
+        :param append: bool
+            True iff rows are added to existing file (header is written only
+            in empty files)
+        :param flush_seconds: float
+            Max seconds rows wait in memory before they are on disk
+        :param max_bytes: int
+            Size of file after which rows go to next file (None = never)
+        :param part: int
+            Number of first file to write (e.g last part of output to resume)
+        """
+
+        object.__init__(self)
+
+        self.path = path
+        self.append = append
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+
+        self.headers = None  # taken from first row
+        self.part = part  # number of file being written
+        self.paths = []  # files written
+        self.rows_in_file = 0
+        self.file = None
+        self.writer = None
+        self.last_flush = time.time()
+
+    def open(self):
+        """
+        :return: void
+            Opens next file to write, with header
+        """
+
+        path = get_part_path(self.path, self.part)
+        if self.append and os.path.exists(path):
+            trim_partial_row(path)  # next row starts on a new line
+        self.file = open(path, "a" if self.append else "w", newline="")
+        self.writer = csv.DictWriter(
+            self.file, self.headers, delimiter=",", quotechar="\"",
+            extrasaction="ignore"
+        )  # keys not in first row are dropped (header is written once)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+        self.paths.append(path)
+        self.rows_in_file = 0
+
+    def rotate(self):
+        """
+        :return: void
+            Closes file and opens next one
+        """
+
+        self.file.close()
+        self.part += 1
+        self.open()
+
+    def write_row(self, row):
+        """
+        :param row: {}
+            Row to write
+        :return: void
+            Appends row to file (flushing or rotating file if it is time to)
+        """
+
+        if self.writer is None:
+            self.headers = list(row.keys())
+            self.open()
+        elif self.max_bytes is not None and \
+                self.rows_in_file % ROWS_BETWEEN_SIZE_CHECKS == 0 and \
+                self.file.tell() >= self.max_bytes:  # tell() flushes file
+            self.rotate()
+        self.writer.writerow(row)
+        self.rows_in_file += 1
+
+        if time.time() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def write(self, rows):
+        """
+        :param rows: [] of {}
+            Rows to write (any iterable: rows are not kept in memory)
+        :return: void
+            Appends rows to file
+        """
+
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ArrowWriter(object):
+    """ Writes rows to compressed Parquet (or Arrow IPC) files, with typed
+    columns, one row group at a time as groups fill. Types are found in the
+    first row group; when a later value does not fit its column, the column
+    becomes a string and rows go on in the next part of output (e.g
+    out.1.parquet), so no value is lost. A part can be read once it is
+    closed: the last one is closed with the writer """
+
+    def __init__(self, path, fmt="parquet", row_group_size=10000,
+                 compression="zstd", types=None):
+        """
+        :param path: str
+            Path to output file
+        :param fmt: str
+            "parquet" or "arrow" (Arrow IPC file)
+        :param row_group_size: int
+            Number of rows kept in memory before they are written
+        :param compression: str
+            Codec of columns
+        :param types: {} of str -> str
+            Type of columns (INT, FLOAT, DURATION or STRING) to use instead
+            of the one found in their values
+        """
+
+        object.__init__(self)
+
+        import pyarrow  # optional: only needed by these formats
+
+        self.pa = pyarrow
+        self.path = path
+        self.fmt = fmt
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.types = types or {}
+
+        self.rows = []  # rows of row group being filled
+        self.kinds = {}  # name -> kinds of values in row group (in order)
+        self.columns = {}  # name -> type of columns of file being written
+        self.schema = None
+        self.writer = None
+        self.part = 0  # number of file being written
+        self.paths = []  # files written
+
+    def get_arrow_type(self, column_type):
+        if column_type == INT:
+            return self.pa.int64()
+        if column_type == FLOAT:
+            return self.pa.float64()
+        if column_type == DURATION:
+            return self.pa.duration("ms")
+        return self.pa.string()
+
+    def get_column_types(self):
+        """
+        :return: {} of str -> str
+            Type of each column: the one of file being written if values of
+            row group fit it (else STRING), given one for new columns, STRING
+            for ids (e.g bib, zip), else the narrowest one values fit in
+        """
+
+        columns = dict(self.columns)
+        for name, kinds in self.kinds.items():
+            if name in columns:
+                if not fits_type(kinds, columns[name]):
+                    columns[name] = STRING  # e.g bib "A7" in column of ints
+            elif name in self.types:
+                columns[name] = self.types[name]
+            elif is_id_column(name):
+                columns[name] = STRING
+            else:
+                columns[name] = get_type_of_kinds(kinds)
+        return columns
+
+    def open(self):
+        """
+        :return: void
+            Opens next file to write, with types of columns
+        """
+
+        self.schema = self.pa.schema([
+            (name, self.get_arrow_type(column_type))
+            for name, column_type in self.columns.items()
+        ])
+
+        path = get_part_path(self.path, self.part)
+        if self.fmt == "parquet":
+            import pyarrow.parquet
+
+            self.writer = pyarrow.parquet.ParquetWriter(
+                path, self.schema, compression=self.compression
+            )
+        else:
+            import pyarrow.ipc
+
+            self.writer = pyarrow.ipc.new_file(
+                path, self.schema,
+                options=pyarrow.ipc.IpcWriteOptions(
+                    compression=self.compression
+                )
+            )
+        self.paths.append(path)
+
+    def write_row_group(self):
+        """
+        :return: void
+            Writes rows waiting as a row group (in next file if their values
+            do not fit types of columns of the current one)
+        """
+
+        if not self.rows:
+            return
+
+        columns = self.get_column_types()
+        if columns != self.columns:  # first row group, or types changed
+            if self.writer is not None:
+                self.writer.close()
+                self.part += 1
+            self.columns = columns
+            self.open()
+
+        table = self.pa.table({
+            name: self.pa.array(
+                [convert(row.get(name), column_type) for row in self.rows],
+                type=self.schema.field(name).type
+            ) for name, column_type in self.columns.items()
+        }, schema=self.schema)
+        self.writer.write_table(table)
+        self.rows = []
+        self.kinds = {}
+
+    def write_row(self, row):
+        """
+        :param row: {}
+            Row to write
+        :return: void
+            Adds row to row group (writing it when full)
+        """
+
+        for name, value in row.items():
+            kinds = self.kinds.setdefault(name, set())
+            if STRING not in kinds:  # nothing is wider than strings
+                kinds.add(get_kind(value))
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    def write(self, rows):
+        """
+        :param rows: [] of {}
+            Rows to write (any iterable)
+        :return: void
+            Adds rows to row group (writing it when full)
+        """
+
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        """
+        :return: void
+            Writes last rows and closes file
+        """
+
+        try:
+            self.write_row_group()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+
+
+def get_writer(path, fmt=None, max_bytes=None):
+    """
+    :param path: str
+        Path to output file
+    :param fmt: str
+        One of FORMATS (None to guess it from extension of path)
+    :param max_bytes: int
+        Size of .csv files after which rows go to next file (None = never)
+    :return: CsvWriter or ArrowWriter
+        Writer of format
+    """
+
+    if fmt is None:
+        extension = os.path.splitext(path)[-1]
+        fmt = [f for f in FORMATS if EXTENSIONS[f] == extension] or ["csv"]
+        fmt = fmt[0]
+
+    if fmt not in FORMATS:
+        raise ValueError("Unknown output format " + str(fmt) +
+                         ": use one of " + ", ".join(FORMATS))
+    if fmt == "csv":
+        return CsvWriter(path, max_bytes=max_bytes)
+    return ArrowWriter(path, fmt=fmt)
+
+
+def write_dicts(dicts, path, fmt=None):
+    """
+    :param dicts: [] of {}
+        Rows to write
+    :param path: str
+        Path to output file
+    :param fmt: str
+        One of FORMATS (None to guess it from extension of path)
+    :return: void
+        Saves rows to file
+    """
+
+    writer = get_writer(path, fmt=fmt)
+    try:
+        writer.write(dicts)
+    finally:
+        writer.close()
@@ -18,8 +18,8 @@
 
 """ Scrape IMDB list items """
 
-from bs4 import BeautifulSoup
-from hal.internet.web import Webpage
+from bots.core.cache import get_html_source
+from bots.core.markup import parse_html
 
 BASE_URL = "http://www.imdb.com/list/"
 NULL_VALUE = "dnf"
@@ -173,8 +173,8 @@ def get_list_items(list_id):
     url = list_url
     while url:  # while there is a url to fetch
         try:
-            soup = BeautifulSoup(Webpage(url).get_html_source(),
-                                 "lxml")  # get HTML parser of page
+            soup = parse_html(
+                get_html_source(url))  # get HTML parser of page (or cache)
             next_url = get_next_page_list_url(soup)  # get url of next page
             if next_url is not None:
                 url = list_url + next_url
@@ -22,6 +22,8 @@ import argparse
 import os
 import time
 
+from bots.core.writers import FORMATS, get_extension
+
 
 def create_args():
     """
@@ -30,11 +32,14 @@ def create_args():
     """
 
     parser = argparse.ArgumentParser(
-        usage="-i <path to input .csv file> -o <path to output folder>")
+        usage="-i <path to input .csv file> -o <path to output folder> "
+              "[--format csv|parquet|arrow]")
     parser.add_argument("-i", dest="path_in", help="path to input .csv file",
                         required=True)
     parser.add_argument("-o", dest="path_out", help="path to output folder",
                         required=True)
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of output file")
     return parser
 
 
@@ -50,9 +55,9 @@ def parse_args(parser):
 
     path_out = os.path.join(
         str(args.path_out),
-        "output-" + str(int(time.time())) + ".csv"
+        "output-" + str(int(time.time())) + get_extension(args.fmt)
     )
-    return str(args.path_in), path_out
+    return str(args.path_in), path_out, str(args.fmt)
 
 
 def check_args(path_in, path_out):
@@ -19,12 +19,12 @@
 """ Main driver of bot """
 
 from args_utils import create_args, parse_args, check_args
-from data_utils import get_data_from_csv, get_list_queries, save_dicts_to_csv
+from data_utils import get_data_from_csv, get_list_queries, save_dicts
 from search_utils import search_query
 
 
 def main():
-    path_in, path_out = parse_args(create_args())
+    path_in, path_out, fmt = parse_args(create_args())
     if check_args(path_in, path_out):
         queries = get_list_queries(
             get_data_from_csv(path_in))  # get input data
@@ -38,7 +38,7 @@ def main():
                 [str(x) for x in r["telephone"]])  # to list of string
 
             search_results.append(r)  # add to results
-        save_dicts_to_csv(search_results, path_out)  # save to output
+        save_dicts(search_results, path_out, fmt=fmt)  # save to output
 
 
 if __name__ == '__main__':
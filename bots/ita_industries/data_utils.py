@@ -60,3 +60,23 @@ def save_dicts_to_csv(dicts, path_out):
         quotechar="\"",
         index=False
     )  # save to output file
+
+
+def save_dicts(dicts, path_out, fmt="csv"):
+    """
+    :param dicts: List of dicts
+        Content to save
+    :param path_out: str
+        File to use as output
+    :param fmt: str
+        Format of output file: csv, parquet or arrow
+    :return: void
+        Saves data to file
+    """
+
+    if fmt == "csv":
+        save_dicts_to_csv(dicts, path_out)
+    else:
+        from bots.core.writers import write_dicts
+
+        write_dicts(dicts, path_out, fmt=fmt)  # typed columns
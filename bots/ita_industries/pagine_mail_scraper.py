@@ -22,12 +22,13 @@ import asyncio
 import os
 import time
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
 from bs4 import BeautifulSoup
 from hal.internet.web import Webpage
 from hal.time.profile import print_time_eta, get_time_eta
 
+from bots.core.fetch import FetchEngine
+from bots.core.retry import RetryPolicy
+
 SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
 SCRIPT_NAME = str(os.path.basename(__file__)).split(".")[0]
 LOG_FILE = os.path.join(
@@ -46,59 +47,36 @@ START_PAGE = "https://www.paginemail.it/dir/r/veneto/20/treviso"  # url where to
 BASE_URL = "https://www.paginemail.it"
 
 
-async def try_and_fetch(u, max_attempts=8, time_delay_between_attempts=1):
+def save_raw_source(url, body):
     """
-    :param u: str
-        Url to fetch
-    :param max_attempts: int
-        Max number of attempts to get page
-    :param time_delay_between_attempts: float
-        Number of seconds to wait between 2 consecutive attempts
-    :return: str
+    :param url: str
+        Url of page
+    :param body: str
         Body of page with url or null
+    :return: void
+        Keeps page source to parse later
     """
 
-    for _ in range(max_attempts):
-        try:
-            conn = ProxyConnector(remote_resolve=True)
-            async with aiohttp.ClientSession(
-                    connector=conn, request_class=ProxyClientRequest
-            ) as session:
-                async with session.get(
-                        u, proxy="socks5://127.0.0.1:9150"
-                ) as response:  # use tor
-                    body = await response.text()  # encoding='latin-1'
-                    raw_sources.append(body)  # add url and page source
-                    print_time_eta(
-                        get_time_eta(
-                            len(raw_sources),
-                            total,
-                            start_time
-                        ),  # get ETA
-                        note="Fetched url"
-                    )  # debug info
-                    return body
-        except Exception as e:
-            time.sleep(time_delay_between_attempts)
-            print("Cannot get url " + str(u))
-            print(str(e))
-    return None
-
-
-async def bound_fetch(sem, url):
-    async with sem:
-        await try_and_fetch(url, max_attempts=3, time_delay_between_attempts=2)
+    if body is None:
+        print("Cannot get url " + str(url))
+        return
+
+    raw_sources.append(body)  # add page source
+    print_time_eta(
+        get_time_eta(
+            len(raw_sources),
+            total,
+            start_time
+        ),  # get ETA
+        note="Fetched url"
+    )  # debug info
 
 
 async def async_fetch_urls(list_of_urls, max_concurrent=200):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
-
-    responses = asyncio.gather(*tasks)
-    await responses
+    retry = RetryPolicy(max_attempts=3, base_delay=2)
+    async with FetchEngine(retry=retry, log_file=LOG_FILE) as engine:
+        await engine.fetch_many(list_of_urls, max_concurrent=max_concurrent,
+                                callback=save_raw_source)
 
 
 def fetch_urls(list_of_urls):
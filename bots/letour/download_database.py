@@ -16,17 +16,22 @@
 # limitations under the License.
 
 
+import argparse
 import asyncio
 import os
 import time
 from datetime import datetime
 from datetime import timedelta
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
-from hal.profile.mem import get_memory_usage, force_garbage_collect
+from hal.profile.mem import get_memory_usage
 from hal.time.profile import print_time_eta, get_time_eta
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+
+from bots.core.checkpoints import Checkpoint, COMPLETED, EMPTY, FAILED
+from bots.core.fetch import FetchEngine
+from bots.core.pipeline import Pipeline
+from bots.core.sinks import AsyncMongoSink, REJECTED
 
 from .parsers import get_url_of_page, get_list_of_stages, \
     get_standings_of_stage, get_stage_details_from_url
@@ -36,83 +41,214 @@ LOG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                             0] + "-" + str(int(time.time())) + ".log")
 MIN_YEAR_PAGE = 1903  # minimum year of tour
 MAX_YEAR_PAGE = 2016  # maximum year of tour
+STAGES_IN_YEAR = 10000  # stage ids are year * STAGES_IN_YEAR + stage number
+YEARS_CHECKPOINT_FILE = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    str(os.path.basename(__file__)).split(".")[0] + "-years.checkpoint"
+)  # years whose stages are all saved
+STAGES_CHECKPOINT_FILE = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    str(os.path.basename(__file__)).split(".")[0] + "-stages.checkpoint"
+)  # stages saved so far
+
+DATABASE_NAME = "letour-stages"  # database with a coll for each year
+STAGES_INDEXES = [
+    IndexModel([("num", ASCENDING)], unique=True)  # primary key
+]  # created by sink before first write in each year collection
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="[--resume] [--workers <processes>] [--chunk-size <pages>]"
+    )
+    parser.add_argument("--resume", dest="resume", action="store_true",
+                        help="skip years and stages already done in last run")
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=64, help="pages sent to a process at once")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return bool(args.resume), int(args.workers), int(args.chunk_size)
+
+
+def get_year_of_url(u):
+    """
+    :param u: str
+        Url of year page
+    :return: int
+        Year of tour
+    """
 
-DATABASE_NAME = "letour-stages"  # name of mongodb database to use
-mongodb_client = MongoClient()  # mongodb client
-# mongodb_client.drop_database(DATABASE_NAME)  # remove all previous data in database
-db = mongodb_client[
-    DATABASE_NAME]  # database to use (will have a coll for each year, each coll will have stages list)
-for c in db.collection_names():
-    db[c].create_index("num", unique=True)  # set primary key
+    return int(str(u).strip().split("/")[-2])
 
 
-async def try_and_fetch(u, max_attempts=8, time_delay_between_attempts=1):
+def get_stage_id_of_url(u):
     """
     :param u: str
-        Url to fetch
-    :param max_attempts: int
-        Max number of attempts to get page
-    :param time_delay_between_attempts: float
-        Number of seconds to wait between 2 consecutive attempts
-    :return: str
+        Url of stage page
+    :return: int
+        Id of stage (unique among all years)
+    """
+
+    tokens = str(u).strip().split("/")
+    return int(tokens[-3]) * STAGES_IN_YEAR + int(tokens[-2])
+
+
+def on_stage_done(url, state):
+    """
+    :param url: str
+        Url of stage page
+    :param state: str
+        New state of stage
+    :return: void
+        Records state of stage (and of its year when all stages are done)
+    """
+
+    stages_checkpoint.mark(get_stage_id_of_url(url), state)
+    if state == FAILED:
+        return
+
+    year = get_stage_id_of_url(url) // STAGES_IN_YEAR
+    stages_left[year] -= 1
+    if stages_left[year] == 0:
+        years_checkpoint.mark(year, COMPLETED)
+
+
+def on_fetch_failure(url):
+    on_stage_done(url, FAILED)
+
+
+def save_raw_source(url, body):
+    """
+    :param url: str
+        Url of page
+    :param body: str
         Body of page with url or null
+    :return: void
+        Keeps page source to parse later
     """
 
-    for _ in range(max_attempts):
-        try:
-            conn = ProxyConnector(remote_resolve=True)
-            async with aiohttp.ClientSession(connector=conn,
-                                             request_class=ProxyClientRequest) as session:
-                async with session.get(u,
-                                       proxy="socks5://127.0.0.1:9150") as response:  # use tor
-                    body = await response.text(encoding='latin-1')
-                    raw_sources.append({
-                        "url": str(u),
-                        "html": str(body)
-                    })  # add url and page source
-
-                    print_time_eta(
-                        get_time_eta(
-                            len(raw_sources),
-                            total,
-                            start_time
-                        ),  # get ETA
-                        note="Got HTML"
-                    )  # debug info
-                    return body
-        except Exception as e:
-            time.sleep(time_delay_between_attempts)
-            import traceback
-            traceback.print_exc()
-            print("Cannot get url " + str(u))
-            print(str(e))
-    return None
-
-
-async def bound_fetch(sem, url):
-    async with sem:
-        await try_and_fetch(url, max_attempts=1, time_delay_between_attempts=0)
+    if body is None:
+        print("Cannot get url " + str(url))
+        years_checkpoint.mark(get_year_of_url(url), FAILED)
+        return
+
+    raw_sources.append({
+        "url": str(url),
+        "html": str(body)
+    })  # add url and page source
+
+    print_time_eta(
+        get_time_eta(
+            len(raw_sources),
+            total,
+            start_time
+        ),  # get ETA
+        note="Got HTML"
+    )  # debug info
 
 
 async def fetch_urls(list_of_urls, max_concurrent=200):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
+    await engine.fetch_many(list_of_urls, max_concurrent=max_concurrent,
+                            callback=save_raw_source)
+
 
-    responses = asyncio.gather(*tasks)
-    await responses
+def parse_stage(url, body):
+    """
+    :param url: str
+        Url of stage page
+    :param body: str
+        Raw HTML page of stage
+    :return: str, str, {}
+        Url of stage, year of stage and stage document
+    """
+
+    stage_standings = get_standings_of_stage(body)
+    stage_details = get_stage_details_from_url(url)
+    d = {
+        "num": stage_details["id"],
+        "standings": stage_standings
+    }
+    return url, stage_details["year"], d
+
+
+def on_stage_written(d, outcome):
+    """
+    :param d: {}
+        Stage document
+    :param outcome: str
+        Outcome of write to database
+    :return: void
+        Records state of stage
+    """
+
+    url = stage_urls.pop(id(d))
+    on_stage_done(url, FAILED if outcome == REJECTED else COMPLETED)
+
+
+async def save_stage(item):
+    """
+    :param item: str, str, {}
+        Url of stage, year of stage and stage document
+    :return: void
+        Saves stage to database (in next batch, waiting while database is
+        behind)
+    """
+
+    url, year, d = item
+    stage_urls[id(d)] = url  # until stage is written
+    await sink.put(d, year)
+
+    print_time_eta(
+        get_time_eta(
+            pipeline.stats["stored"] + 1,
+            total,
+            start_time
+        ),  # get ETA
+        note="Queued for database"
+    )  # debug info
 
 
 if __name__ == "__main__":
+    resume, workers, chunk_size = parse_args(create_args())
     start_time_overall = time.time()
 
+    years_checkpoint = Checkpoint(
+        YEARS_CHECKPOINT_FILE, MIN_YEAR_PAGE, MAX_YEAR_PAGE
+    )
+    stages_checkpoint = Checkpoint(
+        STAGES_CHECKPOINT_FILE,
+        MIN_YEAR_PAGE * STAGES_IN_YEAR,
+        MAX_YEAR_PAGE * STAGES_IN_YEAR + STAGES_IN_YEAR - 1
+    )
+    if resume:
+        years_checkpoint.load()
+        stages_checkpoint.load()
+    stages_left = {}  # year -> number of stages still to save
+
     print("\t0 - Getting URLs list")
     urls_list = [get_url_of_page(y) for y in
-                 range(MIN_YEAR_PAGE, MAX_YEAR_PAGE + 1)]  # get list of urls
+                 range(MIN_YEAR_PAGE, MAX_YEAR_PAGE + 1)
+                 if not years_checkpoint.is_done(y)]  # get list of urls
     total = len(urls_list)
     raw_sources = []  # list of raw HTML pages to parse
+    engine = FetchEngine(encoding="latin-1")  # shared by both fetch steps
 
     print("\t1 - Downloading years pages")
     start_time = time.time()
@@ -125,9 +261,20 @@ if __name__ == "__main__":
     urls_list = []
     total = len(raw_sources)
     for i in range(len(raw_sources)):
-        urls_list += get_list_of_stages(
+        year = get_year_of_url(raw_sources[i]["url"])
+        all_stages = get_list_of_stages(
             raw_sources[i]["html"]
         )  # get list of stages in page
+        stages = [
+            u for u in all_stages
+            if not stages_checkpoint.is_done(get_stage_id_of_url(u))
+        ]  # still to save
+        stages_left[year] = len(stages)
+        if not all_stages:
+            years_checkpoint.mark(year, EMPTY)
+        elif not stages:
+            years_checkpoint.mark(year, COMPLETED)
+        urls_list += stages
         print_time_eta(
             get_time_eta(
                 i + 1,
@@ -137,49 +284,40 @@ if __name__ == "__main__":
             note="Got stage list"
         )  # debug info
 
-    print("\t3 - Downloading stages pages")
-    raw_sources = []  # list of raw HTML pages to parse
+    print("\t3 - Downloading, parsing and saving stages pages")
+    raw_sources = None  # free memory
     total = len(urls_list)
+    stage_urls = {}  # id of stage document -> url of stage
+    motor_client = AsyncIOMotorClient()  # writes while pages are fetched
+    sink = AsyncMongoSink(motor_client[DATABASE_NAME],
+                          on_written=on_stage_written,
+                          indexes=STAGES_INDEXES)
+    pipeline = Pipeline(
+        engine,
+        parse_stage,
+        save_stage,
+        max_concurrent=200,
+        on_failure=on_fetch_failure,
+        on_discard=on_fetch_failure,
+        parse_workers=workers,
+        chunk_size=chunk_size
+    )  # pages are parsed and saved as soon as they are fetched
 
     start_time = time.time()
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(fetch_urls(urls_list))  # fetch sources
-    loop.run_until_complete(future)
-    loop.close()
-
-    print("\t4 - Garbage-collecting useless stuff")
-    urls_list = None
-    force_garbage_collect()
-
-    print("\t5- Parsing stages pages")
-    total = len(raw_sources)
-    start_time = time.time()
-    for i in range(len(raw_sources)):
-        stage_standings = get_standings_of_stage(
-            raw_sources[i]["html"]
-        )
-        stage_details = get_stage_details_from_url(raw_sources[i]["url"])
-        d = {
-            "num": stage_details["id"],
-            "standings": stage_standings
-        }
-
-        try:
-            db[str(stage_details["year"])].insert_one(d)
-            raw_sources[i] = None  # release memory
-        except Exception as e:
-            print(str(e))
-
-        print_time_eta(
-            get_time_eta(
-                i + 1,
-                total,
-                start_time
-            ),  # get ETA
-            note="Saved to database"
-        )  # debug info
+    try:
+        future = asyncio.ensure_future(pipeline.run(urls_list))
+        loop.run_until_complete(future)
+        loop.run_until_complete(sink.flush())  # write last batches
+        loop.run_until_complete(engine.close())
+        loop.close()
+    finally:
+        years_checkpoint.flush()  # next run can resume from here
+        stages_checkpoint.flush()
+    sink.print_summary()
+    years_checkpoint.print_summary()
+    stages_checkpoint.print_summary()
 
-    mongodb_client.close()  # close mongodb connection
+    motor_client.close()  # close mongodb connection
 
     end_time_overall = time.time()
     delta_time_overall = end_time_overall - start_time_overall
@@ -16,12 +16,12 @@
 # limitations under the License.
 
 
-from datetime import datetime, timedelta
-
-from bs4 import BeautifulSoup
+from bots.core.durations import format_duration, parse_durations
+from bots.core.markup import parse_html
 
 VALUE_NOT_FOUND = str(
     "DNF")  # value to put when data cannot be found (or some errors occur)
+LIST_TABLE = {"class": "liste"}
 
 
 def get_url_of_page(y, base_url="http://www.letour.fr/HISTO/us/TDF/"):
@@ -70,8 +70,8 @@ def get_list_of_stages(raw_html, base_url="http://www.letour.fr"):
     """
 
     try:
-        soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
-        table = soup.find_all("table", {"class": "liste"})[0]
+        soup = parse_html(str(raw_html), tables_only=True)  # HTML parser
+        table = soup.find_all("table", LIST_TABLE)[0]
         rows = table.find_all("tr")[1:]  # discard header
         urls = [r.find("td").a["href"] for r in rows]  # raw urls
         return [str(base_url + u) for u in urls]  # add root urls
@@ -89,8 +89,8 @@ def get_standings_of_stage(raw_html):
     """
 
     standings = []
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
-    table = soup.find_all("table", {"class": "liste"})[-1]
+    soup = parse_html(str(raw_html), tables_only=True)  # HTML parser
+    table = soup.find_all("table", LIST_TABLE)[-1]
     rows = table.find_all("tr")
 
     if "etape" in rows[1].find("td").text.lower():
@@ -102,6 +102,7 @@ def get_standings_of_stage(raw_html):
                 non_stage_rows[0])  # data rows ends at this index
             rows = rows[:end_rows]
 
+            rows_columns = []
             for r in rows:
                 try:
                     columns = r.find_all("td")
@@ -109,59 +110,32 @@ def get_standings_of_stage(raw_html):
                         c.text.replace("\\\'", "'").replace("\\t", "").replace(
                             "\\n", "").strip()) for c in
                                columns]  # parse
-                    athlete_time = columns[3]  # TODO
-                    if athlete_time.startswith("+"):
-                        try:
-                            athlete_time = datetime.strptime(athlete_time,
-                                                             '+ %M\' %S"')
-                            athlete_time = timedelta(
-                                hours=athlete_time.hour,
-                                minutes=athlete_time.minute,
-                                seconds=athlete_time.second
-                            )
-                        except:
-                            try:
-                                athlete_time = datetime.strptime(athlete_time,
-                                                                 '+ %Hh %M\' %S"')
-                                athlete_time = timedelta(
-                                    hours=athlete_time.hour,
-                                    minutes=athlete_time.minute,
-                                    seconds=athlete_time.second
-                                )
-                            except:
-                                athlete_time = VALUE_NOT_FOUND
-                    else:  # this is the winner time
-                        try:
-                            athlete_time = datetime.strptime(athlete_time,
-                                                             '%Hh %M\' %S\"')
-                            athlete_time = timedelta(
-                                hours=athlete_time.hour,
-                                minutes=athlete_time.minute,
-                                seconds=athlete_time.second
-                            )
-                        except:
-                            try:
-                                athlete_time = datetime.strptime(athlete_time,
-                                                                 '%M\' %S"')
-                                athlete_time = timedelta(
-                                    hours=athlete_time.hour,
-                                    minutes=athlete_time.minute,
-                                    seconds=athlete_time.second
-                                )
-                            except:
-                                athlete_time = VALUE_NOT_FOUND
-
-                    standings.append(
-                        {
-                            "position": columns[0],
-                            "id": columns[1],
-                            "name": columns[2].title(),
-                            "time": str(athlete_time)  # to string
-                        }
-                    )  # add to result list
+                    rows_columns.append(
+                        (columns[0], columns[1], columns[2], columns[3])
+                    )  # time is parsed with times of all rows
                 except Exception as e:
                     print(str(e))
                     pass
+
+            times = parse_durations(
+                c[3] for c in rows_columns
+            )  # winner time or gap to winner (+ ...)
+            for columns, athlete_time in zip(rows_columns, times):
+                if athlete_time is None:
+                    athlete_time = VALUE_NOT_FOUND
+                else:
+                    athlete_time = format_duration(
+                        athlete_time, hour_digits=1
+                    )  # H:MM:SS, also past 24 hours (e.g 83:02:15)
+
+                standings.append(
+                    {
+                        "position": columns[0],
+                        "id": columns[1],
+                        "name": columns[2].title(),
+                        "time": str(athlete_time)  # to string
+                    }
+                )  # add to result list
         except Exception as e:
             print(str(e))  # parse all rows
             pass
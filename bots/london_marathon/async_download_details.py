@@ -20,10 +20,13 @@ import asyncio
 import os
 import time
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
-from models import StreamsBot, AthletePerformance
-from utils import get_time_eta, print_time_eta, print_debug_info
+from models import StreamsBot, parse_performance
+from utils import get_time_eta, print_time_eta
+
+from bots.core.fetch import FetchEngine
+from bots.core.pipeline import Pipeline
+from bots.core.readers import count_urls
+from bots.core.writers import FORMATS, get_extension, get_writer
 
 
 def create_args():
@@ -32,9 +35,24 @@ def create_args():
         Parser that handles cmd arguments.
     """
 
-    parser = argparse.ArgumentParser(usage="-f <path to input file>")
+    parser = argparse.ArgumentParser(
+        usage="-f <path to input file> [--workers <processes>] "
+              "[--chunk-size <pages>] [--format csv|parquet|arrow] "
+              "[--rotate-mb <MB>] [--dedupe]"
+    )
     parser.add_argument("-f", dest="file_path",
                         help="e.g /home/awesome/data/data.csv", required=True)
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=64, help="pages sent to a process at once")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of output files")
+    parser.add_argument("--rotate-mb", dest="rotate_mb", type=float,
+                        default=None,
+                        help="start a new .csv file every MB written")
+    parser.add_argument("--dedupe", dest="dedupe", action="store_true",
+                        help="skip urls already in input file")
     return parser
 
 
@@ -47,7 +65,12 @@ def parse_args(parser):
     """
 
     args = parser.parse_args()
-    return str(args.file_path)
+    max_bytes = None
+    if args.rotate_mb is not None:
+        max_bytes = int(args.rotate_mb * 1024 ** 2)
+
+    return str(args.file_path), int(args.workers), int(args.chunk_size), \
+           str(args.fmt), max_bytes, bool(args.dedupe)
 
 
 def check_args(file_path):
@@ -63,87 +86,64 @@ def check_args(file_path):
     return True
 
 
-async def fetch(u):
-    try:
-        conn = ProxyConnector(remote_resolve=True)
-        async with aiohttp.ClientSession(connector=conn,
-                                         request_class=ProxyClientRequest) as session:
-            async with session.get(u,
-                                   proxy="socks5://127.0.0.1:9150") as response:
-                print_time_eta(
-                    get_time_eta(
-                        len(raw_sources),
-                        total,
-                        start_time
-                    )  # get ETA
-                )  # debug info
-
-                body = await response.text()
-                raw_sources[str(u)] = str(body)  # add url and page source
-
-                if response.status != 200:
-                    print_debug_info([response.status, u])
-                return body
-    except Exception as e:
-        raw_sources[str(u)] = ""  # add url and page source
-        print_debug_info([str(e), u])
-        return ""
+def save_performance(d):
+    """
+    :param d: {}
+        Details of performance
+    :return: void
+        Writes details to output file
+    """
 
+    writer.write_row(d)
+    print_time_eta(
+        get_time_eta(
+            pipeline.stats["stored"] + 1,
+            total,
+            start_time
+        )  # get ETA
+    )  # debug info
 
-async def bound_fetch(sem, url):
-    async with sem:
-        await fetch(url)
 
+def on_fetch_failure(url):
+    save_performance(parse_performance(url, ""))  # empty details
 
-async def fetch_urls(list_of_urls, max_concurrent=1000):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
 
-    responses = asyncio.gather(*tasks)
-    await responses
+async def fetch_and_parse(list_of_urls):
+    async with pipeline.engine:
+        return await pipeline.run(list_of_urls)
 
 
 if __name__ == '__main__':
-    file_path = parse_args(create_args())
+    file_path, workers, chunk_size, fmt, max_bytes, dedupe = parse_args(
+        create_args())
 
     if check_args(file_path):
-        urls = StreamsBot(
-            file_path).read_results_url_from_csv()  # parse file to get urls of results
-        total = len(urls)
+        urls = StreamsBot(file_path).iter_results_urls(
+            dedupe=dedupe)  # read lazily while pages are fetched
+        total = count_urls(file_path, dedupe=dedupe)
         start_time = int(time.time())  # get ms of day
 
-        print("Fetching HTML pages")
-        raw_sources = {}  # list of raw HTML page sources
+        out_path = os.path.join(os.path.dirname(file_path),
+                                "out-" + str(int(time.time())) +
+                                get_extension(fmt))
+        writer = get_writer(out_path, fmt=fmt, max_bytes=max_bytes)
+
+        print("Fetching, parsing and saving HTML pages")
+        pipeline = Pipeline(
+            FetchEngine(),
+            parse_performance,
+            save_performance,
+            on_failure=on_fetch_failure,
+            parse_workers=workers,
+            chunk_size=chunk_size
+        )  # pages are parsed and saved as soon as they are fetched
         loop = asyncio.get_event_loop()
-        future = asyncio.ensure_future(fetch_urls(urls))  # fetch sources
-        loop.run_until_complete(future)
+        future = asyncio.ensure_future(fetch_and_parse(urls))
+        try:
+            loop.run_until_complete(future)
+        finally:
+            writer.close()  # keep details saved so far
         loop.close()
-
-        print("Parsing HTML pages")
-        details = []  # list of details
-        start_time = int(time.time())  # get ms of day
-        total = len(raw_sources)
-        for k in raw_sources.keys():
-            athletic_performance = AthletePerformance(url=k,
-                                                      raw_html=raw_sources[
-                                                          k])  # create obj
-            athletic_performance.parse_details()
-            d = athletic_performance.to_dict()
-            details.append(d)  # add to list
-
-            print_time_eta(
-                get_time_eta(
-                    len(details),
-                    total,
-                    start_time
-                )  # get ETA
-            )  # debug info
-
-        out_path = os.path.join(os.path.dirname(file_path),
-                                "out-" + str(int(time.time())) + ".csv")
-        StreamsBot(out_path).write_dicts_to_csv(details)  # save to output file
+        print("Details saved to", out_path)
     else:
         print("Error while parsing args.")
@@ -17,6 +17,7 @@
 
 
 import argparse
+import asyncio
 import os
 import time
 
@@ -30,12 +31,23 @@ def create_args():
     """
 
     parser = argparse.ArgumentParser(
-        usage="-y <years to fetch (optional)> -f <path to data file>")
+        usage="-y <years to fetch (optional)> -f <path to data file> "
+              "[--prefetch <pages>] [-o <path to details file>] "
+              "[--workers <processes>]")
     parser.add_argument("-y", dest="years",
                         help="e.g '2017', '2014-2017', '2014,2016,2017'",
                         required=False)
     parser.add_argument("-f", dest="file_path",
                         help="e.g /home/awesome/data/data.csv", required=True)
+    parser.add_argument("--prefetch", dest="prefetch", type=int, default=0,
+                        help="fetch pages of all years and events at once, "
+                             "this many pages ahead in each event (0 = one "
+                             "page at a time)")
+    parser.add_argument("-o", dest="out_path", default=None,
+                        help="output file of details, resumed if it exists "
+                             "(default: new file next to data file)")
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
     return parser
 
 
@@ -65,7 +77,8 @@ def parse_args(parser):
     except:
         years = None
 
-    return years, str(args.file_path)
+    return years, str(args.file_path), int(args.prefetch), args.out_path, \
+           int(args.workers)
 
 
 def check_args(years, file_path):
@@ -89,21 +102,30 @@ def check_args(years, file_path):
 
 
 def main():
-    years, file_path = parse_args(create_args())
+    years, file_path, prefetch, out_path, workers = parse_args(create_args())
     if check_args(years, file_path):
         if years is not None:
             bot = LondonMarathonBot()
-            urls = bot.get_urls_of_years(years)
+            if prefetch > 0:
+                loop = asyncio.get_event_loop()
+                urls = loop.run_until_complete(
+                    bot.async_get_urls_of_years(years, prefetch=prefetch)
+                )
+            else:
+                urls = bot.get_urls_of_years(years)
             bot = StreamsBot(file_path)
             bot.write_dict_to_csv(urls)
         else:
-            urls = StreamsBot(
-                file_path).read_results_url_from_csv()  # parse file to get urls of results
-            out_path = os.path.join(os.path.dirname(file_path),
-                                    "out-" + str(int(time.time())) + ".csv")
+            urls = StreamsBot(file_path).iter_results_urls(
+                dedupe=True)  # read lazily while pages are fetched
+            if out_path is None:
+                out_path = os.path.join(os.path.dirname(file_path),
+                                        "out-" + str(int(time.time())) +
+                                        ".csv")
             LondonMarathonBot.async_download_performance_details(
                 urls,
-                out_path
+                out_path,
+                workers=workers
             )  # get details of performances
     else:
         print("Error while parsing args.")
@@ -16,20 +16,40 @@
 # limitations under the License.
 
 
-import csv
+import asyncio
+import os
 import time
 
 import pandas
-from bs4 import BeautifulSoup
 from hal.internet.web import Webpage
-from utils import get_time_eta, print_item_info
+from utils import get_time_eta, print_item_info, print_time_eta
+
+from bots.core.cache import get_html_source
+from bots.core.fetch import FetchEngine
+from bots.core.markup import parse_html
+from bots.core.pipeline import Pipeline
+from bots.core.readers import iter_urls, iter_urls_in_csv
+from bots.core.records import ResultsTable
+from bots.core.writers import CsvWriter, get_part_paths, trim_partial_row, \
+    write_dicts
 
 VALUE_NOT_FOUND = "DNF"
+PREFETCH_PAGES = 4  # pages of results of an event fetched ahead
+PAGE_ATTEMPTS = 3  # times a page of results is fetched before giving up
+ROWS_BETWEEN_PROGRESS = 100  # progress of downloads is printed this often
 
 
 class AthletePerformance(object):
     """ Models a performance in the marathon of an athlete """
 
+    __slots__ = (
+        "url", "raw_html", "event_id", "surname_name", "nationality", "club",
+        "category", "bib", "place_mv", "place_ac", "place_overall",
+        "finish_time", "race_finished", "last_split", "start_time",
+        "split_5K", "split_10K", "split_15K", "split_20K", "split_HALF",
+        "split_25K", "split_30K", "split_35K", "split_40K", "split_MARATHON"
+    )  # no __dict__: ~1M performances are kept in memory
+
     def __init__(self, url=None, raw_html=None):
         object.__init__(self)
 
@@ -73,8 +93,8 @@ class AthletePerformance(object):
             if self.url is None:
                 self.raw_html = None
             else:
-                self.raw_html = Webpage(self.url).get_html_source(
-                    tor=True)  # get html source of url
+                self.raw_html = get_html_source(
+                    self.url, tor=True)  # get html source of url (or cache)
 
     def parse_details(self):
         """
@@ -83,7 +103,7 @@ class AthletePerformance(object):
         """
 
         self.get_raw_html()  # get HTML page source
-        soup = BeautifulSoup(self.raw_html, "lxml")  # HTML parser
+        soup = parse_html(self.raw_html)  # HTML parser
         details_tables = soup.find_all("table", {
             "class": "list-table names"})  # tables with details about competition
 
@@ -118,6 +138,8 @@ class AthletePerformance(object):
         except:
             pass
 
+        self.raw_html = None  # page is not needed anymore
+
     def parse_runner_details(self, raw_html):
         """
         :param raw_html: HTML soup
@@ -318,6 +340,37 @@ class AthletePerformance(object):
         }
 
 
+def parse_performance(url, body):
+    """
+    :param url: str
+        Url of page
+    :param body: str
+        Raw HTML page of performance
+    :return: {}
+        Details of performance
+    """
+
+    athletic_performance = AthletePerformance(url=url,
+                                              raw_html=body)  # create obj
+    athletic_performance.parse_details()
+    return athletic_performance.to_dict()
+
+
+def get_saved_urls(out_path):
+    """
+    :param out_path: str
+        Path to .csv output file (possibly rotated in many parts)
+    :return: set of str
+        Urls of performances already in output
+    """
+
+    urls = set()
+    for path in get_part_paths(out_path):
+        if os.path.getsize(path) > 0:  # header is there
+            urls.update(iter_urls_in_csv(path, column="url"))
+    return urls
+
+
 class LondonMarathonBot(object):
     """ Scraper of London Marathon data"""
 
@@ -355,7 +408,7 @@ class LondonMarathonBot(object):
 
         results = []
         try:
-            soup = BeautifulSoup(page_source, "lxml")  # HTML parser
+            soup = parse_html(page_source)  # HTML parser
             table = soup.find_all("div", {"class": "list"})[
                 0]  # table with results
             table = table.find_all("table", {"class": "list-table"})[
@@ -419,6 +472,106 @@ class LondonMarathonBot(object):
 
         return data
 
+    async def async_get_urls_of_event_in_year(self, engine, year, event_id,
+                                              prefetch=PREFETCH_PAGES):
+        """
+        :param engine: FetchEngine
+            Engine to fetch pages with
+        :param year: int
+            Year
+        :param event_id: str
+            Event id (one of the keys of EVENTS)
+        :param prefetch: int
+            Pages fetched while waiting for the current one (pages past the
+            last one are cancelled as soon as an empty page is found)
+        :return: [] of str
+            List of url of results of event in year, page by page. Raises
+            IOError if a page cannot be fetched (it may not be the last one)
+        """
+
+        base_url = self.get_url_of_year(year)
+        pages = {}  # page -> task fetching it
+
+        async def fetch_page_source(url):
+            for _ in range(PAGE_ATTEMPTS):
+                page_source = await engine.fetch(url)  # None on failure
+                if page_source is not None:
+                    return page_source
+
+            print("\t!!!\tCannot get", url)
+            raise IOError("Cannot get page of results " + url)
+
+        def fetch_page(page):
+            url = self.get_url_of_event_in_year(year, event_id, page=page)
+            pages[page] = asyncio.ensure_future(fetch_page_source(url))
+
+        for page in range(1, max(1, prefetch) + 1):
+            fetch_page(page)
+
+        data = []
+        page = 1
+        try:
+            while True:
+                page_source = await pages.pop(page)
+                results = self.get_result_urls_from_page_source(page_source)
+                print(str(len(results)), "results from", str(event_id),
+                      str(year), "event (page", str(page) + ")")  # debug info
+                if not results:  # fetched and empty: next pages are too
+                    break
+
+                data += [base_url + str(r).strip() for r in results]
+                fetch_page(page + max(1, prefetch))  # keep window full
+                page += 1
+        finally:
+            for task in pages.values():
+                task.cancel()
+            await asyncio.gather(*pages.values(), return_exceptions=True)
+
+        return data
+
+    async def async_get_urls_of_years(self, years, prefetch=PREFETCH_PAGES,
+                                      engine=None):
+        """
+        :param years: [] of int
+            Years to get data of
+        :param prefetch: int
+            Pages of each event fetched ahead
+        :param engine: FetchEngine
+            Engine to fetch pages with (None for a new one, closed at end)
+        :return: {} of [] of str
+            Each key of the dictionary has the year, each value has the
+            results of that year (urls already found are skipped). Raises
+            IOError if a page of results cannot be fetched
+        """
+
+        own_engine = engine is None
+        if own_engine:
+            engine = FetchEngine()
+
+        pairs = [(year, e) for year in years for e in self.EVENTS.keys()]
+        tasks = [
+            asyncio.ensure_future(self.async_get_urls_of_event_in_year(
+                engine, year, e, prefetch=prefetch
+            )) for year, e in pairs
+        ]  # all events of all years at once
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()  # no-op for finished ones
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if own_engine:
+                await engine.close()
+
+        db_years = {str(year): [] for year in years}
+        seen = set()
+        for (year, _), urls in zip(pairs, results):
+            for url in urls:
+                if url not in seen:
+                    seen.add(url)
+                    db_years[str(year)].append(url)
+        return db_years
+
     def get_urls_of_years(self, years):
         """
         :param years: [] of int
@@ -438,11 +591,11 @@ class LondonMarathonBot(object):
         """
         :param urls: [] of str
             List of url of results of year
-        :return: [] of {}
-            Parses performances and returns list of details
+        :return: ResultsTable
+            Parses performances and returns their details (column by column)
         """
 
-        results = []
+        results = ResultsTable()
         start_time = int(time.time())  # get ms of day
         total = len(urls)
 
@@ -463,6 +616,81 @@ class LondonMarathonBot(object):
 
         return results
 
+    @staticmethod
+    def async_download_performance_details(urls, out_path,
+                                           max_concurrent=100, workers=0,
+                                           chunk_size=64, max_bytes=None):
+        """
+        :param urls: iterable of str
+            Urls of performances (e.g a generator): consumed lazily
+        :param out_path: str
+            Path to .csv output file: if it exists, performances already in
+            it are skipped and new ones are appended
+        :param max_concurrent: int
+            Max number of requests in flight
+        :param workers: int
+            Processes to parse pages in (0 = parse in event loop)
+        :param chunk_size: int
+            Pages sent to a process at once
+        :param max_bytes: int
+            Size of .csv files after which rows go to next file (None =
+            never)
+        :return: {}
+            Counters of fetched, failed, parsed, discarded and stored pages
+        """
+
+        parts = get_part_paths(out_path)
+        if parts:
+            trim_partial_row(parts[-1])  # e.g process killed while writing
+        saved = get_saved_urls(out_path)
+        if saved:
+            print("Resuming", out_path, "(" + str(len(saved)),
+                  "performances already saved)")
+        total = len(urls) if hasattr(urls, "__len__") else None
+        pending = (u for u in urls if u not in saved)
+        start_time = int(time.time())  # get ms of day
+
+        writer = CsvWriter(
+            out_path, append=True, max_bytes=max_bytes,
+            part=max(0, len(parts) - 1)
+        )  # rows are on disk as soon as they are parsed
+
+        def save_performance(details):
+            writer.write_row(details)
+            stored = pipeline.stats["stored"] + 1
+            if total is not None:
+                print_time_eta(
+                    get_time_eta(stored + len(saved), total, start_time)
+                )  # debug info
+            elif stored % ROWS_BETWEEN_PROGRESS == 0:
+                print(stored, "performances saved")  # debug info
+
+        def on_fetch_failure(url):
+            print("\t!!!\tCannot get performance", url,
+                  "(retried on next run)")
+
+        async def fetch_parse_and_save():
+            async with pipeline.engine:
+                return await pipeline.run(pending)
+
+        pipeline = Pipeline(
+            FetchEngine(),
+            parse_performance,
+            save_performance,
+            max_concurrent=max_concurrent,
+            on_failure=on_fetch_failure,
+            parse_workers=workers,
+            chunk_size=chunk_size
+        )  # pages are parsed and saved as soon as they are fetched
+        loop = asyncio.get_event_loop()
+        try:
+            stats = loop.run_until_complete(fetch_parse_and_save())
+        finally:
+            writer.close()  # keep details saved so far
+
+        print("Details saved to", out_path, stats)
+        return stats
+
 
 class StreamsBot(object):
     """ I/O on (generally) files with data about the London Marathon"""
@@ -480,33 +708,36 @@ class StreamsBot(object):
             Writes dict to csv
         """
 
-        df = pandas.DataFrame.from_dict(d)
+        df = pandas.DataFrame({
+            key: pandas.Series(values) for key, values in d.items()
+        })  # years may have different number of values
         df.to_csv(self.file_path, sep=",", quotechar="\"")
 
+    def iter_results_urls(self, dedupe=False):
+        """
+        :param dedupe: bool
+            True iff urls already seen are skipped
+        :return: generator of str
+            Urls of results in .csv (or plain-text) file, as they are read
+        """
+
+        return iter_urls(self.file_path, dedupe=dedupe)
+
     def read_results_url_from_csv(self):
         """
         :return: [] of str
             Reads from .csv file and returns list of url of results of year
         """
 
-        d = pandas.DataFrame.from_csv(self.file_path,
-                                      sep=",").to_dict()  # turn file into dict
-        big_dict = list(d.values())[
-            0]  # get raw values (big dataframe dictionary <i, value>
-        values = [str(v).strip() for v in big_dict.values()]  # get real value
-        return values
+        return list(self.iter_results_urls())
 
     def write_dicts_to_csv(self, dicts):
         """
         :param dicts: [] of {}
-            Dictionaries with same values
+            Dictionaries with same values (any iterable: they are written
+            one at a time)
         :return: void
             Saves .csv file with posts data
         """
 
-        csv_headers = dicts[0].keys()
-        with open(self.file_path, "w") as o:  # write to file
-            dict_writer = csv.DictWriter(o, csv_headers, delimiter=",",
-                                         quotechar="\"")
-            dict_writer.writeheader()
-            dict_writer.writerows(dicts)
+        write_dicts(dicts, self.file_path, fmt="csv")
@@ -18,9 +18,13 @@
 
 import argparse
 import os
+import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from models import NYCMarathonBot, NYCMarathonParser, StreamsBot
+from models import MAX_AGE, MIN_AGE, NYCMarathonBot, NYCMarathonParser
+
+from bots.core.writers import FORMATS, get_extension, get_writer
 
 
 def create_args():
@@ -30,12 +34,26 @@ def create_args():
     """
 
     parser = argparse.ArgumentParser(
-        usage="-y <years to fetch> -o <path to output folder>")
+        usage="-y <years to fetch> -o <path to output folder> "
+              "[--format csv|parquet|arrow] [--rotate-mb <MB>] "
+              "[--browsers <browsers>] [--age-step <years>]")
     parser.add_argument("-y", dest="years",
                         help="e.g '2017', '2014-2017', '2014,2016,2017'",
                         required=True)
     parser.add_argument("-o", dest="path_out", help="path to output folder",
                         required=True)
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of output files")
+    parser.add_argument("--rotate-mb", dest="rotate_mb", type=float,
+                        default=None,
+                        help="start a new .csv file every MB written")
+    parser.add_argument("--browsers", dest="browsers", type=int, default=1,
+                        help="headless browsers scraping in parallel, each "
+                             "on a year (or age bracket) of its own")
+    parser.add_argument("--age-step", dest="age_step", type=int,
+                        default=None,
+                        help="split each year in age brackets of this many "
+                             "years (e.g 10), downloaded separately")
     return parser
 
 
@@ -65,7 +83,12 @@ def parse_args(parser):
     except:
         years = None
 
-    return years, str(args.path_out)
+    max_bytes = None
+    if args.rotate_mb is not None:
+        max_bytes = int(args.rotate_mb * 1024 ** 2)
+
+    return years, str(args.path_out), str(args.fmt), max_bytes, \
+           max(1, int(args.browsers)), args.age_step
 
 
 def check_args(years, path_out):
@@ -88,46 +111,134 @@ def check_args(years, path_out):
     return True
 
 
-def download_year_results(year, out_path):
+def get_age_brackets(age_step=None):
+    """
+    :param age_step: int
+        Years in each bracket (None for a single bracket with all ages)
+    :return: [] of (int, int)
+        Min and max age of each bracket
+    """
+
+    if not age_step:
+        return [(MIN_AGE, MAX_AGE)]
+
+    return [
+        (age, min(age + age_step - 1, MAX_AGE))
+        for age in range(MIN_AGE, MAX_AGE + 1, age_step)
+    ]
+
+
+def download_year_results(year, out_path, fmt="csv", max_bytes=None,
+                          min_age=MIN_AGE, max_age=MAX_AGE, headless=False,
+                          bot=None):
     """
     :param year: int
         Year of marathon to get data about
     :param out_path: str
         Path where save data to
+    :param fmt: str
+        Format of output file
+    :param max_bytes: int
+        Size of .csv files after which results go to next file
+    :param min_age: int
+        Min age of runners to get
+    :param max_age: int
+        Max age of runners to get
+    :param headless: bool
+        True iff browser runs without a window
+    :param bot: NYCMarathonBot
+        Bot to scrape with, left open for next years (None for a new one,
+        closed when done)
     :return: void
-        Saves data to file
+        Saves data to file (each page of results as soon as it is fetched)
     """
 
-    bot = NYCMarathonBot()  # build bot to scrape data
-    data_tables = bot.get_data_tables_of_year(year)  # fetch data
-
-    data = []
-    for t in data_tables:  # parse data
-        data_table = NYCMarathonParser(t)
-        results = data_table.get_results()
-        data += results
-
-    csv_details = [d.to_dict() for d in data]  # convert to dict
+    name = str(year)
+    if (min_age, max_age) != (MIN_AGE, MAX_AGE):
+        name += "_" + str(min_age) + "-" + str(max_age)  # age bracket
     out_file = os.path.join(
         out_path,
-        str(year) + "_" + str(int(time.time())) + ".csv"
+        name + "_" + str(int(time.time())) + get_extension(fmt)
     )
-    StreamsBot(out_file).write_dicts_to_csv(csv_details)  # save to output file
+    writer = get_writer(out_file, fmt=fmt, max_bytes=max_bytes)
+    try:
+        close_browser = bot is None
+        if bot is None:
+            bot = NYCMarathonBot(headless=headless)  # build bot to scrape data
+        for t in bot.iter_data_tables_of_year(
+                year, min_age=min_age, max_age=max_age,
+                close_browser=close_browser):  # fetch data
+            writer.write(
+                d.to_dict() for d in NYCMarathonParser(t).get_results()
+            )  # parse data and save to output file
+    finally:
+        writer.close()  # keep results fetched so far
     print("Results saved to", out_file)
 
 
-def download_years_results(years, out_path):
+def download_years_results(years, out_path, fmt="csv", max_bytes=None,
+                           browsers=1, age_step=None):
     """
     :param years: [] of int
         Years of marathon to get data about
     :param out_path: str
         Path where save data to
+    :param fmt: str
+        Format of output files
+    :param max_bytes: int
+        Size of .csv files after which results go to next file
+    :param browsers: int
+        Number of browsers scraping at the same time (headless if more than
+        one), each on a year or age bracket of its own; they are started
+        once and reused for next years
+    :param age_step: int
+        Years in each age bracket (None to download each year at once)
     :return: void
-        Saves data to file
+        Saves data to files (one for each year or age bracket)
     """
 
-    for y in years:
-        download_year_results(y, out_path)
+    jobs = [
+        (y, min_age, max_age)
+        for y in years for min_age, max_age in get_age_brackets(age_step)
+    ]
+    browsers = max(1, min(browsers, len(jobs)))
+    bots = queue.Queue()  # browsers not scraping right now
+
+    def download(year, min_age, max_age):
+        bot = bots.get()  # a browser each: drivers run in their own processes
+        try:
+            download_year_results(
+                year, out_path, fmt=fmt, max_bytes=max_bytes,
+                min_age=min_age, max_age=max_age, bot=bot
+            )
+        finally:
+            bots.put(bot)  # next year (or age bracket) reuses browser
+
+    started = []
+    try:
+        for _ in range(browsers):
+            started.append(NYCMarathonBot(headless=browsers > 1))
+            bots.put(started[-1])
+
+        with ThreadPoolExecutor(max_workers=browsers) as pool:
+            futures = [
+                pool.submit(download, y, min_age, max_age)
+                for y, min_age, max_age in jobs
+            ]
+
+            for (y, min_age, max_age), future in zip(jobs, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print("\t!!!\tCannot download results of", str(y),
+                          "(ages " + str(min_age) + "-" + str(max_age) +
+                          "):", str(e))
+    finally:
+        for bot in started:
+            try:
+                bot.close()
+            except Exception as e:
+                print("\t!!!\tCannot close browser:", str(e))
 
 
 def download_results_in_range(min_y, max_y, out_path):
@@ -147,9 +258,11 @@ def download_results_in_range(min_y, max_y, out_path):
 
 
 def main():
-    years, path_out = parse_args(create_args())
+    years, path_out, fmt, max_bytes, browsers, age_step = parse_args(
+        create_args())
     if check_args(years, path_out):
-        download_years_results(years, path_out)
+        download_years_results(years, path_out, fmt=fmt, max_bytes=max_bytes,
+                               browsers=browsers, age_step=age_step)
     else:
         print("Error while parsing args.")
 
@@ -16,17 +16,26 @@
 # limitations under the License.
 
 
-import csv
 import string
 import time
 
 import pandas
-from bs4 import BeautifulSoup
 from hal.time.profile import get_time_eta, print_time_eta
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions
+from selenium.webdriver.support.ui import WebDriverWait
+
+from bots.core.markup import parse_html
+from bots.core.readers import iter_urls
+from bots.core.records import ResultsTable
+from bots.core.writers import write_dicts
 
 VALUE_NOT_FOUND = str("DNF")
 TOTAL_RUNNERS_IN_ONE_EVENT = 50000
+MIN_AGE = 0
+MAX_AGE = 99
 
 
 def get_text_or_dnf(raw_html):
@@ -46,6 +55,14 @@ def get_text_or_dnf(raw_html):
 class AthletePerformance(object):
     """ Models a performance in the marathon of an athlete """
 
+    __slots__ = (
+        "raw_html", "first_name", "last_name", "sex", "age", "nationality",
+        "team", "state", "bib", "place", "place_gender", "place_age",
+        "gun_time", "net_time", "split_5K", "split_10K", "split_15K",
+        "split_20K", "split_HALF", "split_25K", "split_30K", "split_35K",
+        "split_40K", "age_graded_time", "age_graded_performance"
+    )  # no __dict__: ~1M performances are kept in memory
+
     def __init__(self, raw_html):
         object.__init__(self)
 
@@ -87,13 +104,14 @@ class AthletePerformance(object):
            Parses webpage at url and saves details
         """
 
-        soup = BeautifulSoup(self.raw_html, "lxml")  # HTML parser
+        soup = parse_html(self.raw_html)  # HTML parser
         columns = soup.find_all("td")
 
         self.parse_runner_details(columns, headers)
         self.parse_standings_details(columns, headers)
         self.parse_splits_details(columns, headers)
         self.parse_performance_details(columns, headers)
+        self.raw_html = None  # row is not needed anymore
 
     def parse_runner_details(self, columns, headers):
         """
@@ -300,18 +318,68 @@ class NYCMarathonBot(object):
 
     ARCHIVE_SEARCH_FORM_URL = "http://web2.nyrrc.org/cgi-bin/start.cgi/mar-programs/archive/archive_search.html"
     BROWSER_WAIT_TIMEOUT_SECONDS = 3
+    MAX_WAIT_SECONDS = 60  # waits end as soon as page is there
+    WAIT_POLL_SECONDS = 0.1  # page is checked this often while waiting
 
-    def __init__(self):
+    def __init__(self, headless=False, browser=None):
         """
-        :param chromedriver_path: str
-            Path to Chrome driver to use as browser
+        :param headless: bool
+            True iff browser runs without a window (e.g many in parallel)
+        :param browser: WebDriver
+            Browser to drive (None for a new Firefox)
         """
 
         object.__init__(self)
-        self.browser = webdriver.Firefox()
+        if browser is None:
+            options = webdriver.FirefoxOptions()
+            if headless:
+                options.add_argument("-headless")
+            browser = webdriver.Firefox(options=options)
+        self.browser = browser
         self.browser.set_page_load_timeout(
             self.BROWSER_WAIT_TIMEOUT_SECONDS)  # seconds
 
+    def wait_for(self, condition):
+        """
+        :param condition: function(WebDriver)
+            Condition on page (e.g from selenium expected_conditions)
+        :return: bool
+            True iff condition holds before MAX_WAIT_SECONDS
+        """
+
+        try:
+            WebDriverWait(
+                self.browser, self.MAX_WAIT_SECONDS,
+                poll_frequency=self.WAIT_POLL_SECONDS
+            ).until(condition)  # polls page instead of sleeping a fixed time
+            return True
+        except TimeoutException:
+            print("\t!!!\tTimeout waiting for page of archive")
+            return False
+
+    def get_page_root(self):
+        """
+        :return: WebElement
+            Root of page in browser (stale once browser leaves page)
+        """
+
+        return self.browser.find_element(By.TAG_NAME, "html")
+
+    def wait_for_results_table(self, old_page):
+        """
+        :param old_page: WebElement
+            Root of page before browser was asked to leave it
+        :return: bool
+            True iff a new page with a table of results is loaded in time
+        """
+
+        return self.wait_for(expected_conditions.staleness_of(old_page)) \
+               and self.wait_for(
+            expected_conditions.presence_of_element_located(
+                (By.TAG_NAME, "table")
+            )
+        )
+
     def go_to_archive_search_form(self):
         """
         :return: void
@@ -320,14 +388,23 @@ class NYCMarathonBot(object):
 
         try:
             self.browser.get(self.ARCHIVE_SEARCH_FORM_URL)
-            time.sleep(self.BROWSER_WAIT_TIMEOUT_SECONDS)
         except:
-            pass
+            pass  # page load timeout: form may be there anyway
+        self.wait_for(
+            expected_conditions.presence_of_element_located(
+                (By.NAME, "input.searchyear")
+            )
+        )
 
-    def go_to_first_page_of_archive(self, year):
+    def go_to_first_page_of_archive(self, year, min_age=MIN_AGE,
+                                    max_age=MAX_AGE):
         """
         :param year: int
             Year of marathon to get data about
+        :param min_age: int
+            Min age of runners to get
+        :param max_age: int
+            Max age of runners to get
         :return: void
             Browser navigates to first page of archive
         """
@@ -340,13 +417,16 @@ class NYCMarathonBot(object):
         self.browser.execute_script(
             "document.getElementsByTagName(\"input\")[9].checked = true")  # check age method
         self.browser.execute_script(
-            "document.getElementsByName(\"input.f.age\")[0].value = \"0\"")  # choose min age
+            "document.getElementsByName(\"input.f.age\")[0].value = \"" + str(
+                min_age) + "\"")  # choose min age
         self.browser.execute_script(
-            "document.getElementsByName(\"input.t.age\")[0].value = \"99\"")  # choose max age
+            "document.getElementsByName(\"input.t.age\")[0].value = \"" + str(
+                max_age) + "\"")  # choose max age
 
+        old_page = self.get_page_root()
         self.browser.execute_script(
             "document.getElementsByTagName(\"form\")[0].submit()")  # submit form
-        time.sleep(self.BROWSER_WAIT_TIMEOUT_SECONDS)
+        self.wait_for_results_table(old_page)
 
     def get_raw_data(self):
         """
@@ -356,7 +436,7 @@ class NYCMarathonBot(object):
 
         try:
             page_source = str(self.browser.page_source)
-            soup = BeautifulSoup(page_source, "lxml")  # html parser
+            soup = parse_html(page_source)  # html parser
             table = soup.find_all("table")[0]
             rows = table.find_all("tr")[1:]
             return str(table), len(rows)
@@ -373,35 +453,65 @@ class NYCMarathonBot(object):
             has_next_page = self.browser.execute_script(
                 "l = document.getElementsByName(\"submit\"); s = l[l.length - 1]; return s.value.includes(\"Next\")")
             if has_next_page:
+                old_page = self.get_page_root()
                 self.browser.execute_script(
                     "l = document.getElementsByName(\"submit\"); s = l[l.length - 1]; s.click()")  # go to next page
-                time.sleep(self.BROWSER_WAIT_TIMEOUT_SECONDS)
-                return True
+                return self.wait_for_results_table(old_page)
             else:
                 return False
         except:
             return False
 
-    def get_data_tables_of_year(self, year):
+    def close(self):
+        """
+        :return: void
+            Closes browser (bot cannot be used anymore)
+        """
+
+        self.browser.close()  # close browser
+        self.browser.stop_client()
+        self.browser.quit()
+
+    def iter_data_tables_of_year(self, year, min_age=MIN_AGE,
+                                 max_age=MAX_AGE, close_browser=True):
         """
         :param year: int
             Year of marathon to get data about
-        :return: [] of str
-            List of raw HTML tablesof archive of year
+        :param min_age: int
+            Min age of runners to get
+        :param max_age: int
+            Max age of runners to get
+        :param close_browser: bool
+            True iff browser is closed when done (False to reuse it for
+            other years, closing it with close())
+        :return: generator of str
+            Raw HTML tables of archive of year, as soon as they are fetched
         """
 
-        list_tables = []  # list of raw table data of archive
         keep_going = True
         fetched_data_counter = 0  # counter of how many fetched pages
-        self.go_to_first_page_of_archive(year)  # get first page of archive
         start_time = time.time()
 
-        while keep_going:
-            try:
-                table_data, rows_counter = self.get_raw_data()
-                list_tables.append(table_data)
+        try:
+            self.go_to_first_page_of_archive(
+                year, min_age=min_age, max_age=max_age
+            )  # get first page of archive
+            while keep_going:
+                try:
+                    table_data, rows_counter = self.get_raw_data()
+                except Exception as e:
+                    print("\n\t!!!!!!!!!!!!!!!!!!!!\n\t", str(e),
+                          "\n\t!!!!!!!!!!!!!!!!!!!!\n\t\n")
+                    break
+
+                yield table_data  # parsed and saved before next page
                 fetched_data_counter += rows_counter
-                has_next_page = self.go_to_next_page_of_archive()
+                try:
+                    has_next_page = self.go_to_next_page_of_archive()
+                except Exception as e:
+                    print("\n\t!!!!!!!!!!!!!!!!!!!!\n\t", str(e),
+                          "\n\t!!!!!!!!!!!!!!!!!!!!\n\t\n")
+                    has_next_page = False
                 keep_going = (rows_counter > 0 and has_next_page)
 
                 print_time_eta(
@@ -410,16 +520,32 @@ class NYCMarathonBot(object):
                         start_time
                     )
                 )  # debug info
-            except Exception as e:
-                print("\n\t!!!!!!!!!!!!!!!!!!!!\n\t", str(e),
-                      "\n\t!!!!!!!!!!!!!!!!!!!!\n\t\n")
-                keep_going = False
+        finally:  # also when caller stops early
+            if close_browser:
+                self.close()
 
-        self.browser.close()  # close browser
-        self.browser.stop_client()
-        self.browser.quit()
+    def get_data_tables_of_year(self, year):
+        """
+        :param year: int
+            Year of marathon to get data about
+        :return: [] of str
+            List of raw HTML tablesof archive of year
+        """
 
-        return list_tables
+        return list(self.iter_data_tables_of_year(year))
+
+    def get_results_of_year(self, year):
+        """
+        :param year: int
+            Year of marathon to get data about
+        :return: ResultsTable
+            Results of year (column by column), parsed page by page
+        """
+
+        results = ResultsTable()
+        for t in self.iter_data_tables_of_year(year):
+            results.extend(NYCMarathonParser(t).get_results())
+        return results
 
 
 class NYCMarathonParser(object):
@@ -440,7 +566,7 @@ class NYCMarathonParser(object):
             Parses raw data and returns list of results
         """
 
-        soup = BeautifulSoup(self.data_table, "lxml")  # html parser
+        soup = parse_html(self.data_table)  # html parser
         rows = soup.find_all("tr")[1:]  # discard headers
         headers = [h.text for h in
                    soup.find_all("table")[0].find_all("tr")[0].find_all(
@@ -481,30 +607,31 @@ class StreamsBot(object):
         df = pandas.DataFrame.from_dict(d)
         df.to_csv(self.file_path, sep=",", quotechar="\"")
 
+    def iter_results_urls(self, dedupe=False):
+        """
+        :param dedupe: bool
+            True iff urls already seen are skipped
+        :return: generator of str
+            Urls of results in .csv (or plain-text) file, as they are read
+        """
+
+        return iter_urls(self.file_path, dedupe=dedupe)
+
     def read_results_url_from_csv(self):
         """
         :return: [] of str
             Reads from .csv file and returns list of url of results of year
         """
 
-        d = pandas.DataFrame.from_csv(self.file_path,
-                                      sep=",").to_dict()  # turn file into dict
-        big_dict = list(d.values())[
-            0]  # get raw values (big dataframe dictionary <i, value>
-        values = [str(v).strip() for v in big_dict.values()]  # get real value
-        return values
+        return list(self.iter_results_urls())
 
     def write_dicts_to_csv(self, dicts):
         """
         :param dicts: [] of {}
-            Dictionaries with same values
+            Dictionaries with same values (any iterable: they are written
+            one at a time)
         :return: void
             Saves .csv file with posts data
         """
 
-        csv_headers = dicts[0].keys()
-        with open(self.file_path, "w") as o:  # write to file
-            dict_writer = csv.DictWriter(o, csv_headers, delimiter=",",
-                                         quotechar="\"")
-            dict_writer.writeheader()
-            dict_writer.writerows(dicts)
+        write_dicts(dicts, self.file_path, fmt="csv")
@@ -16,6 +16,7 @@
 # limitations under the License.
 
 
+import argparse
 import json
 import os
 import time
@@ -23,7 +24,9 @@ import time
 from hal.files.models import Directory
 from hal.time.profile import print_time_eta, get_time_eta
 from pymongo import MongoClient
-from utils import get_dicts_from_csv
+from utils import get_dicts_from_csv, RACES_COLLECTION, RACES_INDEXES
+
+from bots.core.sinks import MongoSink
 
 PATH_TO_DATA_FOLDER = "/home/stefano/Coding/Data/projects/galore/running/ultramarathon/races/statistik-races/races_details/"
 VALUE_NOT_FOUND = str(
@@ -39,8 +42,33 @@ DATABASE_NAME = "statistik-races"  # name of database to use
 mongodb_client = MongoClient()  # mongodb client
 # mongodb_client.drop_database(DATABASE_NAME)  # remove all previous data in database
 db = mongodb_client[DATABASE_NAME]  # database to use
-for c in db.collection_names():
-    db[c].create_index("url", unique=True)  # set primary key
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(usage="[--single-collection]")
+    parser.add_argument("--single-collection", dest="single_collection",
+                        action="store_true",
+                        help="save all races in collection \"" +
+                             RACES_COLLECTION + "\" instead of one "
+                                                "collection per year")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: bool
+        True iff all races go in a single collection
+    """
+
+    args = parser.parse_args()
+    return bool(args.single_collection)
 
 
 def get_race_dict_from_files(details_file, results_file):
@@ -87,22 +115,22 @@ def get_dict_in_folder(dir_path):
 
 
 if __name__ == '__main__':
+    single_collection = parse_args(create_args())
     paths = Directory.ls(PATH_TO_DATA_FOLDER,
                          recurse=True)  # get list of files and folders to edit
     paths = [p for p in paths if os.path.isdir(p)]
     start_time = time.time()
     total = len(paths)
     total_done = 0
+    sink = MongoSink(db, indexes=RACES_INDEXES)  # written in batches
 
     for p in paths:
         d = get_dict_in_folder(p)
         if d is not None:
-            try:
-                db_table = str(d["date"]).split("/")[0]
-                db[db_table].insert_one(d)
-            except Exception as e:
-                if "duplicate key" not in str(e):
-                    print(str(e))
+            if single_collection:
+                sink.put(d, RACES_COLLECTION)
+            else:
+                sink.put(d, str(d["date"]).split("/")[0])
 
         total_done += 1
         print_time_eta(
@@ -112,3 +140,6 @@ if __name__ == '__main__':
                 start_time
             )  # get ETA
         )  # debug info
+
+    sink.flush()  # write last batches
+    sink.print_summary()
@@ -16,18 +16,21 @@
 # limitations under the License.
 
 
+import argparse
 import asyncio
-import csv
 import json
 import os
 import time
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
 from hal.time.profile import print_time_eta, get_time_eta
 from parsers import get_details_of_race_in_page
 from utils import append_to_file
 
+from bots.core.checkpoints import Checkpoint, COMPLETED, EMPTY, FAILED
+from bots.core.fetch import FetchEngine
+from bots.core.pipeline import Pipeline
+from bots.core.writers import FORMATS, get_extension, write_dicts
+
 VALUE_NOT_FOUND = str("DNF")
 BASE_URL = "http://statistik.d-u-v.org/"
 WEBPAGE_COOKIES = {
@@ -36,6 +39,43 @@ WEBPAGE_COOKIES = {
 LOG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                         str(os.path.basename(__file__)) + str(
                             int(time.time())) + ".log")
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               str(os.path.basename(__file__)).split(".")[
+                                   0] + ".checkpoint")  # races done so far
+
+
+def write_race_details_to_folder(details, results, out_dir, fmt="csv"):
+    """
+    :param details: {}
+        Race details
+    :param results: [] of {}
+        Race results
+    :param out_dir: str
+        Path to output folder
+    :param fmt: str
+        Format of results file
+    :return: void
+        Saves race details and results to folder
+    """
+
+    race_out_dir = os.path.join(out_dir, details["name"],
+                                details["distance"],
+                                details["date"].replace("/",
+                                                        "-"))  # specific folder for race
+    if not os.path.exists(race_out_dir):
+        os.makedirs(race_out_dir)  # prepare output directory
+
+    out_file = os.path.join(race_out_dir, "results" + get_extension(
+        fmt))  # output file for this race
+    if len(results) > 1:
+        write_dicts(results, out_file, fmt=fmt)  # race results (standings)
+
+    out_file_details = os.path.join(race_out_dir,
+                                    "details.json")  # output file for details
+    with open(out_file_details, "w") as o:  # write race details
+        json.dump(details, o, indent=4, sort_keys=True)
+
+    print("Output data written to", out_file)
 
 
 def save_race_details_to_file(raw_html, out_dir, url=None):
@@ -53,92 +93,114 @@ def save_race_details_to_file(raw_html, out_dir, url=None):
     try:
         details, results = get_details_of_race_in_page(raw_html,
                                                        url=url)  # parse page
-        race_out_dir = os.path.join(out_dir, details["name"],
-                                    details["distance"],
-                                    details["date"].replace("/",
-                                                            "-"))  # specific folder for race
-        if not os.path.exists(race_out_dir):
-            os.makedirs(race_out_dir)  # prepare output directory
-
-        out_file = os.path.join(race_out_dir,
-                                "results.csv")  # output file for this race
-        if len(results) > 1:
-            keys = results[0].keys()
-            with open(out_file,
-                      "w") as output_file:  # write race results (standings)
-                dict_writer = csv.DictWriter(output_file, keys, quotechar="\"",
-                                             delimiter=",")
-                dict_writer.writeheader()
-                dict_writer.writerows(results)
-
-        out_file_details = os.path.join(race_out_dir,
-                                        "details.json")  # output file for details
-        with open(out_file_details, "w") as o:  # write race details
-            json.dump(details, o, indent=4, sort_keys=True)
-
-        print("Output data written to", out_file)
+        write_race_details_to_folder(details, results, out_dir)
     except Exception as e:
         print("\t!!!\tErrors parsing url", str(url))
         print(str(e))
         append_to_file(LOG_FILE, "Errors parsing url " + str(url))
 
 
-async def try_and_fetch(u, max_attempts=8, time_delay_between_attempts=1):
+def get_id_of_url(u):
     """
     :param u: str
-        Url to fetch
-    :param max_attempts: int
-        Max number of attempts to get page
-    :param time_delay_between_attempts: float
-        Number of seconds to wait between 2 consecutive attempts
-    :return: str
-        Body of page with url or null
+        Url of race page
+    :return: int
+        Race id
+    """
+
+    return int(str(u).split("event=")[-1].split("&")[0])
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="[--resume] [--workers <processes>] [--chunk-size <pages>] "
+              "[--format csv|parquet|arrow]"
+    )
+    parser.add_argument("--resume", dest="resume", action="store_true",
+                        help="skip races already done in last run")
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=64, help="pages sent to a process at once")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of results files")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return bool(args.resume), int(args.workers), int(args.chunk_size), \
+           str(args.fmt)
+
+
+def on_fetch_failure(url):
+    checkpoint.mark(get_id_of_url(url), FAILED)
+
+
+def parse_race(url, body):
     """
+    :param url: str
+        Url of page
+    :param body: str
+        Raw HTML page of race
+    :return: str, {}, [] of {}
+        Url, race details and race results
+    """
+
+    details, results = get_details_of_race_in_page(body, url=url)
+    return url, details, results
 
-    for _ in range(max_attempts):
-        try:
-            conn = ProxyConnector(remote_resolve=True)
-            async with aiohttp.ClientSession(connector=conn,
-                                             request_class=ProxyClientRequest,
-                                             cookies=WEBPAGE_COOKIES) as session:
-                async with session.get(u,
-                                       proxy="socks5://127.0.0.1:9150") as response:
-                    body = await response.text()
-                    raw_sources.append({
-                        "url": str(u),
-                        "html": str(body)
-                    })  # add url and page source
-
-                    print_time_eta(
-                        get_time_eta(
-                            len(raw_sources),
-                            total,
-                            start_time
-                        )  # get ETA
-                    )  # debug info
-                    return body
-        except:
-            time.sleep(time_delay_between_attempts)
-    return None
-
-
-async def bound_fetch(sem, url):
-    async with sem:
-        await try_and_fetch(url, max_attempts=1, time_delay_between_attempts=0)
-
-
-async def fetch_urls(list_of_urls, max_concurrent=1000):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
-
-    responses = asyncio.gather(*tasks)
-    await responses
+
+def save_race(item):
+    """
+    :param item: str, {}, [] of {}
+        Url, race details and race results
+    :return: void
+        Saves race to output folder
+    """
+
+    url, details, results = item
+    if details["name"] == VALUE_NOT_FOUND:  # no race with this id
+        checkpoint.mark(get_id_of_url(url), EMPTY)
+        return
+
+    try:
+        write_race_details_to_folder(details, results, output_dir, fmt=fmt)
+        checkpoint.mark(get_id_of_url(url), COMPLETED)
+    except Exception as e:
+        print("\t!!!\tErrors saving url", str(url))
+        print(str(e))
+        append_to_file(LOG_FILE, "Errors parsing url " + str(url))
+        checkpoint.mark(get_id_of_url(url), FAILED)
+
+    print_time_eta(
+        get_time_eta(
+            pipeline.stats["stored"] + 1,
+            total,
+            start_time
+        )  # get ETA
+    )  # debug info
+
+
+async def fetch_parse_and_save(list_of_urls):
+    async with pipeline.engine:
+        return await pipeline.run(list_of_urls)
 
 
 if __name__ == '__main__':
+    resume, workers, chunk_size, fmt = parse_args(create_args())
     output_dir = "/home/stefano/Coding/Data/projects/galore/running/ultramarathon/races/statistik-races/races_details"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -148,29 +210,34 @@ if __name__ == '__main__':
     with open(list_of_urls_file, "r") as i:
         lines = i.readlines()
         lines = [str(l).strip() for l in lines]
-        pages_to_fetch = lines
-    raw_sources = []  # list of raw HTML pages to parse
-
-    print("Fetching HTML pages")
+        pages_to_fetch = [l for l in lines if l]
+
+    ids = [get_id_of_url(u) for u in pages_to_fetch]
+    checkpoint = Checkpoint(CHECKPOINT_FILE, min(ids), max(ids))
+    if resume and checkpoint.load():
+        checkpoint.print_summary()
+        pages_to_fetch = [
+            u for u, i in zip(pages_to_fetch, ids) if not checkpoint.is_done(i)
+        ]  # skip races already done
+
+    total = len(pages_to_fetch)
+    pipeline = Pipeline(
+        FetchEngine(cookies=WEBPAGE_COOKIES, log_file=LOG_FILE),
+        parse_race,
+        save_race,
+        on_failure=on_fetch_failure,
+        on_discard=on_fetch_failure,
+        parse_workers=workers,
+        chunk_size=chunk_size
+    )  # pages are parsed and saved as soon as they are fetched
+
+    print("Fetching HTML pages and saving races results")
     start_time = time.time()
     loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(fetch_urls(pages_to_fetch))  # fetch sources
-    loop.run_until_complete(future)
+    future = asyncio.ensure_future(fetch_parse_and_save(pages_to_fetch))
+    try:
+        loop.run_until_complete(future)
+    finally:
+        checkpoint.flush()  # keep progress even if interrupted
     loop.close()
-
-    print("Saving races results")
-    start_time = time.time()
-    saved_races = 0  # counter of how many races have been saved
-    total = len(raw_sources)
-    for k in raw_sources:
-        page_source = k["html"]
-        save_race_details_to_file(page_source, output_dir, url=k["url"])
-
-        saved_races += 1
-        print_time_eta(
-            get_time_eta(
-                saved_races,
-                total,
-                start_time
-            )  # get ETA
-        )  # debug info
+    checkpoint.print_summary()
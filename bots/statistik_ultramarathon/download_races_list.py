@@ -18,15 +18,15 @@
 
 import argparse
 import asyncio
-import csv
 import os
 import time
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
 from bs4 import BeautifulSoup
 from hal.time.profile import print_time_eta, get_time_eta
 
+from bots.core.fetch import FetchEngine
+from bots.core.writers import FORMATS, write_dicts
+
 VALUE_NOT_FOUND = "DNF"
 BASE_URL = "http://statistik.d-u-v.org/"
 
@@ -50,9 +50,12 @@ def create_args():
     """
 
     parser = argparse.ArgumentParser(
-        usage="-of <path to file to dump data to>")
+        usage="-f <path to file to dump data to> "
+              "[--format csv|parquet|arrow]")
     parser.add_argument("-f", dest="path_file", help="path to output file",
                         required=True)
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of output file")
     return parser
 
 
@@ -65,7 +68,7 @@ def parse_args(parser):
     """
 
     args = parser.parse_args()
-    return str(args.path_file)
+    return str(args.path_file), str(args.fmt)
 
 
 def check_args(path_file):
@@ -119,50 +122,37 @@ def get_list_of_races(list_of_pages):
     return details
 
 
-async def fetch(u):
-    try:
-        conn = ProxyConnector(remote_resolve=True)
-        async with aiohttp.ClientSession(connector=conn,
-                                         request_class=ProxyClientRequest) as session:
-            async with session.get(u,
-                                   proxy="socks5://127.0.0.1:9150") as response:
-                print_time_eta(
-                    get_time_eta(
-                        len(raw_sources),
-                        total_pages,
-                        start_time
-                    )  # get ETA
-                )  # debug info
-
-                body = await response.text()
-                raw_sources.append(str(body))  # add url and page source
-
-                if response.status != 200:
-                    print(response.status, u)
-                return body
-    except Exception as e:
-        print(str(e))
-        return ""
+def save_raw_source(url, body):
+    """
+    :param url: str
+        Url of page
+    :param body: str
+        Body of page with url or null
+    :return: void
+        Keeps page source to parse later
+    """
 
+    if body is None:
+        return
 
-async def bound_fetch(sem, url):
-    async with sem:
-        await fetch(url)
+    raw_sources.append(str(body))  # add page source
+    print_time_eta(
+        get_time_eta(
+            len(raw_sources),
+            total_pages,
+            start_time
+        )  # get ETA
+    )  # debug info
 
 
 async def fetch_urls(list_of_urls, max_concurrent=1000):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
-
-    responses = asyncio.gather(*tasks)
-    await responses
+    async with FetchEngine() as engine:
+        await engine.fetch_many(list_of_urls, max_concurrent=max_concurrent,
+                                callback=save_raw_source)
 
 
 if __name__ == '__main__':
-    path_out = parse_args(create_args())
+    path_out, fmt = parse_args(create_args())
     if check_args(path_out):
         raw_sources = []  # list of raw HTML pages to parse
         total_pages = 38
@@ -180,12 +170,7 @@ if __name__ == '__main__':
         print("Parsing HTML pages")
         details = get_list_of_races(raw_sources)
 
-        keys = details[0].keys()
-        with open(path_out, "w") as output_file:
-            dict_writer = csv.DictWriter(output_file, keys, quotechar="\"",
-                                         delimiter=",")
-            dict_writer.writeheader()
-            dict_writer.writerows(details)
+        write_dicts(details, path_out, fmt=fmt)
         print("Output data written to", path_out)
     else:
         print("Error while parsing args.")
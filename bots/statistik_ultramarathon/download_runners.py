@@ -18,17 +18,18 @@
 
 import argparse
 import asyncio
-import csv
 import json
 import os
 import time
 from datetime import datetime
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
-from bs4 import BeautifulSoup
 from hal.time.profile import print_time_eta, get_time_eta
 
+from bots.core.fetch import FetchEngine
+from bots.core.markup import parse_html
+from bots.core.pipeline import Pipeline
+from bots.core.writers import FORMATS, get_extension, write_dicts
+
 VALUE_NOT_FOUND = str("DNF")
 BASE_URL = "http://statistik.d-u-v.org/"
 WEBPAGE_COOKIES = {
@@ -92,9 +93,18 @@ def create_args():
         Parser that handles cmd arguments.
     """
 
-    parser = argparse.ArgumentParser(usage="-of <path to output folder>")
+    parser = argparse.ArgumentParser(
+        usage="-f <path to output folder> [--workers <processes>] "
+              "[--chunk-size <pages>] [--format csv|parquet|arrow]"
+    )
     parser.add_argument("-f", dest="path", help="path to output folder",
                         required=True)
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=64, help="pages sent to a process at once")
+    parser.add_argument("--format", dest="fmt", choices=FORMATS,
+                        default="csv", help="format of results files")
     return parser
 
 
@@ -107,7 +117,8 @@ def parse_args(parser):
     """
 
     args = parser.parse_args()
-    return str(args.path)
+    return str(args.path), int(args.workers), int(args.chunk_size), \
+           str(args.fmt)
 
 
 def check_args(path):
@@ -133,7 +144,21 @@ def get_runner_details(raw_html, url=None):
         List of runner details
     """
 
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
+    return parse_runner_details(
+        parse_html(str(raw_html), tables_only=True), url=url
+    )
+
+
+def parse_runner_details(soup, url=None):
+    """
+    :param soup: HTML tree
+        Tree of runner page
+    :param url: str
+        Url of this page
+    :return: {}
+        List of runner details
+    """
+
     rows = soup.find_all("table")[2].find_all("tr")  # rows of table
     details = {}  # output dictionary
 
@@ -194,18 +219,30 @@ def get_runner_results(raw_html):
         List of runner results
     """
 
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
+    return parse_runner_results(
+        parse_html(str(raw_html), tables_only=True)
+    )
+
+
+def parse_runner_results(soup):
+    """
+    :param soup: HTML tree
+        Tree of runner page
+    :return: [] of {}
+        List of runner results
+    """
+
     rows = soup.find_all("table")[4].find_all("tr")  # rows of table
-    rows = [r for r in rows if len(r.find_all("td")) > 2]  # discard jibberish
+    rows = [r.find_all("td") for r in rows]  # columns of each row
+    rows = [r for r in rows if len(r) > 2]  # discard jibberish
     if len(rows) % 2 != 0:  # rows should be even
         rows = rows[:-1]  # remove last item
-    rows = [BeautifulSoup(str(rows[i]) + str(rows[i + 1]), "lxml") for i in
+    rows = [rows[i] + rows[i + 1] for i in
             range(0, len(rows), 2)]  # merge following rows
     results = []
-    for r in rows:
+    for columns in rows:
         try:
             race_details = {}  # race details
-            columns = r.find_all("td")  # columns in table row
 
             try:
                 race_details["date"] = str(columns[0].text).strip()
@@ -277,15 +314,52 @@ def get_details_of_runner_in_page(raw_html, url=None):
         List of runner details, list of runner results
     """
 
-    details = get_runner_details(raw_html, url=url)
+    soup = parse_html(str(raw_html),
+                      tables_only=True)  # parsed once for both tables
+    details = parse_runner_details(soup, url=url)
     try:
-        results = get_runner_results(raw_html)
+        results = parse_runner_results(soup)
     except:
         results = []
 
     return details, results
 
 
+def write_runner_details_to_folder(details, results, out_dir, fmt="csv"):
+    """
+    :param details: {}
+        Runner details
+    :param results: [] of {}
+        Runner results
+    :param out_dir: str
+        Path to output folder
+    :param fmt: str
+        Format of results file
+    :return: void
+        Saves runner details and results to folder
+    """
+
+    runner_out_dir = os.path.join(out_dir, details["birth_date"],
+                                  details["nationality"],
+                                  details[
+                                      "name"])  # specific folder for race
+    if not os.path.exists(runner_out_dir):
+        os.makedirs(runner_out_dir)  # prepare output directory
+
+    out_file = os.path.join(runner_out_dir,
+                            "details.json")  # output file for details
+    with open(out_file, "w", buffering=1) as o:  # use buffer
+        json.dump(details, o, indent=4, sort_keys=True)
+        o.flush()
+
+    if len(results) > 1:
+        out_file = os.path.join(runner_out_dir, "results" + get_extension(
+            fmt))  # output file for this runner
+        write_dicts(results, out_file, fmt=fmt)
+
+    print("Output data written to", runner_out_dir.replace(out_dir, ""))
+
+
 def save_runner_details_to_file(raw_html, out_dir, url=None):
     """
     :param raw_html: str
@@ -301,122 +375,81 @@ def save_runner_details_to_file(raw_html, out_dir, url=None):
     try:
         details, results = get_details_of_runner_in_page(raw_html,
                                                          url=url)  # parse page
-        runner_out_dir = os.path.join(out_dir, details["birth_date"],
-                                      details["nationality"],
-                                      details[
-                                          "name"])  # specific folder for race
-        if not os.path.exists(runner_out_dir):
-            os.makedirs(runner_out_dir)  # prepare output directory
-
-        out_file = os.path.join(runner_out_dir,
-                                "details.json")  # output file for details
-        with open(out_file, "w", buffering=1) as o:  # use buffer
-            json.dump(details, o, indent=4, sort_keys=True)
-            o.flush()
-
-        if len(results) > 1:
-            out_file = os.path.join(runner_out_dir,
-                                    "results.csv")  # output file for this runner
-            keys = results[0].keys()
-            with open(out_file, "w", buffering=1) as o:  # use buffer
-                dict_writer = csv.DictWriter(o, keys, quotechar="\"",
-                                             delimiter=",")
-                dict_writer.writeheader()
-                dict_writer.writerows(results)
-                o.flush()
-
-        print("Output data written to", runner_out_dir.replace(out_dir, ""))
+        write_runner_details_to_folder(details, results, out_dir)
     except Exception as e:
         print("\t!!!\tErrors parsing url", str(url))
         append_to_file(LOG_FILE, "Errors parsing url " + str(url))
         append_to_file(LOG_FILE, "\t" + str(e) + "\n")
 
 
-async def fetch(u):
-    try:
-        conn = ProxyConnector(remote_resolve=True)
-        async with aiohttp.ClientSession(connector=conn,
-                                         request_class=ProxyClientRequest,
-                                         cookies=WEBPAGE_COOKIES) as session:
-            async with session.get(u,
-                                   proxy="socks5://127.0.0.1:9150") as response:
-                body = await response.text()
-                raw_sources.append({
-                    "url": str(u),
-                    "html": str(body)
-                })  # add url and page source
-
-                print_time_eta(
-                    get_time_eta(
-                        len(raw_sources),
-                        total,
-                        start_time
-                    )  # get ETA
-                )  # debug info
-                return body
-    except:
-        print("\t!!!\tErrors fetching url", str(u))
-        append_to_file(LOG_FILE, "Errors fetching url " + str(u))
-        return ""
+def parse_runner(url, body):
+    """
+    :param url: str
+        Url of page
+    :param body: str
+        Raw HTML page of runner
+    :return: str, {}, [] of {}
+        Url, runner details and runner results
+    """
+
+    details, results = get_details_of_runner_in_page(body, url=url)
+    return url, details, results
 
 
-async def bound_fetch(sem, url):
-    async with sem:
-        await fetch(url)
+def save_runner(item):
+    """
+    :param item: str, {}, [] of {}
+        Url, runner details and runner results
+    :return: void
+        Saves runner to output folder
+    """
 
+    url, details, results = item
+    try:
+        write_runner_details_to_folder(details, results, output_dir, fmt=fmt)
+    except Exception as e:
+        print("\t!!!\tErrors saving url", str(url))
+        append_to_file(LOG_FILE, "Errors saving url " + str(url))
+        append_to_file(LOG_FILE, "\t" + str(e) + "\n")
 
-async def fetch_urls(list_of_urls, max_concurrent=1000):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
+    print_time_eta(
+        get_time_eta(
+            pipeline.stats["stored"] + 1,
+            total,
+            start_time
+        )  # get ETA
+    )  # debug info
 
-    responses = asyncio.gather(*tasks)
-    await responses
+
+async def fetch_parse_and_save(list_of_urls):
+    async with pipeline.engine:
+        return await pipeline.run(list_of_urls)
 
 
 if __name__ == '__main__':
-    path_in = parse_args(create_args())
+    path_in, workers, chunk_size, fmt = parse_args(create_args())
     if check_args(path_in):
         output_dir = os.path.join(path_in)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)  # prepare output directory
 
-        urls_list = [get_url_of_page(p) for p in
+        urls_list = (get_url_of_page(p) for p in
                      range(MIN_RUNNER_PAGE,
-                           MAX_RUNNER_PAGE + 1)]  # get list of races from input file
-        total = len(urls_list)
-        raw_sources = []  # list of raw HTML pages to parse
-
-        print("Fetching HTML pages")
+                           MAX_RUNNER_PAGE + 1))  # lazy list of urls
+        total = MAX_RUNNER_PAGE - MIN_RUNNER_PAGE + 1
+        pipeline = Pipeline(
+            FetchEngine(cookies=WEBPAGE_COOKIES, log_file=LOG_FILE),
+            parse_runner,
+            save_runner,
+            parse_workers=workers,
+            chunk_size=chunk_size
+        )  # pages are parsed and saved as soon as they are fetched
+
+        print("Fetching HTML pages and saving runners")
         start_time = time.time()
         loop = asyncio.get_event_loop()
-        future = asyncio.ensure_future(fetch_urls(urls_list))  # fetch sources
+        future = asyncio.ensure_future(fetch_parse_and_save(urls_list))
         loop.run_until_complete(future)
         loop.close()
-
-        urls_list = None  # free memory
-
-        print("Saving races results")
-        start_time = time.time()
-        for i in range(len(raw_sources)):
-            page_source = raw_sources[i]["html"]
-            save_runner_details_to_file(
-                page_source,
-                output_dir,
-                url=raw_sources[i]["url"]
-            )
-            print_time_eta(
-                get_time_eta(
-                    i + 1,
-                    total,
-                    start_time
-                )  # get ETA
-            )  # debug info
-
-            raw_sources[i] = None  # free memory
-            force_garbage_collect()
-            print("\tMemory used:", get_memory_usage(), "MB")
     else:
         print("Error while parsing args.")
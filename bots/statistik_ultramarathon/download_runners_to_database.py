@@ -16,19 +16,24 @@
 # limitations under the License.
 
 
+import argparse
 import asyncio
 import os
 import time
 from datetime import datetime
 from datetime import timedelta
 
-import aiohttp
-from aiosocks.connector import ProxyConnector, ProxyClientRequest
-from hal.profile.mem import get_memory_usage, force_garbage_collect
+from hal.profile.mem import get_memory_usage
 from hal.time.profile import print_time_eta, get_time_eta
+from motor.motor_asyncio import AsyncIOMotorClient
 from parsers import get_runner_details_as_dict
-from pymongo import MongoClient
-from utils import append_to_file
+from utils import append_to_file, VALUE_NOT_FOUND, ATHLETES_COLLECTION, \
+    ATHLETES_INDEXES
+
+from bots.core.checkpoints import Checkpoint, COMPLETED, EMPTY, FAILED
+from bots.core.fetch import FetchEngine
+from bots.core.pipeline import Pipeline
+from bots.core.sinks import AsyncMongoSink, REJECTED
 
 BASE_URL = "http://statistik.d-u-v.org/"  # url of web-page
 WEBPAGE_COOKIES = {
@@ -37,16 +42,14 @@ WEBPAGE_COOKIES = {
 LOG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                         str(os.path.basename(__file__)).split(".")[
                             0] + "-" + str(int(time.time())) + ".log")
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               str(os.path.basename(__file__)).split(".")[
+                                   0] + ".checkpoint")  # runners done so far
 MIN_RUNNER_PAGE = 1  # minimum page where to find runner
 MAX_RUNNER_PAGE = 946959  # maximum page where to find runner
 
 DATABASE_NAME = "statistik-athletes"  # name of mongodb database to use
 COLLECTIONS_KEY = "birth_year"  # key to divide athletes in each collections
-mongodb_client = MongoClient()  # mongodb client
-# mongodb_client.drop_database(DATABASE_NAME)  # remove all previous data in database
-db = mongodb_client[DATABASE_NAME]  # database to use
-for c in db.collection_names():
-    db[c].create_index("url", unique=True)  # set primary key
 
 
 def get_url_of_page(p):
@@ -60,110 +63,163 @@ def get_url_of_page(p):
     return BASE_URL + "getresultperson.php?runner=" + str(p)
 
 
-async def try_and_fetch(u, max_attempts=8, time_delay_between_attempts=1):
+def get_id_of_url(u):
     """
     :param u: str
-        Url to fetch
-    :param max_attempts: int
-        Max number of attempts to get page
-    :param time_delay_between_attempts: float
-        Number of seconds to wait between 2 consecutive attempts
-    :return: str
-        Body of page with url or null
+        Url of runner page
+    :return: int
+        Runner id
+    """
+
+    return int(str(u).split("runner=")[-1])
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="[--resume] [--workers <processes>] [--chunk-size <pages>] "
+              "[--single-collection]"
+    )
+    parser.add_argument("--resume", dest="resume", action="store_true",
+                        help="skip runners already done in last run")
+    parser.add_argument("--workers", dest="workers", type=int, default=0,
+                        help="processes to parse pages in (0 = none)")
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int,
+                        default=64, help="pages sent to a process at once")
+    parser.add_argument("--single-collection", dest="single_collection",
+                        action="store_true",
+                        help="save all athletes in collection \"" +
+                             ATHLETES_COLLECTION + "\" instead of one "
+                                                   "collection per birth year")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return bool(args.resume), int(args.workers), int(args.chunk_size), \
+           bool(args.single_collection)
+
+
+def on_fetch_failure(url):
+    checkpoint.mark(get_id_of_url(url), FAILED)
+
+
+def parse_runner(url, body):
+    """
+    :param url: str
+        Url of page
+    :param body: str
+        Raw HTML page of runner
+    :return: {}
+        Runner details as dict (None if page cannot be parsed)
     """
 
-    for _ in range(max_attempts):
+    return get_runner_details_as_dict(body, url=url, log_file=LOG_FILE)
+
+
+def on_runner_written(d, outcome):
+    """
+    :param d: {}
+        Runner details
+    :param outcome: str
+        Outcome of write to database
+    :return: void
+        Records state of runner
+    """
+
+    if outcome == REJECTED:
+        append_to_file(LOG_FILE, "Cannot save url " + str(d["url"]))
+        checkpoint.mark(get_id_of_url(d["url"]), FAILED)
+    else:  # inserted now or in a previous run
+        checkpoint.mark(get_id_of_url(d["url"]), COMPLETED)
+
+
+async def save_runner(d):
+    """
+    :param d: {}
+        Runner details
+    :return: void
+        Saves runner to database (in next batch, waiting while database is
+        behind)
+    """
+
+    if d["name"] == VALUE_NOT_FOUND:  # no runner with this id
+        checkpoint.mark(get_id_of_url(d["url"]), EMPTY)
+        return
+
+    if single_collection:
+        await sink.put(d, ATHLETES_COLLECTION)
+    else:
+        await sink.put(d, d[COLLECTIONS_KEY])
+
+    print_time_eta(
+        get_time_eta(
+            pipeline.stats["stored"] + 1,
+            total,
+            start_time
+        ),  # get ETA
+        note="Queued for database"
+    )  # debug info
+
+
+async def fetch_parse_and_save(list_of_urls):
+    async with pipeline.engine:
         try:
-            conn = ProxyConnector(remote_resolve=True)
-            async with aiohttp.ClientSession(connector=conn,
-                                             request_class=ProxyClientRequest,
-                                             cookies=WEBPAGE_COOKIES) as session:
-                async with session.get(u,
-                                       proxy="socks5://127.0.0.1:9150") as response:
-                    body = await response.text()
-                    raw_sources.append({
-                        "url": str(u),
-                        "html": str(body)
-                    })  # add url and page source
-
-                    print_time_eta(
-                        get_time_eta(
-                            len(raw_sources),
-                            total,
-                            start_time
-                        ),  # get ETA
-                        note="Got HTML"
-                    )  # debug info
-                    return body
-        except:
-            time.sleep(time_delay_between_attempts)
-            append_to_file(LOG_FILE, "Cannot get url " + str(u))
-    return None
-
-
-async def bound_fetch(sem, url):
-    async with sem:
-        await try_and_fetch(url, max_attempts=1, time_delay_between_attempts=0)
-
-
-async def fetch_urls(list_of_urls, max_concurrent=1000):
-    tasks = []
-    sem = asyncio.Semaphore(max_concurrent)
-    for u in list_of_urls:
-        task = asyncio.ensure_future(bound_fetch(sem, u))
-        tasks.append(task)
-
-    responses = asyncio.gather(*tasks)
-    await responses
+            return await pipeline.run(list_of_urls)
+        finally:
+            await sink.flush()  # write last batches
 
 
 if __name__ == "__main__":
+    resume, workers, chunk_size, single_collection = parse_args(
+        create_args())
     start_time_overall = time.time()
-    urls_list = [get_url_of_page(p) for p in
-                 range(MIN_RUNNER_PAGE,
-                       MAX_RUNNER_PAGE + 1)]  # get list of urls
-    total = len(urls_list)
-    raw_sources = []  # list of raw HTML pages to parse
-
-    print("\tFetching HTML pages")
+    checkpoint = Checkpoint(CHECKPOINT_FILE, MIN_RUNNER_PAGE, MAX_RUNNER_PAGE)
+    if resume and checkpoint.load():
+        checkpoint.print_summary()
+
+    urls_list = (get_url_of_page(p) for p in
+                 checkpoint.get_pending_ids())  # lazy list of urls
+    total = MAX_RUNNER_PAGE - MIN_RUNNER_PAGE + 1 - \
+            checkpoint.count(COMPLETED) - checkpoint.count(EMPTY)
+    pipeline = Pipeline(
+        FetchEngine(cookies=WEBPAGE_COOKIES, log_file=LOG_FILE),
+        parse_runner,
+        save_runner,
+        on_failure=on_fetch_failure,
+        on_discard=on_fetch_failure,
+        parse_workers=workers,
+        chunk_size=chunk_size
+    )  # pages are parsed and saved as soon as they are fetched
+
+    print("\tFetching, parsing and saving HTML pages")
     start_time = time.time()
     loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(fetch_urls(urls_list))  # fetch sources
-    loop.run_until_complete(future)
+    motor_client = AsyncIOMotorClient()  # writes while pages are fetched
+    sink = AsyncMongoSink(motor_client[DATABASE_NAME],
+                          on_written=on_runner_written,
+                          indexes=ATHLETES_INDEXES)
+    future = asyncio.ensure_future(fetch_parse_and_save(urls_list))
+    try:
+        loop.run_until_complete(future)
+    finally:
+        checkpoint.flush()  # keep progress even if interrupted
     loop.close()
+    motor_client.close()  # close mongodb connection
 
-    print("\tGarbage-collecting useless stuff")
-    urls_list = None  # free memory
-    force_garbage_collect()
-    total = len(raw_sources)
-
-    print("\tParsing HTML pages")
-    start_time = time.time()
-    for i in range(len(raw_sources)):
-        d = get_runner_details_as_dict(
-            raw_sources[i]["html"],
-            url=raw_sources[i]["url"],
-            log_file=LOG_FILE
-        )  # get details
-
-        if d is not None:
-            try:
-                db[str(d[COLLECTIONS_KEY])].insert_one(d)
-                raw_sources[i] = None  # release memory
-            except Exception as e:
-                if "duplicate key error" not in str(e):
-                    append_to_file(LOG_FILE, str(e))
-
-        print_time_eta(
-            get_time_eta(
-                i + 1,
-                total,
-                start_time
-            ),  # get ETA
-            note="Saved to database"
-        )  # debug info
-
-    mongodb_client.close()  # close mongodb connection
+    sink.print_summary()
+    checkpoint.print_summary()
 
     end_time_overall = time.time()
     delta_time_overall = end_time_overall - start_time_overall
@@ -0,0 +1,123 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Moves athletes (or races) of one collection per year into one collection """
+
+import argparse
+import time
+
+from hal.time.profile import print_time_eta, get_time_eta
+from pymongo import MongoClient
+from utils import ATHLETES_COLLECTION, ATHLETES_INDEXES, RACES_COLLECTION, \
+    RACES_INDEXES
+
+from bots.core.sinks import MongoSink, REJECTED
+
+DATABASES = {
+    "athletes": ("statistik-athletes", ATHLETES_COLLECTION, ATHLETES_INDEXES),
+    "races": ("statistik-races", RACES_COLLECTION, RACES_INDEXES)
+}  # what to merge -> database, single collection, indexes of collection
+
+
+def create_args():
+    """
+    :return: ArgumentParser
+        Parser that handles cmd arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        usage="-d athletes|races [--drop] [--batch-size <documents>]"
+    )
+    parser.add_argument("-d", dest="database", required=True,
+                        choices=sorted(DATABASES.keys()),
+                        help="database to merge collections of")
+    parser.add_argument("--drop", dest="drop", action="store_true",
+                        help="drop each collection once all its documents "
+                             "are merged")
+    parser.add_argument("--batch-size", dest="batch_size", type=int,
+                        default=1000, help="documents written at once")
+    return parser
+
+
+def parse_args(parser):
+    """
+    :param parser: ArgumentParser
+        Object that holds cmd arguments.
+    :return: tuple
+        Values of arguments.
+    """
+
+    args = parser.parse_args()
+    return str(args.database), bool(args.drop), int(args.batch_size)
+
+
+def merge_collections(db, target, indexes, drop=False, batch_size=1000):
+    """
+    :param db: pymongo.database.Database
+        Database with one collection per year
+    :param target: str
+        Name of single collection
+    :param indexes: [] of pymongo.IndexModel
+        Indexes of single collection
+    :param drop: bool
+        True iff collections merged with no rejected document are dropped
+    :param batch_size: int
+        Max number of documents written at once
+    :return: MongoSink
+        Sink that wrote documents (with stats of writes)
+    """
+
+    sink = MongoSink(db, batch_size=batch_size, indexes=indexes)
+    sources = sorted(
+        c for c in db.list_collection_names()
+        if c != target and not c.startswith("system.")
+    )
+    start_time = time.time()
+    for i, source in enumerate(sources):
+        rejected = sink.stats[REJECTED]
+        for d in db[source].find():  # _id is kept: merging again is a no-op
+            sink.put(d, target)
+        sink.flush()  # all documents of source are written
+
+        if sink.stats[REJECTED] > rejected:
+            print("\t!!!\tKeeping", source + ":", sink.stats[REJECTED] -
+                  rejected, "documents could not be merged")
+        elif drop:
+            db.drop_collection(source)
+
+        print_time_eta(
+            get_time_eta(
+                i + 1,
+                len(sources),
+                start_time
+            ),  # get ETA
+            note="Merged " + source
+        )  # debug info
+    return sink
+
+
+if __name__ == "__main__":
+    database, drop, batch_size = parse_args(create_args())
+    database_name, collection, collection_indexes = DATABASES[database]
+
+    mongodb_client = MongoClient()  # mongodb client
+    merge_collections(
+        mongodb_client[database_name], collection, collection_indexes,
+        drop=drop, batch_size=batch_size
+    ).print_summary()
+    mongodb_client.close()  # close mongodb connection
@@ -18,10 +18,11 @@
 
 from datetime import datetime
 
-from bs4 import BeautifulSoup
-from hal.time.utils import get_seconds
 from utils import append_to_file, VALUE_NOT_FOUND
 
+from bots.core.durations import parse_durations, format_duration
+from bots.core.markup import parse_html
+
 
 def remove_all_malformed_unicode(s):
     """
@@ -50,7 +51,7 @@ def get_details_of_race_in_page(raw_html, url=None):
 
     race_results = []
     race_distance_km = VALUE_NOT_FOUND  # distance of race in km
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
+    soup = parse_html(str(raw_html), tables_only=True)  # HTML parser
     try:
         rows = soup.find_all("table")[4].find_all("tr")  # rows of table
         headers = rows[0].find_all("th")  # column names
@@ -66,21 +67,23 @@ def get_details_of_race_in_page(raw_html, url=None):
                     except:
                         d[headers[i]] = VALUE_NOT_FOUND
 
-                try:  # try parse performance time and compute distance
-                    time_performance = datetime.strptime(d["Performance"],
-                                                         "%H:%M:%S h")
-                    time_hours = get_seconds(
-                        time_performance.strftime("%H:%M:%S")) / (
-                                     60 * 60)  # hours of performance
-                    speed_performance = float(d["Avg.Speed km/h"])
-                    distance_performance = speed_performance * time_hours  # compute distance
+                race_results.append(d)
 
-                    d["Performance"] = time_performance.strftime("%H:%M:%S")
-                    race_distance_km = "{0:.2f}".format(distance_performance)
-                except:
-                    pass
+            times = parse_durations(
+                d.get("Performance") for d in race_results
+            )  # all performances at once
+            for d, seconds in zip(race_results, times):
+                if seconds is None:  # e.g km run in a 24h race
+                    continue
 
-                race_results.append(d)
+                try:  # compute distance
+                    speed_performance = float(d["Avg.Speed km/h"])
+                except (KeyError, ValueError):
+                    continue
+
+                distance_performance = speed_performance * seconds / (60 * 60)
+                d["Performance"] = format_duration(seconds)
+                race_distance_km = "{0:.2f}".format(distance_performance)
     except:
         pass
 
@@ -135,7 +138,21 @@ def get_runner_details(raw_html, url=None):
         List of runner details
     """
 
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
+    return parse_runner_details(
+        parse_html(str(raw_html), tables_only=True), url=url
+    )
+
+
+def parse_runner_details(soup, url=None):
+    """
+    :param soup: HTML tree
+        Tree of runner page
+    :param url: str
+        Url of this page
+    :return: {}
+        List of runner details
+    """
+
     rows = soup.find_all("table")[2].find_all("tr")  # rows of table
     details = {}  # output dictionary
 
@@ -192,22 +209,38 @@ def get_runner_results(raw_html, base_url="http://statistik.d-u-v.org/"):
     """
     :param raw_html: str
         Raw HTML page with table with races list
+    :param base_url: str
+        Root url of links
+    :return: [] of {}
+        List of runner results
+    """
+
+    return parse_runner_results(
+        parse_html(str(raw_html), tables_only=True), base_url=base_url
+    )
+
+
+def parse_runner_results(soup, base_url="http://statistik.d-u-v.org/"):
+    """
+    :param soup: HTML tree
+        Tree of runner page
+    :param base_url: str
+        Root url of links
     :return: [] of {}
         List of runner results
     """
 
-    soup = BeautifulSoup(str(raw_html), "lxml")  # HTML parser
     rows = soup.find_all("table")[4].find_all("tr")  # rows of table
-    rows = [r for r in rows if len(r.find_all("td")) > 2]  # discard jibberish
+    rows = [r.find_all("td") for r in rows]  # columns of each row
+    rows = [r for r in rows if len(r) > 2]  # discard jibberish
     if len(rows) % 2 != 0:  # rows should be even
         rows = rows[:-1]  # remove last item
-    rows = [BeautifulSoup(str(rows[i]) + str(rows[i + 1]), "lxml") for i in
+    rows = [rows[i] + rows[i + 1] for i in
             range(0, len(rows), 2)]  # merge following rows
     results = []
-    for r in rows:
+    for columns in rows:
         try:
             race_details = {}  # race details
-            columns = r.find_all("td")  # columns in table row
 
             try:
                 race_details["date"] = str(columns[0].text).strip()
@@ -279,9 +312,11 @@ def get_details_of_runner_in_page(raw_html, url=None):
         List of runner details, list of runner results
     """
 
-    details = get_runner_details(raw_html, url=url)
+    soup = parse_html(str(raw_html),
+                      tables_only=True)  # parsed once for both tables
+    details = parse_runner_details(soup, url=url)
     try:
-        results = get_runner_results(raw_html)
+        results = parse_runner_results(soup)
     except:
         results = []
 
@@ -17,9 +17,21 @@
 
 
 import pandas as pd
+from pymongo import ASCENDING, IndexModel
 
 VALUE_NOT_FOUND = str(
     "DNF")  # value to put when data cannot be found (or some errors occur)
+ATHLETES_COLLECTION = "athletes"  # single collection of all athletes
+RACES_COLLECTION = "races"  # single collection of all races
+ATHLETES_INDEXES = [
+    IndexModel([("url", ASCENDING)], unique=True),  # primary key
+    IndexModel([("birth_year", ASCENDING), ("nationality", ASCENDING),
+                ("name", ASCENDING)])
+]
+RACES_INDEXES = [
+    IndexModel([("url", ASCENDING)], unique=True),  # primary key
+    IndexModel([("date", ASCENDING), ("distance", ASCENDING)])
+]
 
 
 def append_to_file(f, s):
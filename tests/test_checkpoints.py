@@ -0,0 +1,105 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Checkpoints saved, loaded and resumed with other ranges of ids """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bots.core.checkpoints import Checkpoint, COMPLETED, EMPTY, FAILED
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "ids.checkpoint")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        checkpoint = Checkpoint(self.path, 100, 120)
+        checkpoint.mark(100, COMPLETED)
+        checkpoint.mark(107, EMPTY)
+        checkpoint.mark(108, FAILED)
+        checkpoint.mark(120, COMPLETED)
+        checkpoint.mark(108, COMPLETED)  # retried
+        checkpoint.mark(111, FAILED)
+        checkpoint.flush()
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+        loaded = Checkpoint(self.path, 100, 120)
+        self.assertTrue(loaded.load())
+        self.assertEqual((loaded.min_id, loaded.max_id), (100, 120))
+        for i in range(100, 121):
+            self.assertEqual(loaded.get_state(i), checkpoint.get_state(i))
+        self.assertEqual(loaded.count(COMPLETED), 3)
+        self.assertEqual(loaded.count(EMPTY), 1)
+        self.assertEqual(loaded.count(FAILED), 1)
+        self.assertIsNone(loaded.get_state(101))
+
+    def test_load_without_file(self):
+        checkpoint = Checkpoint(self.path, 0, 10)
+        self.assertFalse(checkpoint.load())
+        self.assertEqual(list(checkpoint.get_pending_ids()), list(range(11)))
+
+    def test_load_of_other_range_is_union(self):
+        checkpoint = Checkpoint(self.path, 100, 120)
+        checkpoint.mark(100, COMPLETED)
+        checkpoint.mark(115, EMPTY)
+        checkpoint.mark(120, FAILED)
+        checkpoint.flush()
+
+        resumed = Checkpoint(self.path, 110, 140)
+        self.assertTrue(resumed.load())
+        self.assertEqual((resumed.min_id, resumed.max_id), (100, 140))
+        self.assertEqual(resumed.get_state(100), COMPLETED)  # kept
+        self.assertEqual(resumed.get_state(115), EMPTY)
+        self.assertEqual(resumed.get_state(120), FAILED)
+        self.assertIsNone(resumed.get_state(140))
+        resumed.mark(140, COMPLETED)  # id of new range only
+        self.assertEqual(resumed.get_state(140), COMPLETED)
+
+        narrower = Checkpoint(self.path, 105, 110)
+        narrower.load()
+        self.assertEqual((narrower.min_id, narrower.max_id), (100, 120))
+        self.assertTrue(narrower.is_done(100))
+
+    def test_ids_out_of_range(self):
+        checkpoint = Checkpoint(self.path, 10, 20)
+        self.assertRaises(ValueError, checkpoint.get_state, 9)
+        self.assertRaises(ValueError, checkpoint.mark, 21, COMPLETED)
+
+    def test_pending_ids(self):
+        checkpoint = Checkpoint(self.path, 1, 20)
+        checkpoint.mark(1, COMPLETED)
+        checkpoint.mark(2, EMPTY)
+        checkpoint.mark(3, FAILED)  # retried
+        checkpoint.mark(8, COMPLETED)  # last bit of first byte
+        checkpoint.mark(9, COMPLETED)  # first bit of second byte
+        checkpoint.mark(20, EMPTY)
+        self.assertEqual(
+            list(checkpoint.get_pending_ids()),
+            [3, 4, 5, 6, 7] + list(range(10, 20))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Slots of adaptive limits handed to waiting requests """
+
+import asyncio
+import unittest
+
+from bots.core.concurrency import AdaptiveLimit
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_waiters_get_released_slots(self):
+        async def run():
+            limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+            started_at = await limit.acquire()
+            waiting = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            self.assertFalse(waiting.done())
+
+            limit.release(started_at, False, True)
+            await asyncio.wait_for(waiting, 1.0)
+            self.assertEqual(limit.in_flight, 1)
+
+        asyncio.run(run())
+
+    def test_cancelled_waiter_passes_slot_on(self):
+        async def run():
+            limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+            started_at = await limit.acquire()
+            first = asyncio.ensure_future(limit.acquire())
+            second = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+
+            limit.release(started_at, False, True)  # wakes up first
+            first.cancel()  # before it takes the slot
+            await asyncio.wait_for(second, 1.0)
+            self.assertTrue(first.cancelled())
+            self.assertEqual(limit.in_flight, 1)
+
+        asyncio.run(run())
+
+    def test_cancelled_waiter_leaves_queue(self):
+        async def run():
+            limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+            started_at = await limit.acquire()
+            waiting = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            self.assertEqual(len(limit.waiters), 0)
+
+            limit.release(started_at, False, True)
+            self.assertEqual(limit.in_flight, 0)
+            self.assertGreaterEqual(await limit.acquire(), started_at)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
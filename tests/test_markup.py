@@ -0,0 +1,63 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Same lookups give same tags with BeautifulSoup and lxml trees """
+
+import unittest
+
+from lxml import etree
+
+from bots.core import markup
+
+PAGE = """<html><body><table>
+<tr><td title="it's &quot;fast&quot;" class="x it's&quot;">A</td>
+<td title="it's">B</td><td title='say "hi"'>C</td>
+<td title="it">D</td><td class="x">E</td></tr>
+</table></body></html>"""
+
+
+class TestMarkup(unittest.TestCase):
+    def setUp(self):
+        self.backend = markup.BACKEND
+
+    def tearDown(self):
+        markup.set_backend(self.backend)
+
+    def find_texts(self, backend, tag, attrs):
+        markup.set_backend(backend)
+        return [t.text for t in markup.parse_html(PAGE).find_all(tag, attrs)]
+
+    def test_literals_with_quotes(self):
+        for value in ["it", "it's", "say \"hi\"", "it's \"fast\"", "'\"",
+                      "\"''"]:
+            literal = markup.get_literal(value)
+            self.assertEqual(etree.XPath("string(" + literal + ")")(
+                etree.Element("html")), value)
+
+    def test_backends_find_same_tags(self):
+        for attrs in [{"title": "it's \"fast\""}, {"title": "it's"},
+                      {"title": "say \"hi\""}, {"title": "it"},
+                      {"class": "it's\""}, {"class": "x"}]:
+            texts = self.find_texts("bs4", "td", attrs)
+            self.assertTrue(texts, attrs)
+            self.assertEqual(self.find_texts("lxml", "td", attrs), texts,
+                             attrs)
+
+
+if __name__ == "__main__":
+    unittest.main()
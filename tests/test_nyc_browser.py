@@ -0,0 +1,209 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" NYC archive scraped by bots driving a fake browser """
+
+import csv
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from selenium.common.exceptions import NoSuchElementException, \
+    StaleElementReferenceException
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "bots", "nyc_marathon"
+))  # as bot runs
+
+import fetch_details  # noqa: E402
+from models import NYCMarathonBot  # noqa: E402
+
+HEADERS = "<tr><td>First Name</td><td>Last Name</td><td>Sex/Age</td>" \
+          "<td>Country ofResidence</td><td>NetTime</td></tr>"
+
+
+class FakeElement(object):
+    """ Element of a page: stale once browser leaves page """
+
+    def __init__(self, browser, page_load):
+        object.__init__(self)
+
+        self.browser = browser
+        self.page_load = page_load
+
+    def is_enabled(self):
+        if self.browser.page_load != self.page_load:
+            raise StaleElementReferenceException("page left")
+        return True
+
+
+class FakeBrowser(object):
+    """ Pages of archive load some time after form is submitted or next
+    page is clicked, as in a real browser """
+
+    PAGES = 3  # pages of results in archive
+    ROWS = 2  # rows in each page
+
+    def __init__(self, load_seconds=0.05):
+        object.__init__(self)
+
+        self.load_seconds = load_seconds
+        self.page = None  # None for search form, else number of page
+        self.page_load = 0  # number of pages loaded so far
+        self.loaded = False
+        self.year = None
+        self.ages = []
+        self.quit_called = False
+
+    def load(self, page):
+        def finish():
+            self.page = page
+            self.page_load += 1
+            self.loaded = True
+
+        self.loaded = False
+        threading.Timer(self.load_seconds, finish).start()
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        self.load(None)
+
+    def find_element(self, by, value):
+        if not self.loaded:
+            raise NoSuchElementException(value)
+        if value == "table" and self.page is None:
+            raise NoSuchElementException(value)  # search form
+        return FakeElement(self, self.page_load)
+
+    def find_elements(self, by, value):
+        try:
+            return [self.find_element(by, value)]
+        except NoSuchElementException:
+            return []
+
+    def execute_script(self, script):
+        if "searchyear" in script:
+            self.year = script.split("\"")[-2]
+        elif "f.age" in script:
+            self.ages.append(script.split("\"")[-2])
+        elif "submit()" in script:
+            self.load(1)
+        elif "includes" in script:
+            return self.page < self.PAGES
+        elif "click()" in script:
+            self.load(self.page + 1)
+
+    @property
+    def page_source(self):
+        rows = "".join(
+            "<tr><td>Runner" + str(self.year) + "</td><td>Page" +
+            str(self.page) + "</td><td>M3" + str(i) + "</td><td>USA</td>"
+            "<td>US</td><td>2:5" + str(i) + ":00</td></tr>"
+            for i in range(self.ROWS)
+        )
+        return "<html><table>" + HEADERS + rows + "</table></html>"
+
+    def close(self):
+        pass
+
+    def stop_client(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeBot(NYCMarathonBot):
+    MAX_WAIT_SECONDS = 5
+    WAIT_POLL_SECONDS = 0.01
+
+    def __init__(self, headless=False, browser=None):
+        NYCMarathonBot.__init__(self, headless=headless,
+                                browser=browser or FakeBrowser())
+
+
+class TestNYCBrowser(unittest.TestCase):
+    def test_waits_for_each_page(self):
+        bot = FakeBot()
+        tables = list(bot.iter_data_tables_of_year(2016, 30, 39))
+        self.assertEqual(len(tables), FakeBrowser.PAGES)
+        for page, table in enumerate(tables, 1):
+            self.assertIn("Page" + str(page) + "<", table)  # new page
+            self.assertIn("Runner2016", table)
+        self.assertEqual(bot.browser.ages, ["30"])
+        self.assertTrue(bot.browser.quit_called)
+
+    def test_browser_kept_open(self):
+        bot = FakeBot()
+        tables = list(bot.iter_data_tables_of_year(2016, close_browser=False))
+        self.assertEqual(len(tables), FakeBrowser.PAGES)
+        self.assertFalse(bot.browser.quit_called)
+
+        tables = list(bot.iter_data_tables_of_year(2017, close_browser=False))
+        self.assertIn("Runner2017", tables[0])  # same browser, next year
+        bot.close()
+        self.assertTrue(bot.browser.quit_called)
+
+    def test_wait_ends_at_timeout(self):
+        bot = FakeBot()
+        bot.MAX_WAIT_SECONDS = 0.1
+        bot.browser.loaded = True
+        old_page = bot.get_page_root()  # never left: no new page comes
+        self.assertFalse(bot.wait_for_results_table(old_page))
+
+    def test_browsers_reused_across_years(self):
+        bots = []
+
+        def get_bot(headless=False):
+            bots.append(FakeBot(headless=headless))
+            return bots[-1]
+
+        out_path = tempfile.mkdtemp()
+        try:
+            with mock.patch.object(fetch_details, "NYCMarathonBot", get_bot):
+                fetch_details.download_years_results(
+                    [2015, 2016], out_path, browsers=2, age_step=50
+                )  # 4 jobs: 2 years x 2 age brackets
+
+            self.assertEqual(len(bots), 2)
+            self.assertTrue(all(b.browser.quit_called for b in bots))
+            self.assertEqual(
+                sorted(a for b in bots for a in b.browser.ages),
+                ["0", "0", "50", "50"]
+            )
+            files = sorted(glob.glob(os.path.join(out_path, "*.csv")))
+            self.assertEqual(len(files), 4)
+            for f in files:
+                with open(f) as i:
+                    rows = list(csv.DictReader(i))
+                self.assertEqual(len(rows),
+                                 FakeBrowser.PAGES * FakeBrowser.ROWS)
+        finally:
+            shutil.rmtree(out_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Requests spread across proxies; Tor circuits renewed through a local
+fake controller """
+
+import asyncio
+import random
+import unittest
+from unittest import mock
+
+from bots.core.proxies import ProxyPool, get_proxy
+
+PROXIES = ["socks5://127.0.0.1:" + str(port) for port in range(9050, 9058, 2)]
+
+
+class FakeTorController(object):
+    """ Answers Tor control commands as Tor does (only the ones we send) """
+
+    def __init__(self, password):
+        object.__init__(self)
+
+        self.password = password
+        self.commands = []
+        self.server = None
+        self.port = None
+
+    async def handle(self, reader, writer):
+        authenticated = False
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            command = line.decode().strip()
+            self.commands.append(command)
+            if command.startswith("AUTHENTICATE"):
+                authenticated = command == \
+                    "AUTHENTICATE \"" + self.password + "\""
+                writer.write(b"250 OK\r\n" if authenticated else
+                             b"515 Authentication failed\r\n")
+            elif command == "SIGNAL NEWNYM":
+                writer.write(b"250 OK\r\n" if authenticated else
+                             b"514 Authentication required\r\n")
+            elif command == "QUIT":
+                writer.write(b"250 closing connection\r\n")
+                break
+        await writer.drain()
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class TestProxies(unittest.TestCase):
+    def test_control_port_in_spec(self):
+        proxy = get_proxy("socks5://127.0.0.1:9050#9051", "secret")
+        self.assertEqual(proxy.url, "socks5://127.0.0.1:9050")
+        self.assertEqual(proxy.control_port, 9051)
+        self.assertEqual(proxy.control_password, "secret")
+
+        proxy = get_proxy("socks5://127.0.0.1:9050")
+        self.assertEqual(proxy.url, "socks5://127.0.0.1:9050")
+        self.assertIsNone(proxy.control_port)
+
+    def test_benched_proxy_renews_circuit(self):
+        async def run():
+            controller = FakeTorController("secret")
+            await controller.start()
+            try:
+                pool = ProxyPool(
+                    [get_proxy("socks5://127.0.0.1:1#" + str(controller.port),
+                               "secret")],
+                    max_failures=2
+                )
+                proxy = pool.choose()
+                for _ in range(2):
+                    pool.on_start(proxy)
+                    pool.on_failure(proxy)  # benched at 2nd failure
+                self.assertGreater(proxy.benched_until, 0.0)
+                for _ in range(100):  # renewal runs in background
+                    if "QUIT" in controller.commands:
+                        break
+                    await asyncio.sleep(0.01)
+                return controller.commands
+            finally:
+                await controller.stop()
+
+        commands = asyncio.run(run())
+        self.assertEqual(commands, [
+            "AUTHENTICATE \"secret\"", "SIGNAL NEWNYM", "QUIT"
+        ])
+
+    def test_wrong_password_does_not_renew(self):
+        async def run():
+            controller = FakeTorController("secret")
+            await controller.start()
+            try:
+                proxy = get_proxy(
+                    "socks5://127.0.0.1:1#" + str(controller.port), "wrong"
+                )
+                return await ProxyPool.renew_circuit(proxy)
+            finally:
+                await controller.stop()
+
+        self.assertFalse(asyncio.run(run()))
+
+    def test_requests_spread_across_proxies(self):
+        random.seed(0)
+        pool = ProxyPool(PROXIES)
+        for _ in range(400):  # none finishes: least loaded ones are chosen
+            pool.on_start(pool.choose())
+        loads = [p.in_flight for p in pool.proxies]
+        self.assertEqual(sum(loads), 400)
+        self.assertLessEqual(max(loads) - min(loads), 4)
+
+    def test_slow_proxy_gets_fewer_requests(self):
+        random.seed(0)
+        pool = ProxyPool(PROXIES, max_latency=10.0)
+        for proxy in pool.proxies:
+            pool.on_start(proxy)
+            pool.on_success(proxy, 5.0 if proxy is pool.proxies[0] else 0.1)
+
+        chosen = []
+        for _ in range(300):
+            proxy = pool.choose()
+            chosen.append(proxy)
+            pool.on_start(proxy)
+            pool.on_success(proxy, 0.1)
+        self.assertLess(chosen.count(pool.proxies[0]), 10)
+        for proxy in pool.proxies[1:]:
+            self.assertGreater(chosen.count(proxy), 50)
+
+    def test_benched_proxy_skipped_until_back(self):
+        random.seed(0)
+        pool = ProxyPool(PROXIES, max_failures=2, bench_seconds=60.0)
+        now = 1000.0
+        with mock.patch("bots.core.proxies.time.time", return_value=now):
+            failing = pool.proxies[1]
+            for _ in range(2):
+                pool.on_start(failing)
+                pool.on_failure(failing)
+            self.assertEqual(failing.benched_until, now + 60.0)
+            self.assertEqual(failing.in_flight, 0)
+
+            for _ in range(200):
+                self.assertIsNot(pool.choose(), failing)
+
+        with mock.patch("bots.core.proxies.time.time",
+                        return_value=now + 59.0):
+            self.assertNotIn(failing, [pool.choose() for _ in range(200)])
+
+        with mock.patch("bots.core.proxies.time.time",
+                        return_value=now + 60.0):
+            self.assertIn(failing, [pool.choose() for _ in range(200)])
+
+    def test_all_benched_uses_first_back(self):
+        pool = ProxyPool(PROXIES[:2], max_failures=1)
+        with mock.patch("bots.core.proxies.time.time", return_value=1000.0):
+            pool.on_start(pool.proxies[1])
+            pool.on_failure(pool.proxies[1])
+        with mock.patch("bots.core.proxies.time.time", return_value=1001.0):
+            pool.on_start(pool.proxies[0])
+            pool.on_failure(pool.proxies[0])
+            self.assertIs(pool.choose(), pool.proxies[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,201 @@
+# !/usr/bin/python3
+# coding: utf-8
+
+# Copyright 2017 Stefano Fogarollo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+""" Outcomes of documents written by Mongo sinks to fake collections """
+
+import asyncio
+import unittest
+
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
+
+from bots.core.sinks import AsyncMongoSink, MongoSink, get_outcomes, \
+    get_written_outcomes, DUPLICATE, INSERTED, REJECTED, REPLACED
+
+INDEXES = [IndexModel([("url", ASCENDING)], unique=True)]
+
+
+def get_details(upserted=None, errors=None):
+    """
+    :param upserted: [] of int
+        Indexes of documents inserted by upserts
+    :param errors: [] of (int, int)
+        Index of document and code of its error
+    :return: {}
+        Result of unordered bulk write, as MongoDB gives it
+    """
+
+    upserted = upserted or []
+    errors = errors or []
+    return {
+        "nInserted": 0,
+        "nUpserted": len(upserted),
+        "nMatched": 0,
+        "nModified": 0,
+        "nRemoved": 0,
+        "upserted": [{"index": i, "_id": i} for i in upserted],
+        "writeErrors": [
+            {"index": i, "code": code, "errmsg": "error " + str(code)}
+            for i, code in errors
+        ],
+        "writeConcernErrors": []
+    }
+
+
+class FakeCollection(object):
+    """ Records calls; write errors (or upserts) are set by tests """
+
+    def __init__(self, name, calls, details=None):
+        object.__init__(self)
+
+        self.name = name
+        self.calls = calls  # shared by all collections, in order
+        self.details = details
+
+    def create_indexes(self, indexes):
+        self.calls.append(("create_indexes", self.name, len(indexes)))
+
+    def insert_many(self, docs, ordered=True):
+        self.calls.append(("insert_many", self.name, len(docs)))
+        if self.details is not None and self.details["writeErrors"]:
+            raise BulkWriteError(self.details)
+
+    def bulk_write(self, requests, ordered=True):
+        assert all(isinstance(r, ReplaceOne) for r in requests)
+        self.calls.append(("bulk_write", self.name, len(requests)))
+        if self.details["writeErrors"]:
+            raise BulkWriteError(self.details)
+        return BulkWriteResult(self.details, True)
+
+
+class FakeAsyncCollection(FakeCollection):
+    """ FakeCollection with coroutines, as motor collections have """
+
+    async def create_indexes(self, indexes):
+        await asyncio.sleep(0)
+        FakeCollection.create_indexes(self, indexes)
+
+    async def insert_many(self, docs, ordered=True):
+        await asyncio.sleep(0)
+        FakeCollection.insert_many(self, docs, ordered=ordered)
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(0)
+        return FakeCollection.bulk_write(self, requests, ordered=ordered)
+
+
+class FakeDatabase(object):
+    def __init__(self, details=None, collection_class=FakeCollection):
+        object.__init__(self)
+
+        self.details = details
+        self.collection_class = collection_class
+        self.calls = []
+
+    def __getitem__(self, name):
+        return self.collection_class(name, self.calls, self.details)
+
+
+class TestSinks(unittest.TestCase):
+    def test_outcomes_of_errors(self):
+        error = BulkWriteError(get_details(errors=[(1, 11000), (3, 121)]))
+        self.assertEqual(
+            get_outcomes(error, 4, "races"),
+            [INSERTED, DUPLICATE, INSERTED, REJECTED]
+        )
+
+    def test_outcomes_of_upserts(self):
+        self.assertEqual(get_written_outcomes(3), [INSERTED] * 3)
+        self.assertEqual(
+            get_written_outcomes(4, {0: "a", 2: "b"}),
+            [INSERTED, REPLACED, INSERTED, REPLACED]
+        )  # pymongo gives index -> id of upserted documents
+        self.assertEqual(get_written_outcomes(2, []), [REPLACED] * 2)
+
+        error = BulkWriteError(get_details(upserted=[2], errors=[(0, 2)]))
+        self.assertEqual(
+            get_outcomes(error, 3, "races", upsert=True),
+            [REJECTED, REPLACED, INSERTED]
+        )
+
+    def test_sink_counts_outcomes(self):
+        db = FakeDatabase(get_details(errors=[(0, 11000), (2, 121)]))
+        written = []
+        sink = MongoSink(db, batch_size=3, on_written=lambda d, o:
+                         written.append((d["url"], o)))
+        for i in range(3):
+            sink.put({"url": i}, "athletes")
+        self.assertEqual(written, [
+            (0, DUPLICATE), (1, INSERTED), (2, REJECTED)
+        ])
+        self.assertEqual(sink.stats[INSERTED], 1)
+        self.assertEqual(sink.stats["batches"], 1)
+
+    def test_sink_counts_upserts(self):
+        db = FakeDatabase(get_details(upserted=[1]))
+        sink = MongoSink(db, upsert_key="url")
+        sink.put({"url": "a"}, "athletes")
+        sink.put({"url": "b"}, "athletes")
+        sink.flush()
+        self.assertEqual(sink.stats[INSERTED], 1)
+        self.assertEqual(sink.stats[REPLACED], 1)
+        self.assertEqual(db.calls, [("bulk_write", "athletes", 2)])
+
+    def test_indexes_before_first_write(self):
+        db = FakeDatabase()
+        sink = MongoSink(db, batch_size=2, indexes=INDEXES)
+        for i in range(4):
+            sink.put({"url": i}, "athletes")
+        sink.put({"url": 0}, "races")
+        sink.flush()
+        self.assertEqual(db.calls, [
+            ("create_indexes", "athletes", 1),
+            ("insert_many", "athletes", 2),
+            ("insert_many", "athletes", 2),  # indexes created once
+            ("create_indexes", "races", 1),
+            ("insert_many", "races", 1)
+        ])
+
+    def test_async_sink(self):
+        db = FakeDatabase(get_details(upserted=[0]),
+                          collection_class=FakeAsyncCollection)
+        written = []
+
+        async def run():
+            sink = AsyncMongoSink(
+                db, batch_size=2, upsert_key="url", indexes=INDEXES,
+                on_written=lambda d, o: written.append((d["url"], o))
+            )
+            for i in range(4):
+                await sink.put({"url": i}, "stages")
+            await sink.flush()
+
+        asyncio.run(run())
+        self.assertEqual(db.calls, [
+            ("create_indexes", "stages", 1),
+            ("bulk_write", "stages", 2),
+            ("bulk_write", "stages", 2)
+        ])
+        self.assertEqual(sorted(written), [
+            (0, INSERTED), (1, REPLACED), (2, INSERTED), (3, REPLACED)
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()